@@ -1,8 +1,19 @@
-from PySide6.QtWidgets import QDialog
+from PySide6.QtWidgets import QDialog, QComboBox
 from PySide6.QtCore import QDate
 from .ui.add_transaction_dialog_ui import Ui_AddTransactionDialog
 from .database import database as db
 
+# Choices of the "Powtarzaj" field: label and recurring rule frequency
+REPEAT_CHOICES = (
+    ("Nie", None),
+    ("Co miesiąc", 'monthly'),
+    ("Co tydzień", 'weekly'),
+    ("W ostatni dzień roboczy miesiąca", 'last_business_day'),
+)
+
+# Currencies offered besides the main one; any other code can be typed in
+CURRENCIES = ('PLN', 'EUR', 'USD', 'GBP', 'CHF', 'CZK', 'SEK', 'NOK', 'DKK')
+
 class AddTransactionDialog(QDialog, Ui_AddTransactionDialog):
     def __init__(self, parent=None, transaction_data=None):
         super().__init__(parent)
@@ -10,41 +21,46 @@ class AddTransactionDialog(QDialog, Ui_AddTransactionDialog):
 
         self.load_categories()
 
+        self.main_currency = db.get_main_currency()
+        self.currency_combobox = QComboBox(self)
+        self.currency_combobox.setEditable(True)
+        self.currency_combobox.addItems(list(dict.fromkeys((self.main_currency, *CURRENCIES))))
+        self.formLayout.insertRow(3, "Waluta:", self.currency_combobox)
+
+        # A new transaction can start a recurring rule; editing changes only the one transaction
+        self.repeat_combobox = None
+        if not transaction_data:
+            self.repeat_combobox = QComboBox(self)
+            for label, frequency in REPEAT_CHOICES:
+                self.repeat_combobox.addItem(label, frequency)
+            # Recurring rules post in the main currency
+            self.repeat_combobox.currentIndexChanged.connect(self.on_repeat_changed)
+            self.formLayout.insertRow(5, "Powtarzaj:", self.repeat_combobox)
+
         if transaction_data:
             self.date_edit.setDate(QDate.fromString(transaction_data['date'], "yyyy-MM-dd"))
             self.description_edit.setText(transaction_data['description'])
-            self.amount_spinbox.setValue(transaction_data['amount'])
-            self.category_combobox.setCurrentText(transaction_data['category'])
+            self.amount_spinbox.setValue(float(transaction_data['amount']))
+            self.currency_combobox.setCurrentText(transaction_data.get('currency') or self.main_currency)
+            category_index = self.category_combobox.findData(transaction_data['category_id'])
+            if category_index >= 0:
+                self.category_combobox.setCurrentIndex(category_index)
 
     def load_categories(self):
         """Loads categories from the database and populates the combobox with hierarchy."""
         self.category_combobox.clear()
-        
-        categories = db.get_all_categories()
-        categories_by_parent = {None: []}
-        has_children = set()
-
-        for cat in categories:
-            parent_id = cat['parent_id']
-            if parent_id is not None:
-                has_children.add(parent_id)
-            if parent_id not in categories_by_parent:
-                categories_by_parent[parent_id] = []
-            categories_by_parent[parent_id].append(cat)
-
-        def add_items_recursively(parent_id, indent_level=0):
-            if parent_id in categories_by_parent:
-                for cat in sorted(categories_by_parent[parent_id], key=lambda x: x['name']):
-                    item_text = "  " * indent_level + cat['name']
-                    self.category_combobox.addItem(item_text)
-                    if cat['id'] in has_children:
-                        # Disable parent categories
-                        item_index = self.category_combobox.findText(item_text)
-                        self.category_combobox.model().item(item_index).setEnabled(False)
-                    
-                    add_items_recursively(cat['id'], indent_level + 1)
-
-        add_items_recursively(None)
+        model = self.category_combobox.model()
+        for category_id, name, depth, has_children in db.get_category_tree().display_order:
+            self.category_combobox.addItem("  " * depth + name, category_id)
+            if has_children:
+                # Disable parent categories
+                model.item(self.category_combobox.count() - 1).setEnabled(False)
+
+    def on_repeat_changed(self, index):
+        repeats = self.repeat_combobox.currentData() is not None
+        if repeats:
+            self.currency_combobox.setCurrentText(self.main_currency)
+        self.currency_combobox.setEnabled(not repeats)
 
     def get_transaction_data(self):
         """Returns the data entered by the user in a dictionary."""
@@ -52,5 +68,8 @@ class AddTransactionDialog(QDialog, Ui_AddTransactionDialog):
             "date": self.date_edit.date().toString("yyyy-MM-dd"),
             "description": self.description_edit.text(),
             "amount": self.amount_spinbox.value(),
-            "category": self.category_combobox.currentText().strip()
-        }
\ No newline at end of file
+            "currency": self.currency_combobox.currentText().strip().upper() or self.main_currency,
+            "category_id": self.category_combobox.currentData(),
+            "category": self.category_combobox.currentText().strip(),
+            "frequency": self.repeat_combobox.currentData() if self.repeat_combobox else None
+        }
@@ -0,0 +1,269 @@
+"""Spending trends, rolling averages and month-end forecasts computed with NumPy.
+
+The input is the expense per day and category, loaded into three arrays
+from the daily_totals rollup (or aggregated from a columnar export): a
+ledger of any length is at most a few hundred thousand such rows, so
+loading takes milliseconds however many transactions it holds. Every
+computation then works on whole arrays:
+
+- time_series() sums the days into months or weeks (starting on Monday)
+  per category group with one bincount, filling periods without spending
+  with zeros;
+- rolling_mean() and year_over_year() shift and difference those rows;
+- month_forecast() projects the spending of the current month to its end
+  from how the previous months continued past the same day, scaled by how
+  the same calendar month compared with its year in earlier years.
+
+Amounts are integer cents in the inputs; averages and forecasts are
+floats of cents.
+"""
+from itertools import chain
+import numpy as np
+from app.database import database as db
+from app.instrumentation import timed
+
+PERIODS = ('month', 'week')
+
+# Periods a year apart
+PERIODS_PER_YEAR = {'month': 12, 'week': 52}
+
+# Complete months the forecast learns the course of a month from
+FORECAST_HISTORY_MONTHS = 12
+
+# Earlier years compared for the seasonal factor of the forecast
+SEASONAL_YEARS = 3
+
+# 1970-01-01, day 0, was a Thursday; weeks start on Monday
+_WEEK_OFFSET = 3
+
+
+class DailyTotals:
+    """Expenses per day and category as parallel arrays.
+
+    `days` counts days from 1970-01-01 (int32), `category_ids` are 0 for
+    uncategorized (int32) and `cents` holds the totals (int64).
+    """
+
+    def __init__(self, days, category_ids, cents):
+        self.days = days
+        self.category_ids = category_ids
+        self.cents = cents
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds the arrays from (day, category_id, cents) rows."""
+        values = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=3 * len(rows)).reshape(-1, 3)
+        return cls(values[:, 0].astype(np.int32), values[:, 1].astype(np.int32), values[:, 2])
+
+    @classmethod
+    def from_columnar(cls, path):
+        """Sums the transactions of a columnar export (app.exporter) per day and category."""
+        from app.exporter import ColumnarFile
+        columns = ColumnarFile(path).columns(('date', 'category_id', 'amount'))
+        days = np.frombuffer(columns['date'], dtype=np.int32)
+        category_ids = np.frombuffer(columns['category_id'], dtype=np.int32)
+        cents = np.frombuffer(columns['amount'], dtype=np.int64)
+        if not len(days):
+            return cls(days, category_ids, cents)
+        # One sort of a combined key, then a sum per distinct key
+        keys = days.astype(np.int64) << 32 | category_ids.astype(np.int64)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.rint(np.bincount(inverse, weights=cents, minlength=len(keys))).astype(np.int64)
+        return cls((keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32), sums)
+
+
+@timed
+def load_daily_totals(text_filter=None, categories=None, date_range=None):
+    """Loads the expenses per day and category matching the filters of the transaction list."""
+    return DailyTotals.from_rows(db.get_daily_totals(text_filter, categories, date_range))
+
+
+def day_number(day):
+    """Returns the day number of a datetime.date."""
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+
+def period_numbers(days, period):
+    """Maps day numbers to month numbers (from 1970-01) or Monday-based week numbers."""
+    days = np.asarray(days)
+    if period == 'month':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    if period == 'week':
+        return (days.astype(np.int64) + _WEEK_OFFSET) // 7
+    raise ValueError(f"Unknown period: {period}")
+
+
+def period_starts(numbers, period):
+    """Returns the first day of each month or week number as datetime64[D]."""
+    numbers = np.asarray(numbers, dtype=np.int64)
+    if period == 'month':
+        return numbers.astype('datetime64[M]').astype('datetime64[D]')
+    return (numbers * 7 - _WEEK_OFFSET).astype('datetime64[D]')
+
+
+class Series:
+    """Totals per period of one or more groups.
+
+    `starts` holds the first day of every period (datetime64[D]),
+    `names` the group names and `values` a (groups, periods) int64 array
+    of cents.
+    """
+
+    def __init__(self, period, starts, names, values):
+        self.period = period
+        self.starts = starts
+        self.names = names
+        self.values = values
+
+    def total(self):
+        """Returns the sum over all groups per period."""
+        return self.values.sum(axis=0)
+
+
+@timed
+def time_series(totals, period='month', groups=None, other=None, first=None, last=None):
+    """Sums daily totals per period and group, from period number `first` to `last` inclusive.
+
+    `groups` maps category ids to group names, like CategoryTree.groups();
+    categories missing from it, uncategorized expenses included, are
+    summed under `other`, or left out when it is None. Without `groups` a
+    single 'Total' group is returned. The bounds default to the first and
+    last period with expenses.
+    """
+    numbers = period_numbers(totals.days, period)
+    if first is None:
+        first = int(numbers.min()) if len(numbers) else 0
+    if last is None:
+        last = int(numbers.max()) if len(numbers) else first - 1
+    count = max(last - first + 1, 0)
+
+    if groups is None:
+        names = ['Total']
+        group_index = np.zeros(len(totals), dtype=np.int64)
+    else:
+        names = list(dict.fromkeys(groups.values()))
+        if other is not None and other not in names:
+            names.append(other)
+        position = {name: index for index, name in enumerate(names)}
+        lookup = np.full(int(totals.category_ids.max(initial=0)) + 1,
+                         -1 if other is None else position[other], dtype=np.int64)
+        for category_id, name in groups.items():
+            if category_id < len(lookup):
+                lookup[category_id] = position[name]
+        group_index = lookup[totals.category_ids]
+
+    selected = (group_index >= 0) & (numbers >= first) & (numbers <= last)
+    cells = group_index[selected] * count + (numbers[selected] - first)
+    # float64 weights add integer cents exactly up to 2**53
+    sums = np.bincount(cells, weights=totals.cents[selected], minlength=len(names) * count)
+    values = np.rint(sums).astype(np.int64).reshape(len(names), count)
+    return Series(period, period_starts(np.arange(first, first + count), period), names, values)
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` periods along the last axis; NaN until a full window."""
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.cumsum(values, axis=-1)
+    means = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        sums[..., window:] = sums[..., window:] - sums[..., :-window]
+        means[..., window - 1:] = sums[..., window - 1:] / window
+    return means
+
+
+def year_over_year(values, period):
+    """Returns the values a year earlier and the relative change against them.
+
+    Both are NaN where the series does not reach a year back, the change
+    also where the earlier value is zero.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    lag = PERIODS_PER_YEAR[period]
+    previous = np.full(values.shape, np.nan)
+    if values.shape[-1] > lag:
+        previous[..., lag:] = values[..., :-lag]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous > 0, values / previous - 1, np.nan)
+    return previous, change
+
+
+class MonthForecast:
+    """Forecast of the spending of the month containing `today`.
+
+    `days` are the dates of the month (datetime64[D]); `actual` is the
+    cumulative spending up to today and NaN afterwards, `projected` the
+    expected cumulative spending from today to the end of the month and
+    NaN before. `spent` and `total` are the cents spent so far and
+    expected by the end of the month.
+    """
+
+    def __init__(self, days, actual, projected, spent, total):
+        self.days = days
+        self.actual = actual
+        self.projected = projected
+        self.spent = spent
+        self.total = total
+
+
+@timed
+def month_forecast(totals, today, history_months=FORECAST_HISTORY_MONTHS, seasonal_years=SEASONAL_YEARS):
+    """Forecasts the month-end spending of the month of `today` (a datetime.date).
+
+    The spending still to come is the average of what the last
+    `history_months` complete months spent after the same day of the
+    month, multiplied by the seasonal factor of the month: the average
+    ratio of the same calendar month to its year's monthly mean over the
+    last `seasonal_years` years, 1 without history.
+    """
+    today_number = day_number(today)
+    month = int(period_numbers(today_number, 'month'))
+    month_start = int(period_starts(month, 'month').astype(np.int64))
+    month_length = int(period_starts(month + 1, 'month').astype(np.int64)) - month_start
+    elapsed = today_number - month_start + 1
+
+    months = period_numbers(totals.days, 'month')
+    day_of_month = totals.days - period_starts(months, 'month').astype(np.int64)
+
+    current = months == month
+    daily = np.bincount(day_of_month[current], weights=totals.cents[current], minlength=31)[:month_length]
+    spent = float(daily[:elapsed].sum())
+
+    # Spending per day of the month in each of the previous complete months
+    history = (months >= month - history_months) & (months < month)
+    cells = (months[history] - (month - history_months)) * 31 + day_of_month[history]
+    profile = np.bincount(cells, weights=totals.cents[history], minlength=history_months * 31)
+    profile = profile.reshape(history_months, 31)
+    # Only months that have any expenses count, so a short ledger is not averaged with zeros
+    active = profile.sum(axis=1) > 0
+    if active.any():
+        # Days a shorter month does not have go to its last day
+        per_day = profile[active].mean(axis=0)
+        per_day[month_length - 1] += per_day[month_length:].sum()
+        per_day = per_day[:month_length]
+    else:
+        per_day = np.zeros(month_length)
+    remaining = per_day[elapsed:] * _seasonal_factor(totals.cents, months, month, seasonal_years)
+
+    actual = np.full(month_length, np.nan)
+    actual[:elapsed] = np.cumsum(daily[:elapsed])
+    projected = np.full(month_length, np.nan)
+    projected[elapsed - 1:] = spent + np.concatenate(([0.0], np.cumsum(remaining)))
+    days = np.arange(month_start, month_start + month_length).astype('datetime64[D]')
+    return MonthForecast(days, actual, projected, spent, spent + float(remaining.sum()))
+
+
+def _seasonal_factor(cents, months, month, years):
+    # Monthly totals of `years` 12-month years, each ending with the same
+    # calendar month as `month`, the last one a year before it
+    first = month - 12 * years - 11
+    selected = (months >= first) & (months < first + 12 * years)
+    monthly = np.bincount(months[selected] - first, weights=cents[selected], minlength=12 * years)
+    monthly = monthly.reshape(years, 12)
+    means = monthly.mean(axis=1)
+    usable = (means > 0) & (monthly[:, -1] > 0)
+    if not usable.any():
+        return 1.0
+    return float((monthly[usable, -1] / means[usable]).mean())
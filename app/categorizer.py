@@ -0,0 +1,243 @@
+"""Automatic categorization of transactions with the categorization_rules table.
+
+All rules are compiled into one RuleEngine, so a transaction is matched
+against every rule at once instead of rule by rule:
+
+- keywords go into an Aho-Corasick automaton that finds every keyword in
+  a description in a single pass over its characters,
+- each regular expression contributes the literal text any match of it
+  must contain to the same automaton, and only the regexes whose literal
+  was found in that pass are run, best rule first,
+- amount ranges are cut into disjoint intervals, each knowing its best
+  rule, and looked up with a binary search.
+
+Of all matching rules the one with the highest priority wins, the oldest
+on ties. Descriptions repeat a lot in a ledger, so text matches are
+cached per description.
+"""
+import re
+from bisect import bisect_right
+from collections import deque
+from itertools import chain
+from operator import itemgetter
+from app.database import database as db
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+MATCH_TYPES = ('keyword', 'regex', 'amount')
+
+# Number of distinct descriptions whose text match is remembered
+CACHE_SIZE = 100000
+
+# Rank used when no rule matches; lower ranks win
+_NO_MATCH = float('inf')
+
+
+def required_literal(pattern):
+    """Returns the longest literal text every match of a regex contains, or ''.
+
+    Only literals at the top level of the pattern are considered, so the
+    result is a safe prefilter: a text without it cannot match.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except (re.error, RecursionError):
+        return ''
+    best = run = ''
+    for op, value in parsed:
+        char = chr(value) if op is sre_parse.LITERAL else None
+        # Characters whose case folding changes their length cannot be looked up folded
+        if char is not None and len(char.casefold()) == 1:
+            run += char.casefold()
+            if len(run) > len(best):
+                best = run
+        else:
+            run = ''
+    return best
+
+
+class _Automaton:
+    """Aho-Corasick automaton over keywords and regex literals.
+
+    scan() returns the best rank among the keywords found in a text and
+    the set of regex literals found.
+    """
+
+    def __init__(self, keywords, literals):
+        # Trie of the keywords and literals; best[state] is the best keyword
+        # rank ending at the state, found[state] the literals ending there
+        goto = [{}]
+        best = [_NO_MATCH]
+        found = [frozenset()]
+
+        def add(text):
+            state = 0
+            for char in text:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    best.append(_NO_MATCH)
+                    found.append(frozenset())
+                state = next_state
+            return state
+
+        for keyword, rank in keywords:
+            state = add(keyword)
+            best[state] = min(best[state], rank)
+        for literal in literals:
+            state = add(literal)
+            found[state] |= {literal}
+
+        # Breadth-first pass turning the trie into a full transition table:
+        # a state inherits the transitions and matches of its failure state
+        self._delta = [None] * len(goto)
+        self._delta[0] = dict(goto[0])
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = self._delta[fail[state]]
+            best[state] = min(best[state], best[fail[state]])
+            found[state] |= found[fail[state]]
+            for char, next_state in goto[state].items():
+                fail[next_state] = fallback.get(char, 0) if state else 0
+                queue.append(next_state)
+            self._delta[state] = {**fallback, **goto[state]}
+        self._best = best
+        self._found = [literals or None for literals in found]
+
+    def scan(self, text):
+        delta = self._delta
+        best = self._best
+        found = self._found
+        state = 0
+        rank = _NO_MATCH
+        literals = None
+        for char in text:
+            state = delta[state].get(char, 0)
+            if best[state] < rank:
+                rank = best[state]
+            if found[state] is not None:
+                literals = found[state] if literals is None else literals | found[state]
+        return rank, literals
+
+
+class RuleEngine:
+    """All categorization rules compiled into a single matcher."""
+
+    def __init__(self, rules):
+        # Rank 0 is the best rule: highest priority, then lowest id
+        ranked = sorted(rules, key=lambda rule: (-rule['priority'], rule['id']))
+        self._categories = [rule['category_id'] for rule in ranked]
+        self._cache = {}
+
+        keywords = []
+        amounts = []
+        # (rank, compiled regex) pairs in rank order, per required literal and
+        # for the regexes without one, which are always tried
+        self._regexes_by_literal = {}
+        self._unfiltered_regexes = []
+        for rank, rule in enumerate(ranked):
+            if rule['match_type'] == 'keyword' and rule['pattern']:
+                keywords.append((rule['pattern'].casefold(), rank))
+            elif rule['match_type'] == 'regex' and rule['pattern']:
+                compiled = re.compile(rule['pattern'], re.IGNORECASE)
+                literal = required_literal(rule['pattern'])
+                if literal:
+                    self._regexes_by_literal.setdefault(literal, []).append((rank, compiled))
+                else:
+                    self._unfiltered_regexes.append((rank, compiled))
+            elif rule['match_type'] == 'amount':
+                amounts.append((rule['min_amount'], rule['max_amount'], rank))
+
+        if keywords or self._regexes_by_literal:
+            self._automaton = _Automaton(keywords, self._regexes_by_literal)
+        else:
+            self._automaton = None
+        self._compile_amounts(amounts)
+
+    @classmethod
+    def from_database(cls):
+        return cls(db.get_categorization_rules())
+
+    def __bool__(self):
+        return bool(self._categories)
+
+    def _compile_amounts(self, amounts):
+        """Cuts the amount ranges into disjoint intervals with the best rank of each."""
+        bounds = sorted({low for low, _high, _rank in amounts if low is not None}
+                        | {high + 1 for _low, high, _rank in amounts if high is not None})
+        # Interval 0 lies below bounds[0], interval i starts at bounds[i - 1];
+        # every rule covers either all or none of an interval
+        starts = [bounds[0] - 1 if bounds else 0] + bounds
+        self._amount_bounds = bounds
+        self._amount_ranks = [
+            min((rank for low, high, rank in amounts
+                 if (low is None or low <= start) and (high is None or start <= high)), default=_NO_MATCH)
+            for start in starts
+        ] if amounts else []
+
+    def _text_rank(self, description):
+        rank = self._cache.get(description)
+        if rank is not None:
+            return rank
+        rank, literals = _NO_MATCH, None
+        if self._automaton is not None:
+            rank, literals = self._automaton.scan(description.casefold())
+        regexes = self._unfiltered_regexes
+        if literals is not None:
+            regexes = sorted(chain(regexes, *(self._regexes_by_literal[literal] for literal in literals)),
+                             key=itemgetter(0))
+        for regex_rank, compiled in regexes:
+            if regex_rank >= rank:
+                break
+            if compiled.search(description):
+                rank = regex_rank
+                break
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[description] = rank
+        return rank
+
+    def _amount_rank(self, cents):
+        if not self._amount_ranks:
+            return _NO_MATCH
+        return self._amount_ranks[bisect_right(self._amount_bounds, cents)]
+
+    def categorize(self, description, cents):
+        """Returns the category id of the best rule matching a transaction, or None."""
+        rank = min(self._text_rank(description), self._amount_rank(cents))
+        return None if rank == _NO_MATCH else self._categories[rank]
+
+    def categorize_many(self, transactions):
+        """Returns the category ids (or None) for a list of (description, cents) pairs."""
+        text_rank, amount_rank, categories = self._text_rank, self._amount_rank, self._categories
+        ranks = (min(text_rank(description), amount_rank(cents)) for description, cents in transactions)
+        return [None if rank == _NO_MATCH else categories[rank] for rank in ranks]
+
+
+def apply_rules(include_categorized=False, engine=None):
+    """Runs the rules over the ledger and returns the number of transactions changed.
+
+    Only uncategorized transactions are considered unless
+    `include_categorized`, in which case every transaction matching a rule
+    gets the rule's category. Transactions no rule matches are left as
+    they are.
+    """
+    if engine is None:
+        engine = RuleEngine.from_database()
+    if not engine:
+        return 0
+    changes = []
+    for row in db.iter_for_categorization(include_categorized):
+        category_id = engine.categorize(row['description'], row['amount'])
+        if category_id is not None and category_id != row['category_id']:
+            changes.append((category_id, row['id']))
+    if not changes:
+        return 0
+    return db.set_transaction_categories(changes)
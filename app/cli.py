@@ -0,0 +1,486 @@
+"""Command-line interface to the database, without the Qt user interface.
+
+    python -m app.cli [--db PATH] COMMAND ...
+
+Commands: import, query, export, summary, rollups, budget, categories,
+recurring, rates and backup; run with --help for their options. Transactions are
+streamed from SQLite to the output row by row, as CSV with a header or as
+JSON lines, so ledgers of any size can be processed from batch jobs;
+export can also write the columnar format of app.exporter. Amounts are
+written as decimal strings, e.g. "12.50", expenses being positive like in
+the database; transactions carry their currency, while summaries and
+budgets are in the main currency. Errors go to stderr with exit status 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+from datetime import date
+from decimal import InvalidOperation
+from app import exporter, instrumentation, recurring
+from app.database import backup
+from app.database import database as db
+from app.exporter import TRANSACTION_FIELDS, write_rows
+from app.models.money import Money
+
+OUTPUT_FORMATS = exporter.TEXT_FORMATS
+
+SUMMARY_FIELDS = ('year', 'month', 'category', 'amount', 'count')
+ROLLUP_FIELDS = ('source', 'year', 'month', 'category_id', 'amount', 'count')
+CATEGORY_FIELDS = ('id', 'name', 'parent', 'depth')
+SNAPSHOT_FIELDS = ('time', 'path', 'size')
+RECURRING_FIELDS = ('id', 'description', 'amount', 'category', 'frequency', 'interval', 'day',
+                    'start_date', 'end_date', 'next_date')
+PROJECTED_FIELDS = ('date', 'rule', 'description', 'amount', 'category')
+RATE_FIELDS = ('date', 'from', 'to', 'rate')
+
+
+class CliError(Exception):
+    """An error reported on stderr, ending the command with exit status 1."""
+
+
+# --- Argument types -----------------------------------------------------------
+
+def _month(text):
+    """Parses a YYYY-MM argument into (year, month)."""
+    try:
+        year, month = (int(part) for part in text.split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"nieprawidłowy miesiąc: {text!r}, oczekiwano RRRR-MM")
+    if not 1 <= month <= 12:
+        raise argparse.ArgumentTypeError(f"nieprawidłowy miesiąc: {text!r}")
+    return year, month
+
+
+def _iso_date(text):
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"nieprawidłowa data: {text!r}, oczekiwano RRRR-MM-DD")
+
+
+def _amount(text):
+    try:
+        return Money.from_value(text.replace(',', '.'))
+    except InvalidOperation:
+        raise argparse.ArgumentTypeError(f"nieprawidłowa kwota: {text!r}")
+
+
+def _day_of_month(text):
+    try:
+        day = int(text)
+    except ValueError:
+        day = 0
+    if not 1 <= day <= 31:
+        raise argparse.ArgumentTypeError(f"nieprawidłowy dzień miesiąca: {text!r}")
+    return day
+
+
+def _positive(text):
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"oczekiwano liczby dodatniej: {text!r}")
+    return value
+
+
+def _current_month():
+    today = date.today()
+    return today.year, today.month
+
+
+# --- Filters ------------------------------------------------------------------
+
+def _category_ids(names):
+    """Returns the ids of the named categories and all of their subcategories."""
+    tree = db.get_category_tree()
+    category_ids = set()
+    for name in names:
+        category_id = tree.id_for_name(name)
+        if category_id is None:
+            raise CliError(f"Nieznana kategoria: {name}")
+        category_ids |= tree.subtree(category_id)
+    return sorted(category_ids)
+
+
+def _filters(args):
+    """Returns the text filter, category ids and date range given on the command line."""
+    categories = _category_ids(args.category) if args.category else None
+    date_range = None
+    if args.date_from or args.date_to:
+        date_range = (args.date_from or '0000-01-01', args.date_to or '9999-12-31')
+    return args.search, categories, date_range
+
+
+# --- Commands -----------------------------------------------------------------
+
+def cmd_import(args):
+    from app import importer
+    try:
+        result = importer.import_file(
+            args.file, file_format=args.file_format, encoding=args.encoding,
+            dayfirst=not args.month_first, debits_only=args.debits_only, account=args.account,
+            fuzzy_days=args.fuzzy_days, apply_rules=not args.no_rules
+        )
+    except (importer.ImportFormatError, OSError) as error:
+        raise CliError(str(error))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def cmd_query(args):
+    rows = exporter.transaction_values(exporter.iter_transactions(*_filters(args)))
+    if args.limit is not None:
+        rows = itertools.islice(rows, args.limit)
+    write_rows(rows, TRANSACTION_FIELDS, args.format, sys.stdout)
+
+
+def cmd_export(args):
+    try:
+        count = exporter.export_transactions(args.file, args.format, *_filters(args))
+    except OSError as error:
+        raise CliError(str(error))
+    print(f"Wyeksportowano transakcji: {count}.", file=sys.stderr)
+
+
+def cmd_summary(args):
+    rows = (
+        (row['year'], row['month'], row['category'], str(Money(row['total_cents'])), row['count'])
+        for row in db.get_monthly_totals(args.year, args.month)
+    )
+    write_rows(rows, SUMMARY_FIELDS, args.format, sys.stdout)
+
+
+def cmd_rollups_check(args):
+    mismatches = db.check_monthly_totals()
+    rows = (
+        (row['source'], row['year'], row['month'], row['category_id'], str(Money(row['total_cents'])), row['count'])
+        for row in mismatches
+    )
+    write_rows(rows, ROLLUP_FIELDS, args.format, sys.stdout)
+    if mismatches:
+        raise CliError(f"Sumy miesięczne różnią się od transakcji w wierszach: {len(mismatches)}; "
+                       "popraw je poleceniem rollups rebuild.")
+
+
+def cmd_rollups_rebuild(args):
+    db.rebuild_monthly_totals()
+    db.rebuild_daily_totals()
+    print("Przeliczono sumy miesięczne i dzienne.", file=sys.stderr)
+
+
+def cmd_budget_get(args):
+    year, month = args.month
+    budget = db.get_budget_for_month(month, year)
+    if budget is None:
+        raise CliError(f"Brak budżetu na {year:04d}-{month:02d}.")
+    print(budget)
+
+
+def cmd_budget_set(args):
+    year, month = args.month
+    db.set_budget_for_month(args.amount, month, year)
+
+
+def cmd_categories_list(args):
+    tree = db.get_category_tree()
+    rows = (
+        (category_id, name, tree.name(tree.parent(category_id)) or '', depth)
+        for category_id, name, depth, _has_children in tree.display_order
+    )
+    write_rows(rows, CATEGORY_FIELDS, args.format, sys.stdout)
+
+
+def cmd_categories_add(args):
+    tree = db.get_category_tree()
+    if tree.id_for_name(args.name) is not None:
+        raise CliError(f"Kategoria już istnieje: {args.name}")
+    parent_id = None
+    if args.parent:
+        parent_id = tree.id_for_name(args.parent)
+        if parent_id is None:
+            raise CliError(f"Nieznana kategoria: {args.parent}")
+    db.add_category(args.name, parent_id)
+    print(db.get_category_tree().id_for_name(args.name))
+
+
+def cmd_categories_delete(args):
+    category_id = db.get_category_tree().id_for_name(args.name)
+    if category_id is None:
+        raise CliError(f"Nieznana kategoria: {args.name}")
+    db.delete_category(category_id)
+
+
+def cmd_recurring_list(args):
+    rows = (
+        (rule['id'], rule['description'], str(Money(rule['amount'])), rule['category'], rule['frequency'],
+         rule['interval'], rule['day'] or '', rule['start_date'], rule['end_date'] or '', rule['next_date'] or '')
+        for rule in db.get_recurring_rules()
+    )
+    write_rows(rows, RECURRING_FIELDS, args.format, sys.stdout)
+
+
+def cmd_recurring_add(args):
+    category_id = None
+    if args.category:
+        category_id = db.get_category_tree().id_for_name(args.category)
+        if category_id is None:
+            raise CliError(f"Nieznana kategoria: {args.category}")
+    if args.end and args.end < args.start:
+        raise CliError("Data końcowa jest wcześniejsza niż początkowa.")
+    print(db.add_recurring_rule(
+        args.description, args.amount, args.frequency, args.start, category_id,
+        interval=args.interval, day=args.day, end_date=args.end
+    ))
+
+
+def cmd_recurring_delete(args):
+    db.delete_recurring_rule(args.id)
+
+
+def cmd_recurring_run(args):
+    count = recurring.materialize_due(date.fromisoformat(args.date) if args.date else None)
+    print(f"Zaksięgowano transakcji cyklicznych: {count}.", file=sys.stderr)
+
+
+def cmd_recurring_projected(args):
+    rows = (
+        (day.isoformat(), rule['id'], rule['description'], str(Money(rule['amount'])), rule['category'])
+        for day, rule in recurring.projected(date.fromisoformat(args.until))
+    )
+    write_rows(rows, PROJECTED_FIELDS, args.format, sys.stdout)
+
+
+def cmd_rates_import(args):
+    from app import fx
+    try:
+        result = fx.import_rates(args.file, encoding=args.encoding, dayfirst=not args.month_first)
+    except (fx.RatesFormatError, OSError) as error:
+        raise CliError(str(error))
+    print(json.dumps(result, ensure_ascii=False))
+    missing = db.get_currencies_without_rates()
+    if missing:
+        print(f"Brak kursów do {db.get_main_currency()} dla walut: {', '.join(missing)}.", file=sys.stderr)
+
+
+def cmd_rates_list(args):
+    rows = (
+        (row['date'], row['from_currency'], row['to_currency'], row['rate'])
+        for row in db.get_fx_rates(args.from_currency, args.to_currency)
+    )
+    write_rows(rows, RATE_FIELDS, args.format, sys.stdout)
+
+
+def cmd_rates_main(args):
+    if args.currency is None:
+        print(db.get_main_currency())
+        return
+    from app.fx import parse_currency
+    try:
+        currency = parse_currency(args.currency)
+    except ValueError as error:
+        raise CliError(str(error))
+    db.set_main_currency(currency)
+
+
+def cmd_backup_create(args):
+    try:
+        print(backup.create_snapshot(args.dir, args.keep))
+    except (OSError, sqlite3.Error) as error:
+        raise CliError(str(error))
+
+
+def cmd_backup_list(args):
+    rows = (
+        (taken.isoformat(sep=' ', timespec='seconds'), path, os.path.getsize(path))
+        for taken, path in backup.list_snapshots(args.dir)
+    )
+    write_rows(rows, SNAPSHOT_FIELDS, args.format, sys.stdout)
+
+
+def cmd_backup_restore(args):
+    try:
+        backup.restore_snapshot(args.file)
+    except (backup.RestoreError, OSError) as error:
+        raise CliError(str(error))
+
+
+# --- Parser -------------------------------------------------------------------
+
+def _add_format_argument(parser, formats=OUTPUT_FORMATS):
+    parser.add_argument('-f', '--format', choices=formats, default='csv',
+                        help="format wyjścia (domyślnie csv)")
+
+
+def _add_filter_arguments(parser):
+    parser.add_argument('-s', '--search', help="słowa, od których mają zaczynać się słowa opisu")
+    parser.add_argument('-c', '--category', action='append',
+                        help="kategoria wraz z podkategoriami; można podać wiele razy")
+    parser.add_argument('--from', dest='date_from', type=_iso_date, help="od daty RRRR-MM-DD")
+    parser.add_argument('--to', dest='date_to', type=_iso_date, help="do daty RRRR-MM-DD włącznie")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m app.cli',
+        description="Menedżer finansów z wiersza poleceń."
+    )
+    parser.add_argument('--db', help="plik bazy danych (domyślnie data/finance.db)")
+    parser.add_argument('--profile', action='store_true',
+                        help="mierzy czasy operacji i zapytań, wypisuje je na stderr z planami wolnych zapytań")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+
+    command = commands.add_parser('import', help="importuje transakcje z pliku CSV, MT940 lub OFX")
+    command.add_argument('file')
+    command.add_argument('--file-format', choices=('csv', 'mt940', 'ofx'), help="format pliku (domyślnie wykrywany)")
+    command.add_argument('--encoding', help="kodowanie pliku (domyślnie wykrywane)")
+    command.add_argument('--month-first', action='store_true', help="daty w formacie miesiąc/dzień")
+    debits = command.add_mutually_exclusive_group()
+    debits.add_argument('--debits-only', action='store_true', default=None,
+                        help="pomija wpływy (domyślne dla wyciągów bankowych)")
+    debits.add_argument('--all-amounts', dest='debits_only', action='store_false',
+                        help="importuje także wpływy")
+    command.add_argument('--account', help="numer rachunku, gdy plik go nie zawiera")
+    command.add_argument('--fuzzy-days', type=int, help="pomija podobne transakcje z tylu dni")
+    command.add_argument('--no-rules', action='store_true', help="nie stosuje reguł kategorii")
+    command.set_defaults(handler=cmd_import)
+
+    command = commands.add_parser('query', help="wypisuje transakcje spełniające filtry")
+    _add_filter_arguments(command)
+    _add_format_argument(command)
+    command.add_argument('-n', '--limit', type=int, help="najwyżej tyle transakcji")
+    command.set_defaults(handler=cmd_query)
+
+    command = commands.add_parser('export', help="zapisuje transakcje spełniające filtry do pliku")
+    command.add_argument('file')
+    _add_filter_arguments(command)
+    _add_format_argument(command, exporter.FORMATS)
+    command.set_defaults(handler=cmd_export)
+
+    command = commands.add_parser('summary', help="sumy wydatków według miesięcy i kategorii")
+    command.add_argument('year', type=int)
+    command.add_argument('month', type=int, nargs='?', choices=range(1, 13), metavar='month')
+    _add_format_argument(command)
+    command.set_defaults(handler=cmd_summary)
+
+    rollups = commands.add_parser('rollups', help="sumy miesięczne i dzienne przechowywane w bazie")
+    rollup_commands = rollups.add_subparsers(dest='rollups_command', required=True, metavar='COMMAND')
+    command = rollup_commands.add_parser('check', help="porównuje sumy miesięczne z transakcjami i wypisuje różnice")
+    _add_format_argument(command)
+    command.set_defaults(handler=cmd_rollups_check)
+    command = rollup_commands.add_parser('rebuild', help="przelicza sumy miesięczne i dzienne od nowa")
+    command.set_defaults(handler=cmd_rollups_rebuild)
+
+    budget = commands.add_parser('budget', help="budżet miesięczny")
+    budget_commands = budget.add_subparsers(dest='budget_command', required=True, metavar='COMMAND')
+    command = budget_commands.add_parser('get', help="wypisuje budżet miesiąca")
+    command.add_argument('month', type=_month, nargs='?', default=_current_month(), help="RRRR-MM (domyślnie bieżący)")
+    command.set_defaults(handler=cmd_budget_get)
+    command = budget_commands.add_parser('set', help="ustawia budżet miesiąca")
+    command.add_argument('amount', type=_amount)
+    command.add_argument('month', type=_month, nargs='?', default=_current_month(), help="RRRR-MM (domyślnie bieżący)")
+    command.set_defaults(handler=cmd_budget_set)
+
+    categories = commands.add_parser('categories', help="kategorie")
+    category_commands = categories.add_subparsers(dest='categories_command', required=True, metavar='COMMAND')
+    command = category_commands.add_parser('list', help="wypisuje drzewo kategorii")
+    _add_format_argument(command)
+    command.set_defaults(handler=cmd_categories_list)
+    command = category_commands.add_parser('add', help="dodaje kategorię i wypisuje jej id")
+    command.add_argument('name')
+    command.add_argument('--parent', help="kategoria nadrzędna")
+    command.set_defaults(handler=cmd_categories_add)
+    command = category_commands.add_parser('delete', help="usuwa kategorię; jej transakcje zostają bez kategorii")
+    command.add_argument('name')
+    command.set_defaults(handler=cmd_categories_delete)
+
+    rules = commands.add_parser('recurring', help="transakcje cykliczne")
+    recurring_commands = rules.add_subparsers(dest='recurring_command', required=True, metavar='COMMAND')
+    command = recurring_commands.add_parser('list', help="wypisuje reguły transakcji cyklicznych")
+    _add_format_argument(command)
+    command.set_defaults(handler=cmd_recurring_list)
+    command = recurring_commands.add_parser('add', help="dodaje regułę i wypisuje jej id")
+    command.add_argument('description')
+    command.add_argument('amount', type=_amount)
+    command.add_argument('--frequency', choices=recurring.FREQUENCIES, default='monthly',
+                         help="co miesiąc danego dnia, co tydzień albo w ostatni dzień roboczy miesiąca "
+                              "(domyślnie monthly)")
+    command.add_argument('--interval', type=_positive, default=1, help="co tyle miesięcy lub tygodni (domyślnie 1)")
+    command.add_argument('--day', type=_day_of_month, help="dzień miesiąca (domyślnie dzień daty początkowej)")
+    command.add_argument('--start', type=_iso_date, default=date.today().isoformat(),
+                         help="pierwsza możliwa data RRRR-MM-DD (domyślnie dziś)")
+    command.add_argument('--end', type=_iso_date, help="ostatnia możliwa data RRRR-MM-DD")
+    command.add_argument('-c', '--category', help="kategoria transakcji")
+    command.set_defaults(handler=cmd_recurring_add)
+    command = recurring_commands.add_parser('delete', help="usuwa regułę; zaksięgowane transakcje zostają")
+    command.add_argument('id', type=int)
+    command.set_defaults(handler=cmd_recurring_delete)
+    command = recurring_commands.add_parser('run', help="księguje wszystkie zaległe transakcje cykliczne")
+    command.add_argument('--date', type=_iso_date, help="księguje do tej daty RRRR-MM-DD (domyślnie dziś)")
+    command.set_defaults(handler=cmd_recurring_run)
+    command = recurring_commands.add_parser('projected', help="wypisuje jeszcze niezaksięgowane wystąpienia")
+    command.add_argument('until', type=_iso_date, help="do daty RRRR-MM-DD włącznie")
+    _add_format_argument(command)
+    command.set_defaults(handler=cmd_recurring_projected)
+
+    rates = commands.add_parser('rates', help="kursy walut")
+    rate_commands = rates.add_subparsers(dest='rates_command', required=True, metavar='COMMAND')
+    command = rate_commands.add_parser('import', help="importuje kursy z pliku CSV (data;z;do;kurs)")
+    command.add_argument('file')
+    command.add_argument('--encoding', help="kodowanie pliku (domyślnie wykrywane)")
+    command.add_argument('--month-first', action='store_true', help="daty w formacie miesiąc/dzień")
+    command.set_defaults(handler=cmd_rates_import)
+    command = rate_commands.add_parser('list', help="wypisuje zapisane kursy")
+    command.add_argument('--from', dest='from_currency', help="tylko kursy tej waluty")
+    command.add_argument('--to', dest='to_currency', help="tylko kursy do tej waluty")
+    _add_format_argument(command)
+    command.set_defaults(handler=cmd_rates_list)
+    command = rate_commands.add_parser('main', help="wypisuje albo zmienia walutę główną")
+    command.add_argument('currency', nargs='?', help="nowa waluta główna, np. EUR")
+    command.set_defaults(handler=cmd_rates_main)
+
+    backups = commands.add_parser('backup', help="kopie zapasowe bazy danych")
+    backup_commands = backups.add_subparsers(dest='backup_command', required=True, metavar='COMMAND')
+    command = backup_commands.add_parser('create', help="tworzy skompresowaną kopię i wypisuje jej ścieżkę")
+    command.add_argument('--dir', help="folder kopii (domyślnie data/backups)")
+    command.add_argument('--keep', type=int, default=backup.KEEP_SNAPSHOTS,
+                         help=f"liczba zachowanych najnowszych kopii (domyślnie {backup.KEEP_SNAPSHOTS})")
+    command.set_defaults(handler=cmd_backup_create)
+    command = backup_commands.add_parser('list', help="wypisuje kopie od najnowszej")
+    command.add_argument('--dir', help="folder kopii (domyślnie data/backups)")
+    _add_format_argument(command)
+    command.set_defaults(handler=cmd_backup_list)
+    command = backup_commands.add_parser('restore', help="zastępuje bazę danych kopią")
+    command.add_argument('file')
+    command.set_defaults(handler=cmd_backup_restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.db:
+        db.configure_database(path=args.db)
+    if args.profile:
+        instrumentation.enable()
+    try:
+        db.initialize_database()
+        args.handler(args)
+        sys.stdout.flush()
+    except CliError as error:
+        print(f"błąd: {error}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # The reader stopped early, e.g. `| head`; keep the exit-time flush quiet
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if args.profile:
+            instrumentation.report(slow_queries=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
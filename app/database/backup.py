@@ -0,0 +1,170 @@
+"""Compressed snapshots of the database made with the SQLite backup API.
+
+A snapshot is copied page by page from a connection of its own, a few
+pages per step. That connection holds one read transaction for the whole
+copy: in WAL mode other connections keep reading and writing in between,
+while the copy sees a single consistent state of the database and never
+has to start over because of their writes. The copy goes to a temporary
+file that is then gzipped in chunks, so neither step holds the database in
+memory. Only the newest KEEP_SNAPSHOTS are kept.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import datetime
+from . import database as db
+from app.instrumentation import timed
+
+SNAPSHOT_PREFIX = 'finance-'
+SNAPSHOT_SUFFIX = '.db.gz'
+# Microseconds keep snapshots taken within the same second apart
+SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S-%f'
+# Format of the names of snapshots made by earlier versions
+LEGACY_SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+# Pages copied per backup step; the source is only locked during a step
+PAGES_PER_STEP = 1024
+
+# Snapshots kept by rotate_snapshots()
+KEEP_SNAPSHOTS = 10
+
+# Size of the chunks compressed and decompressed at a time
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupCancelled(Exception):
+    """Raised when a snapshot is stopped before it is complete."""
+
+
+class RestoreError(Exception):
+    """Raised for a snapshot that cannot be restored."""
+
+
+def default_directory():
+    """Returns the snapshot directory, next to the database file."""
+    return os.path.join(os.path.dirname(os.path.abspath(db.database_path())), 'backups')
+
+
+def _snapshot_time(path):
+    name = os.path.basename(path)[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+    for time_format in (SNAPSHOT_TIME_FORMAT, LEGACY_SNAPSHOT_TIME_FORMAT):
+        try:
+            return datetime.strptime(name, time_format)
+        except ValueError:
+            pass
+    return None
+
+
+def list_snapshots(directory=None):
+    """Returns (time, path) of the snapshots in a directory, newest first."""
+    directory = directory or default_directory()
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX):
+            path = os.path.join(directory, name)
+            taken = _snapshot_time(path)
+            if taken is not None:
+                snapshots.append((taken, path))
+    snapshots.sort(reverse=True)
+    return snapshots
+
+
+def latest_snapshot_time(directory=None):
+    """Returns when the newest snapshot was taken, None without snapshots."""
+    snapshots = list_snapshots(directory)
+    return snapshots[0][0] if snapshots else None
+
+
+@timed
+def create_snapshot(directory=None, keep=KEEP_SNAPSHOTS, progress=None, stop=None):
+    """Makes a compressed snapshot of the database and returns its path.
+
+    `progress(copied, total)` is called with page counts after every step.
+    A set `stop` event (threading.Event) ends the copy with BackupCancelled.
+    Older snapshots beyond `keep` are removed afterwards.
+    """
+    directory = directory or default_directory()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{datetime.now().strftime(SNAPSHOT_TIME_FORMAT)}{SNAPSHOT_SUFFIX}")
+
+    def on_step(status, remaining, total):
+        if stop is not None and stop.is_set():
+            raise BackupCancelled()
+        if progress is not None:
+            progress(total - remaining, total)
+
+    copy_fd, copy_path = tempfile.mkstemp(suffix='.db', dir=directory)
+    os.close(copy_fd)
+    partial_path = path + '.partial'
+    try:
+        with closing(sqlite3.connect(db.database_path(), isolation_level=None)) as source, \
+                closing(sqlite3.connect(copy_path)) as target:
+            # Pins the snapshot the backup steps read from
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=PAGES_PER_STEP, progress=on_step)
+            source.execute("COMMIT")
+        with open(copy_path, 'rb') as copy, gzip.open(partial_path, 'wb', compresslevel=6) as snapshot:
+            shutil.copyfileobj(copy, snapshot, CHUNK_SIZE)
+        os.replace(partial_path, path)
+    finally:
+        for leftover in (copy_path, copy_path + '-journal', partial_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    rotate_snapshots(directory, keep)
+    return path
+
+
+def rotate_snapshots(directory=None, keep=KEEP_SNAPSHOTS):
+    """Removes all but the `keep` newest snapshots; returns the removed paths."""
+    removed = [path for _taken, path in list_snapshots(directory)[keep:]]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+@timed
+def restore_snapshot(path, before_replace=None):
+    """Replaces the database with a snapshot.
+
+    The snapshot is decompressed next to the database and checked before
+    the database file is swapped for it, so a damaged snapshot leaves the
+    current data untouched. `before_replace()` is called once the check
+    has passed, e.g. to stop threads using the database. Every open
+    connection is then closed; they reopen on the restored file, migrated
+    to the current schema if it is older.
+    """
+    db_path = os.path.abspath(db.database_path())
+    restore_fd, restore_path = tempfile.mkstemp(suffix='.restore', dir=os.path.dirname(db_path))
+    os.close(restore_fd)
+    try:
+        try:
+            with gzip.open(path, 'rb') as snapshot, open(restore_path, 'wb') as restored:
+                shutil.copyfileobj(snapshot, restored, CHUNK_SIZE)
+            conn = sqlite3.connect(restore_path)
+            try:
+                result = conn.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                conn.close()
+        except (OSError, EOFError, sqlite3.DatabaseError) as error:
+            raise RestoreError(f"Nie można odczytać kopii zapasowej {path}: {error}")
+        if result != 'ok':
+            raise RestoreError(f"Kopia zapasowa {path} jest uszkodzona: {result}")
+
+        if before_replace is not None:
+            before_replace()
+        db.close_connections()
+        # WAL side files belong to the replaced database
+        for side_file in (db_path + '-wal', db_path + '-shm'):
+            if os.path.exists(side_file):
+                os.remove(side_file)
+        os.replace(restore_path, db_path)
+    finally:
+        if os.path.exists(restore_path):
+            os.remove(restore_path)
+    db.initialize_database()
@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from app import instrumentation
+
+# PRAGMAs applied to every new connection. WAL lets readers run while a write
+# is in progress, NORMAL synchronous is safe with WAL and avoids an fsync per
+# commit, and the cache/mmap sizes keep hot pages of a large ledger in memory.
+# Foreign keys are enforced so transactions cannot point at missing categories.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,       # negative value = size in KiB (~20 MB)
+    'mmap_size': 268435456,     # 256 MB
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+# Number of compiled statements kept per connection by the sqlite3 module.
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+class ConnectionManager:
+    """Hands out one long-lived SQLite connection per thread.
+
+    Connections are opened lazily on first use and reused for every later
+    call made from the same thread, so the database file is opened and the
+    schema parsed only once. Compiled statements are kept in the connection's
+    statement cache, which is keyed by the SQL text.
+    """
+
+    def __init__(self, path, pragmas=None, cached_statements=DEFAULT_CACHED_STATEMENTS):
+        self.path = path
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def configure(self, path=None, pragmas=None, cached_statements=None):
+        """Changes the database path or connection settings.
+
+        Open connections are closed, so the new settings are used the next
+        time a thread asks for a connection.
+        """
+        self.close_all()
+        if path is not None:
+            self.path = path
+        if pragmas is not None:
+            self.pragmas.update(pragmas)
+        if cached_statements is not None:
+            self.cached_statements = cached_statements
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,  # transactions are managed explicitly
+            check_same_thread=False,  # allows close_all() from another thread
+            cached_statements=self.cached_statements,
+        )
+        conn.text_factory = lambda b: b.decode('utf-8') # Set text factory to decode using UTF-8
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        instrumentation.watch_connection(conn)
+        return conn
+
+    def connection(self):
+        """Returns the connection owned by the calling thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Runs the enclosed block in a transaction on the thread's connection.
+
+        The transaction is committed when the block finishes and rolled back
+        if it raises. Nested blocks use savepoints, so a failing inner block
+        only undoes its own changes.
+        """
+        conn = self.connection()
+        depth = self._local.depth
+        if depth == 0:
+            conn.execute("BEGIN")
+        else:
+            conn.execute(f"SAVEPOINT sp_{depth}")
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            if depth == 0:
+                conn.execute("ROLLBACK")
+            else:
+                conn.execute(f"ROLLBACK TO sp_{depth}")
+                conn.execute(f"RELEASE sp_{depth}")
+            raise
+        else:
+            if depth == 0:
+                conn.execute("COMMIT")
+            else:
+                conn.execute(f"RELEASE sp_{depth}")
+        finally:
+            self._local.depth = depth
+
+    def close(self):
+        """Closes the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+            self._local.conn = None
+
+    def close_all(self):
+        """Closes the connections of all threads, e.g. before the file is removed."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        # Threads notice their closed connection on the next call
+        self._local = threading.local()
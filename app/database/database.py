@@ -1,21 +1,75 @@
-import sqlite3
+import json
 import os
+import re
+import sqlite3
+import unicodedata
+from contextlib import contextmanager
+from .connection import ConnectionManager
+from . import migrations
+from .migrations import DAY_KEY, DEFAULT_CURRENCY, MAIN_AMOUNT, MAIN_CURRENCY, MONTH_KEY
+from app.instrumentation import timed
+from app.models.money import Money
+from app.models.category_tree import CategoryTree
 
 # Define the path for the database in the 'data' directory
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'finance.db')
 
+# One long-lived connection per thread, shared by every function below
+_manager = ConnectionManager(DB_PATH)
+
+# CategoryTree of the categories table, loaded on first use
+_category_tree = None
+
+# Amount of the transaction row `t` in cents of the main currency
+_T_MAIN_AMOUNT = MAIN_AMOUNT.format(row='t')
+
+def configure_database(path=None, pragmas=None, cached_statements=None):
+    """Changes the database file or connection PRAGMAs used by the module."""
+    _manager.configure(path=path, pragmas=pragmas, cached_statements=cached_statements)
+    invalidate_category_tree()
+
+def database_path():
+    """Returns the path of the database file in use."""
+    return _manager.path
+
 def get_db_connection():
-    """Creates a database connection."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.text_factory = lambda b: b.decode('utf-8') # Set text factory to decode using UTF-8
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Returns the calling thread's persistent database connection."""
+    return _manager.connection()
+
+def transaction():
+    """Context manager running a block of statements in a single transaction."""
+    return _manager.transaction()
 
+def close_connection():
+    """Closes the calling thread's connection, e.g. when a worker thread finishes."""
+    _manager.close()
+
+def close_connections():
+    """Closes all open connections, e.g. before the database file is removed."""
+    _manager.close_all()
+
+@timed
 def initialize_database():
-    """Initializes the database and creates tables if they don't exist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """Initializes the database, creates tables if they don't exist and applies pending migrations."""
+    invalidate_category_tree()
+    try:
+        version = migrations.get_schema_version(get_db_connection().cursor())
+    except sqlite3.OperationalError:
+        version = None  # no settings table yet: a new database
+    if version == migrations.LATEST_VERSION:
+        return  # fast path: the schema is complete, nothing to create or migrate
+    with transaction() as conn:
+        cursor = conn.cursor()
+        _create_schema(cursor)
+        migrations.migrate(cursor)
+    invalidate_category_tree()
+
+def _create_schema(cursor):
+    """Creates the tables and the default categories on a new database.
 
+    This is the version 0 schema; every later change to it is a step in
+    migrations.py. Amounts are stored as integer cents since migration 3.
+    """
     # Create transactions table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS transactions (
@@ -56,6 +110,11 @@ def initialize_database():
         );
     ''')
 
+    # Create the full-text index over transaction descriptions
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'")
+    if cursor.fetchone() is None:
+        _create_description_index(cursor)
+
     # Check if onboarding is complete
     cursor.execute("SELECT value FROM settings WHERE key = 'onboarding_complete'")
     result = cursor.fetchone()
@@ -93,122 +152,769 @@ def initialize_database():
                 subcategories_to_add = [(name, parent_id) for name in sub_names]
                 cursor.executemany("INSERT INTO categories (name, parent_id) VALUES (?, ?)", subcategories_to_add)
 
-    conn.commit()
-    conn.close()
+def _create_description_index(cursor):
+    """Creates the FTS5 index on descriptions and the triggers keeping it in sync."""
+    # External-content table: the text lives only in `transactions`, FTS5 keeps the index
+    cursor.execute('''
+        CREATE VIRTUAL TABLE transactions_fts USING fts5(
+            description,
+            content='transactions',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+    ''')
+    migrations.create_description_triggers(cursor)
+    # Index the rows that existed before the table was created
+    cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
+def _fold_char(char):
+    """Drops the diacritics unicode61 removes: those on letters built from an ASCII one."""
+    if unicodedata.combining(char):
+        return ''
+    base = unicodedata.normalize('NFD', char)[0]
+    return base if base.isascii() else char
+
+def _search_terms(text):
+    """Splits text into lowercase words without diacritics, like the FTS tokenizer does."""
+    # No casefold or NFKD: unicode61 keeps 'ß', ligatures and '½' as they are
+    text = ''.join(_fold_char(char) for char in text.lower())
+    return re.findall(r'[^\W_]+', text)
+
+def _fts_query(text):
+    """Builds an FTS5 query matching rows that contain every word of `text` as a prefix."""
+    return ' '.join(f'"{term}"*' for term in _search_terms(text))
+
+def description_matcher(text_filter):
+    """Returns a function checking descriptions against a search text the same way the FTS query does."""
+    terms = _search_terms(text_filter or '')
+
+    def matches(description):
+        if not terms:
+            return True
+        words = _search_terms(description)
+        return all(any(word.startswith(term) for word in words) for term in terms)
+    return matches
+
+def description_matches(description, text_filter):
+    """Checks a description against a search text the same way the FTS query does."""
+    return description_matcher(text_filter)(description)
+
+def filters_narrow(old_text, old_categories, new_text, new_categories):
+    """Checks whether every transaction matching the new filters also matches the old ones.
+
+    A description matches when each search term starts one of its words,
+    so a term extended or added can only drop rows; a category list can
+    only drop rows by becoming a subset of the old one.
+    """
+    if old_categories and not (new_categories and set(new_categories) <= set(old_categories)):
+        return False
+    new_terms = _search_terms(new_text or '')
+    return all(any(new_term.startswith(term) for new_term in new_terms)
+               for term in _search_terms(old_text or ''))
+
+def _filter_clauses(text_filter=None, categories=None, date_range=None, prefix='t.'):
+    """Returns WHERE clauses and parameters for the transaction filters.
+
+    `categories` is a list of category ids and `date_range` an inclusive
+    (start, end) pair of dates. `prefix` qualifies the column names with
+    the alias the query gives the transactions table.
+    """
+    clauses = []
+    params = []
+    query = _fts_query(text_filter) if text_filter else ''
+    if query:
+        clauses.append(f"{prefix}id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)")
+        params.append(query)
+    if categories:
+        clauses.append(f"{prefix}category_id IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    if date_range:
+        clauses.append(f"{prefix}date BETWEEN ? AND ?")
+        params.extend(date_range)
+    return clauses, params
+
+def _category_groups_cte(parent=None):
+    """Returns a recursive CTE `category_groups(id, group_id, group_name)` and its parameters.
+
+    Without `parent` every category is grouped under its top-level ancestor.
+    With a parent category id, its descendants are grouped under the direct
+    child of the parent they belong to, at any depth. CategoryTree.groups()
+    gives the same grouping in memory.
+    """
+    if parent is None:
+        anchor = "SELECT id, id, name FROM categories WHERE parent_id IS NULL"
+        params = []
+    else:
+        anchor = "SELECT id, id, name FROM categories WHERE parent_id = ?"
+        params = [parent]
+    cte = f'''
+        WITH RECURSIVE category_groups(id, group_id, group_name) AS (
+            {anchor}
+            UNION ALL
+            SELECT c.id, g.group_id, g.group_name FROM categories c JOIN category_groups g ON c.parent_id = g.id
+        )
+    '''
+    return cte, params
+
+@timed
+def expenses_by_category(parent=None, date_range=None, text_filter=None, categories=None):
+    """Sums expenses per category group with a single GROUP BY, largest first.
+
+    Without `parent` the totals are per top-level category, subcategories
+    being added to their root, plus an 'Uncategorized' group. With a parent
+    category id, the totals are per direct subcategory of that parent.
+    Returns a dictionary of group name to Money total in the main currency.
+
+    Without a description filter or date range the totals are read from
+    the monthly_totals rollup, which is already in the main currency;
+    otherwise the matching transactions are converted and summed.
+    """
+    cte, params = _category_groups_cte(parent)
+    if parent is None:
+        group = "COALESCE(g.group_name, 'Uncategorized')"
+        join = "LEFT JOIN"
+    else:
+        group = "g.group_name"
+        join = "JOIN"
+    if not date_range and not (text_filter and _fts_query(text_filter)):
+        where = ""
+        filter_params = list(categories or [])
+        if categories:
+            where = f"WHERE m.category_id IN ({', '.join('?' * len(categories))}) "
+        query = (
+            f"{cte} SELECT {group} AS name, SUM(m.total_cents) AS total "
+            f"FROM monthly_totals m {join} category_groups g ON g.id = m.category_id "
+            f"{where}GROUP BY 1 ORDER BY total DESC"
+        )
+    else:
+        clauses, filter_params = _filter_clauses(text_filter, categories, date_range)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        query = (
+            f"{cte} SELECT {group} AS name, SUM({_T_MAIN_AMOUNT}) AS total "
+            f"FROM transactions t {join} category_groups g ON g.id = t.category_id "
+            f"{where}GROUP BY 1 ORDER BY total DESC"
+        )
+    cursor = get_db_connection().execute(query, (*params, *filter_params))
+    return {row['name']: Money(row['total']) for row in cursor.fetchall()}
 
 def is_onboarding_complete():
     """Checks if the onboarding process has been completed."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM settings WHERE key = 'onboarding_complete'")
+    cursor = get_db_connection().execute("SELECT value FROM settings WHERE key = 'onboarding_complete'")
     result = cursor.fetchone()
-    conn.close()
     return result is not None and result['value'] == '1'
 
 def set_onboarding_complete():
     """Marks the onboarding process as complete."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE settings SET value = '1' WHERE key = 'onboarding_complete'")
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("UPDATE settings SET value = '1' WHERE key = 'onboarding_complete'")
+
+def get_main_currency():
+    """Returns the code of the currency totals and budgets are expressed in."""
+    cursor = get_db_connection().execute("SELECT value FROM settings WHERE key = 'main_currency'")
+    result = cursor.fetchone()
+    return result['value'] if result else DEFAULT_CURRENCY
 
+@timed
 def set_main_currency(currency):
-    """Sets the main currency."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('main_currency', ?)", (currency,))
-    conn.commit()
-    conn.close()
+    """Sets the main currency.
+
+    Transactions keep their own currency: the ones recorded in the previous
+    main currency are marked with it and the ones in the new currency lose
+    their mark, then the rollups are recomputed at the stored rates.
+    Budgets are not converted.
+    """
+    currency = currency.strip().upper()
+    with transaction() as conn:
+        previous = get_main_currency()
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('main_currency', ?)", (currency,))
+        if currency == previous:
+            return
+        with _triggers_suspended(conn, ('monthly_totals_update', 'daily_totals_update')):
+            conn.execute("UPDATE transactions SET currency = ? WHERE currency IS NULL", (previous,))
+            conn.execute("UPDATE transactions SET currency = NULL WHERE currency = ?", (currency,))
+            rebuild_monthly_totals()
+            rebuild_daily_totals()
+
+def _stored_currency(currency):
+    """Returns the value of the currency column for a currency code: NULL for the main currency."""
+    currency = (currency or '').strip().upper()
+    return None if not currency or currency == get_main_currency() else currency
 
 def get_all_categories():
     """Fetches all categories from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, parent_id FROM categories ORDER BY name")
-    categories = cursor.fetchall()
-    conn.close()
-    return categories
+    cursor = get_db_connection().execute("SELECT id, name, parent_id FROM categories ORDER BY name")
+    return cursor.fetchall()
+
+def get_category_tree():
+    """Returns the cached CategoryTree, loading it from the database if needed."""
+    global _category_tree
+    if _category_tree is None:
+        _category_tree = CategoryTree(get_all_categories())
+    return _category_tree
+
+def invalidate_category_tree():
+    """Drops the cached CategoryTree; the next get_category_tree() reloads it."""
+    global _category_tree
+    _category_tree = None
+
+# Transaction columns returned by every query; the category name is joined
+# in, so renaming a category does not touch the transactions table.
+# `amount` is in the transaction's currency (NULL for the main one) and
+# `main_amount` converted to the main currency.
+_TRANSACTION_SELECT = (
+    "SELECT t.id, t.date, t.description, t.amount, t.category_id, "
+    f"COALESCE(c.name, 'Uncategorized') AS category, t.currency, {_T_MAIN_AMOUNT} AS main_amount "
+    "FROM transactions t LEFT JOIN categories c ON c.id = t.category_id "
+)
 
+@timed
 def add_transaction(data):
-    """Adds a new transaction to the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO transactions (date, description, amount, category) VALUES (?, ?, ?, ?)",
-        (data['date'], data['description'], abs(float(data['amount'])), data['category'])
-    )
-    conn.commit()
-    conn.close()
+    """Adds a new transaction to the database and returns its id.
+
+    `data` holds the date, description, amount and category_id (None for
+    an uncategorized transaction), and optionally the currency code of the
+    amount; without one the amount is in the main currency.
+    """
+    with transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO transactions (date, description, amount, category_id, currency) VALUES (?, ?, ?, ?, ?)",
+            (data['date'], data['description'], abs(Money.from_value(data['amount'])).cents, data['category_id'],
+             _stored_currency(data.get('currency')))
+        )
+    return cursor.lastrowid
 
+@timed
+def get_transaction(transaction_id):
+    """Fetches a single transaction by id, or None if it does not exist.
+
+    Like every transaction query, the amount is returned in integer cents.
+    """
+    cursor = get_db_connection().execute(f"{_TRANSACTION_SELECT}WHERE t.id = ?", (transaction_id,))
+    return cursor.fetchone()
+
+@timed
 def get_all_transactions():
     """Fetches all transactions from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, date, description, amount, category FROM transactions ORDER BY date DESC")
-    transactions = cursor.fetchall()
-    conn.close()
-    return transactions
+    cursor = get_db_connection().execute(f"{_TRANSACTION_SELECT}ORDER BY t.date DESC")
+    return cursor.fetchall()
 
-def update_transaction(transaction_id, data):
-    """Updates an existing transaction."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE transactions SET date = ?, description = ?, amount = ?, category = ? WHERE id = ?",
-        (data['date'], data['description'], abs(float(data['amount'])), data['category'], transaction_id)
+@timed
+def get_transactions_page(after=None, limit=500, text_filter=None, categories=None):
+    """Fetches one page of matching transactions ordered by date and id, newest first.
+
+    `after` is the (date, id) key of the last row of the previous page. Pages
+    are located by key instead of OFFSET, so every page costs the same no
+    matter how deep into the ledger it is.
+    """
+    clauses, params = _filter_clauses(text_filter, categories)
+    if after is not None:
+        clauses.append("(t.date, t.id) < (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    cursor = get_db_connection().execute(
+        f"{_TRANSACTION_SELECT}{where}ORDER BY t.date DESC, t.id DESC LIMIT ?",
+        (*params, limit)
     )
-    conn.commit()
-    conn.close()
+    return cursor.fetchall()
+
+def iter_transactions(text_filter=None, categories=None, batch_size=1000, date_range=None):
+    """Yields matching transactions, newest first, without loading them all at once."""
+    clauses, params = _filter_clauses(text_filter, categories, date_range)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    cursor = get_db_connection().execute(f"{_TRANSACTION_SELECT}{where}ORDER BY t.date DESC, t.id DESC", params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+@timed
+def get_last_transaction_id():
+    """Returns the highest transaction id, 0 for an empty ledger."""
+    return get_db_connection().execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
 
+@timed
+def find_duplicate_candidates(amounts, date_range, max_id=None):
+    """Returns the transactions with one of the given amounts within an inclusive date range.
+
+    This is the blocking step of the fuzzy duplicate check: only rows
+    sharing an amount (in cents) and a date window with an imported row are
+    compared with it, and the (amount, date) index finds them. `max_id`
+    leaves out rows added after it, e.g. earlier batches of the same import.
+    """
+    query = (
+        "SELECT id, date, amount, description, fingerprint FROM transactions "
+        "WHERE amount IN (SELECT value FROM json_each(?)) AND date BETWEEN ? AND ?"
+    )
+    params = [json.dumps(sorted(set(amounts))), *date_range]
+    if max_id is not None:
+        query += " AND id <= ?"
+        params.append(max_id)
+    return get_db_connection().execute(query, params).fetchall()
+
+@timed
+def search_transactions(text, limit=50):
+    """Full-text search over descriptions, best matches first.
+
+    Every word of `text` must appear as a word prefix; results are ranked
+    with BM25 so descriptions matching the words more closely come first.
+    """
+    query = _fts_query(text)
+    if not query:
+        return []
+    cursor = get_db_connection().execute(
+        "SELECT t.id, t.date, t.description, t.amount, t.category_id, "
+        f"COALESCE(c.name, 'Uncategorized') AS category, t.currency, {_T_MAIN_AMOUNT} AS main_amount "
+        "FROM transactions_fts f JOIN transactions t ON t.id = f.rowid "
+        "LEFT JOIN categories c ON c.id = t.category_id "
+        "WHERE transactions_fts MATCH ? ORDER BY f.rank LIMIT ?",
+        (query, limit)
+    )
+    return cursor.fetchall()
+
+@timed
+def update_transaction(transaction_id, data):
+    """Updates an existing transaction and returns its id."""
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE transactions SET date = ?, description = ?, amount = ?, category_id = ?, currency = ? WHERE id = ?",
+            (data['date'], data['description'], abs(Money.from_value(data['amount'])).cents, data['category_id'],
+             _stored_currency(data.get('currency')), transaction_id)
+        )
+    return transaction_id
+
+@timed
 def delete_transaction(transaction_id):
-    """Deletes a transaction from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-    conn.commit()
-    conn.close()
+    """Deletes a transaction from the database and returns its id."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+    return transaction_id
 
+@timed
 def set_budget_for_month(amount, month, year):
     """Sets the budget for a specific month and year."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO budgets (amount, month, year) VALUES (?, ?, ?)",
-        (amount, month, year)
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO budgets (amount, month, year) VALUES (?, ?, ?)",
+            (Money.from_value(amount).cents, month, year)
+        )
 
+@timed
 def get_budget_for_month(month, year):
     """Gets the budget for a specific month and year."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT amount FROM budgets WHERE month = ? AND year = ?", (month, year))
+    cursor = get_db_connection().execute("SELECT amount FROM budgets WHERE month = ? AND year = ?", (month, year))
     result = cursor.fetchone()
-    conn.close()
-    return result['amount'] if result else None
+    return Money(result['amount']) if result else None
 
-def add_category(name, parent_id):
-    """Adds a new category to the database."""
+@timed
+def get_month_expenses(month, year, text_filter=None, categories=None):
+    """Returns the total expenses of a month matching the given filters, in the main currency.
+
+    Without a description filter the total is read from the monthly_totals
+    rollup; a description filter needs the transactions themselves and uses
+    the month index with the FTS query.
+    """
+    conn = get_db_connection()
+    if text_filter and _fts_query(text_filter):
+        clauses, params = _filter_clauses(text_filter, categories, prefix='')
+        cursor = conn.execute(
+            f"SELECT SUM({MAIN_AMOUNT.format(row='transactions')}) FROM transactions "
+            f"WHERE {MONTH_KEY} = ? AND {' AND '.join(clauses)}",
+            (f"{year:04d}-{month:02d}", *params)
+        )
+        return Money(cursor.fetchone()[0] or 0)
+    query = "SELECT SUM(total_cents) FROM monthly_totals WHERE year = ? AND month = ?"
+    params = [year, month]
+    if categories:
+        query += f" AND category_id IN ({', '.join('?' * len(categories))})"
+        params.extend(categories)
+    cents = conn.execute(query, params).fetchone()[0]
+    return Money(cents or 0)
+
+@timed
+def get_monthly_totals(year, month=None):
+    """Returns per-category totals of a year or month from the monthly_totals rollup."""
+    query = (
+        "SELECT m.year, m.month, COALESCE(c.name, 'Uncategorized') AS category, "
+        "m.total_cents, m.count FROM monthly_totals m "
+        "LEFT JOIN categories c ON c.id = m.category_id WHERE m.year = ?"
+    )
+    params = [year]
+    if month is not None:
+        query += " AND m.month = ?"
+        params.append(month)
+    cursor = get_db_connection().execute(query + " ORDER BY m.month, m.total_cents DESC", params)
+    return cursor.fetchall()
+
+# Fresh aggregation of the transactions into monthly_totals rows
+_MONTHLY_TOTALS_QUERY = f'''
+    SELECT CAST(substr(t.date, 1, 4) AS INTEGER) AS year, CAST(substr(t.date, 6, 2) AS INTEGER) AS month,
+           COALESCE(t.category_id, 0) AS category_id, SUM({_T_MAIN_AMOUNT}) AS total_cents,
+           COUNT(*) AS count
+    FROM transactions t {{where}}
+    GROUP BY 1, 2, 3
+'''
+
+@timed
+def rebuild_monthly_totals():
+    """Recomputes the whole monthly_totals rollup from the transactions table."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM monthly_totals")
+        conn.execute(
+            "INSERT INTO monthly_totals (year, month, category_id, total_cents, count) "
+            + _MONTHLY_TOTALS_QUERY.format(where='')
+        )
+
+@timed
+def check_monthly_totals():
+    """Compares the rollup with a fresh aggregation of the transactions.
+
+    Returns the (year, month, category_id, total_cents, count) rows that
+    differ, marked 'stored' or 'actual'; an empty list means the rollup
+    is exact.
+    """
+    cursor = get_db_connection().execute(f'''
+        WITH actual AS ({_MONTHLY_TOTALS_QUERY.format(where='')}),
+             stored AS (SELECT year, month, category_id, total_cents, count FROM monthly_totals)
+        SELECT 'stored' AS source, * FROM (SELECT * FROM stored EXCEPT SELECT * FROM actual)
+        UNION ALL
+        SELECT 'actual' AS source, * FROM (SELECT * FROM actual EXCEPT SELECT * FROM stored)
+        ORDER BY year, month, category_id
+    ''')
+    return cursor.fetchall()
+
+# Fresh aggregation of the transactions into daily_totals rows
+_DAILY_TOTALS_QUERY = f'''
+    SELECT {DAY_KEY.format(date='t.date')} AS day, COALESCE(t.category_id, 0) AS category_id,
+           SUM({_T_MAIN_AMOUNT}) AS total_cents, COUNT(*) AS count
+    FROM transactions t {{where}}
+    GROUP BY 1, 2
+'''
+
+@timed
+def rebuild_daily_totals():
+    """Recomputes the whole daily_totals rollup from the transactions table."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM daily_totals")
+        conn.execute(
+            "INSERT INTO daily_totals (day, category_id, total_cents, count) "
+            + _DAILY_TOTALS_QUERY.format(where='')
+        )
+
+@timed
+def get_daily_totals(text_filter=None, categories=None, date_range=None):
+    """Returns (day, category_id, total_cents) rows of the expenses per day and category.
+
+    Totals are in the main currency, days are counted from 1970-01-01
+    and uncategorized expenses have category_id 0. Without a description
+    filter the rows come from the daily_totals rollup; a description
+    filter aggregates the matching transactions instead.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO categories (name, parent_id) VALUES (?, ?)",
-        (name, parent_id)
+    if text_filter and _fts_query(text_filter):
+        clauses, params = _filter_clauses(text_filter, categories, date_range)
+        query = _DAILY_TOTALS_QUERY.format(where=f"WHERE {' AND '.join(clauses)}")
+        return conn.execute(f"SELECT day, category_id, total_cents FROM ({query})", params).fetchall()
+    query = "SELECT day, category_id, total_cents FROM daily_totals"
+    clauses = []
+    params = []
+    if categories:
+        clauses.append(f"category_id IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    if date_range:
+        clauses.append(f"day BETWEEN {DAY_KEY.format(date='?')} AND {DAY_KEY.format(date='?')}")
+        params.extend(date_range)
+    if clauses:
+        query += f" WHERE {' AND '.join(clauses)}"
+    return conn.execute(query, params).fetchall()
+
+# AFTER INSERT triggers whose work bulk_insert() does once for all new rows
+_BULK_INSERT_TRIGGERS = ('transactions_fts_insert', 'monthly_totals_insert', 'daily_totals_insert')
+
+# Category changes above this many rows rebuild the rollup once instead of
+# updating it from a trigger per row
+_BULK_UPDATE_THRESHOLD = 5000
+
+@contextmanager
+def _triggers_suspended(conn, names):
+    """Drops the named triggers for the enclosed block and recreates them afterwards.
+
+    Must run inside a transaction: if the block raises, the rollback
+    restores the triggers.
+    """
+    placeholders = ', '.join('?' * len(names))
+    triggers = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})",
+        names
+    ).fetchall()
+    for trigger in triggers:
+        conn.execute(f"DROP TRIGGER {trigger['name']}")
+    yield
+    for trigger in triggers:
+        conn.execute(trigger['sql'])
+
+@contextmanager
+def bulk_insert():
+    """Context manager for inserting many transactions in a single transaction.
+
+    Yields a function inserting a list of (date, description, amount,
+    category_id, fingerprint, currency) tuples, with amounts already in
+    integer cents and None as the currency of main-currency rows, and
+    returning the number of rows inserted; rows whose fingerprint is
+    already in the ledger are skipped.
+
+    The per-row insert triggers are dropped for the duration; at the end
+    the new rows are added to the FTS index and the monthly_totals and
+    daily_totals rollups with one statement each and the triggers are
+    restored. Other connections never see the triggers missing, since it
+    all happens in one transaction.
+    """
+    with transaction() as conn, _triggers_suspended(conn, _BULK_INSERT_TRIGGERS):
+        # AUTOINCREMENT ids only grow, so the new rows are the ones above the current maximum
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+
+        def insert(rows):
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO transactions (date, description, amount, category_id, fingerprint, currency) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return cursor.rowcount
+
+        yield insert
+        conn.execute(
+            "INSERT INTO transactions_fts (rowid, description) SELECT id, description FROM transactions WHERE id > ?",
+            (last_id,)
+        )
+        conn.execute(
+            "INSERT INTO monthly_totals (year, month, category_id, total_cents, count) "
+            + _MONTHLY_TOTALS_QUERY.format(where='WHERE t.id > ?')
+            + " ON CONFLICT (year, month, category_id) DO UPDATE "
+            "SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count",
+            (last_id,)
+        )
+        conn.execute(
+            "INSERT INTO daily_totals (day, category_id, total_cents, count) "
+            + _DAILY_TOTALS_QUERY.format(where='WHERE t.id > ?')
+            + " ON CONFLICT (day, category_id) DO UPDATE "
+            "SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count",
+            (last_id,)
+        )
+
+def iter_for_categorization(include_categorized=False, batch_size=10000):
+    """Yields the id, description, amount and category_id of transactions to run the rules on.
+
+    Only uncategorized transactions are read unless `include_categorized`.
+    """
+    query = "SELECT id, description, amount, category_id FROM transactions"
+    if not include_categorized:
+        query += " WHERE category_id IS NULL"
+    cursor = get_db_connection().execute(query)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+@timed
+def set_transaction_categories(changes):
+    """Assigns categories to many transactions and returns the number changed.
+
+    `changes` is a list of (category_id, transaction_id) pairs. Large
+    batches skip the per-row rollup triggers and rebuild the rollups once.
+    """
+    with transaction() as conn:
+        if len(changes) < _BULK_UPDATE_THRESHOLD:
+            cursor = conn.executemany("UPDATE transactions SET category_id = ? WHERE id = ?", changes)
+            return cursor.rowcount
+        with _triggers_suspended(conn, ('monthly_totals_update', 'daily_totals_update')):
+            cursor = conn.executemany("UPDATE transactions SET category_id = ? WHERE id = ?", changes)
+            rebuild_monthly_totals()
+            rebuild_daily_totals()
+        return cursor.rowcount
+
+@timed
+def get_categorization_rules():
+    """Fetches all categorization rules, oldest first."""
+    cursor = get_db_connection().execute(
+        "SELECT r.id, r.match_type, r.pattern, r.min_amount, r.max_amount, r.category_id, r.priority, "
+        "c.name AS category FROM categorization_rules r JOIN categories c ON c.id = r.category_id "
+        "ORDER BY r.id"
+    )
+    return cursor.fetchall()
+
+@timed
+def add_categorization_rule(match_type, category_id, pattern=None, min_amount=None, max_amount=None, priority=0):
+    """Adds a categorization rule and returns its id.
+
+    `match_type` is 'keyword' or 'regex' with a `pattern`, or 'amount'
+    with an inclusive `min_amount`/`max_amount` range (either may be None).
+    """
+    if min_amount is not None:
+        min_amount = Money.from_value(min_amount).cents
+    if max_amount is not None:
+        max_amount = Money.from_value(max_amount).cents
+    with transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO categorization_rules (match_type, pattern, min_amount, max_amount, category_id, priority) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (match_type, pattern, min_amount, max_amount, category_id, priority)
+        )
+    return cursor.lastrowid
+
+@timed
+def delete_categorization_rule(rule_id):
+    """Deletes a categorization rule."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM categorization_rules WHERE id = ?", (rule_id,))
+
+_RECURRING_RULE_SELECT = (
+    "SELECT r.id, r.description, r.amount, r.category_id, r.frequency, r.interval, r.day, "
+    "r.start_date, r.end_date, r.next_date, COALESCE(c.name, 'Uncategorized') AS category "
+    "FROM recurring_rules r LEFT JOIN categories c ON c.id = r.category_id "
+)
+
+@timed
+def get_recurring_rules():
+    """Fetches all recurring transaction rules, oldest first."""
+    cursor = get_db_connection().execute(
+        f"{_RECURRING_RULE_SELECT}ORDER BY r.id"
+    )
+    return cursor.fetchall()
+
+@timed
+def get_due_recurring_rules(until):
+    """Fetches the rules with an occurrence not posted yet on or before a date."""
+    cursor = get_db_connection().execute(
+        f"{_RECURRING_RULE_SELECT}WHERE r.next_date <= ? ORDER BY r.id", (until,)
+    )
+    return cursor.fetchall()
+
+@timed
+def add_recurring_rule(description, amount, frequency, start_date, category_id=None, interval=1, day=None,
+                       end_date=None):
+    """Adds a recurring transaction rule and returns its id.
+
+    `frequency` is 'monthly', 'weekly' or 'last_business_day'; `day` is the
+    day of the month of a monthly rule, the day of start_date by default.
+    No occurrence is posted before start_date.
+    """
+    with transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO recurring_rules "
+            "(description, amount, category_id, frequency, interval, day, start_date, end_date, next_date) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (description, Money.from_value(amount).cents, category_id, frequency, interval, day,
+             start_date, end_date, start_date)
+        )
+    return cursor.lastrowid
+
+@timed
+def delete_recurring_rule(rule_id):
+    """Deletes a recurring transaction rule; the transactions it posted stay."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM recurring_rules WHERE id = ?", (rule_id,))
+
+@timed
+def set_recurring_next_dates(changes):
+    """Moves the high-water marks of rules; `changes` is a list of (next_date or None, rule_id) pairs."""
+    with transaction() as conn:
+        conn.executemany("UPDATE recurring_rules SET next_date = ? WHERE id = ?", changes)
+
+def _shift_converted_totals(conn, sign):
+    """Removes (sign=-1) or adds back (sign=1) the share of the rollups in other currencies.
+
+    The rollup triggers convert at the rates stored when they run, so
+    rates are changed between the two calls. Only the transactions in other
+    currencies are read, through the partial currency index.
+    """
+    # The rows of those transactions are in the rollups, so every key conflicts
+    # and the counts stay as they are
+    conn.execute(
+        "INSERT INTO monthly_totals (year, month, category_id, total_cents, count) "
+        + _MONTHLY_TOTALS_QUERY.format(where='WHERE t.currency IS NOT NULL')
+        + " ON CONFLICT (year, month, category_id) DO UPDATE SET total_cents = total_cents + ? * excluded.total_cents",
+        (sign,)
     )
-    conn.commit()
-    conn.close()
+    conn.execute(
+        "INSERT INTO daily_totals (day, category_id, total_cents, count) "
+        + _DAILY_TOTALS_QUERY.format(where='WHERE t.currency IS NOT NULL')
+        + " ON CONFLICT (day, category_id) DO UPDATE SET total_cents = total_cents + ? * excluded.total_cents",
+        (sign,)
+    )
+
+@timed
+def add_fx_rates(rates):
+    """Stores exchange rates and returns the number of rates given.
 
+    `rates` are (date, from_currency, to_currency, rate) tuples: one unit
+    of from_currency is worth `rate` units of to_currency from that date
+    on. A rate already stored for a pair and date is replaced. The inverse
+    pairs are stored as well, so a rate converts either way. The rollups
+    are moved to the new rates in the same transaction.
+    """
+    rates = [(day, source.upper(), target.upper(), rate) for day, source, target, rate in rates]
+    with transaction() as conn:
+        _shift_converted_totals(conn, -1)
+        conn.executemany(
+            "INSERT OR REPLACE INTO fx_rates (date, from_currency, to_currency, rate) VALUES (?, ?, ?, ?)",
+            [(day, target, source, 1 / rate) for day, source, target, rate in rates] + rates
+        )
+        _shift_converted_totals(conn, 1)
+    return len(rates)
+
+@timed
+def get_fx_rates(from_currency=None, to_currency=None):
+    """Fetches the stored exchange rates, optionally of one pair, ordered by pair and date."""
+    clauses = []
+    params = []
+    if from_currency:
+        clauses.append("from_currency = ?")
+        params.append(from_currency.upper())
+    if to_currency:
+        clauses.append("to_currency = ?")
+        params.append(to_currency.upper())
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    cursor = get_db_connection().execute(
+        f"SELECT date, from_currency, to_currency, rate FROM fx_rates {where}"
+        "ORDER BY from_currency, to_currency, date",
+        params
+    )
+    return cursor.fetchall()
+
+@timed
+def get_currencies_without_rates():
+    """Returns the currencies of transactions with no rate to the main currency; their amounts are summed unconverted."""
+    cursor = get_db_connection().execute(f'''
+        SELECT DISTINCT t.currency FROM transactions t
+        WHERE t.currency IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM fx_rates WHERE from_currency = t.currency AND to_currency = {MAIN_CURRENCY}
+        )
+        ORDER BY 1
+    ''')
+    return [row[0] for row in cursor.fetchall()]
+
+@timed
+def add_category(name, parent_id):
+    """Adds a new category to the database."""
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO categories (name, parent_id) VALUES (?, ?)",
+            (name, parent_id)
+        )
+    invalidate_category_tree()
+
+@timed
 def delete_category(category_id):
     """Deletes a category from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # First, update transactions that use this category
-    cursor.execute("UPDATE transactions SET category = 'Uncategorized' WHERE category = (SELECT name FROM categories WHERE id = ?)", (category_id,))
-    # Second, update subcategories to have no parent
-    cursor.execute("UPDATE categories SET parent_id = NULL WHERE parent_id = ?", (category_id,))
-    # Finally, delete the category
-    cursor.execute("DELETE FROM categories WHERE id = ?", (category_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        # First, leave transactions that use this category uncategorized
+        conn.execute("UPDATE transactions SET category_id = NULL WHERE category_id = ?", (category_id,))
+        # Second, update subcategories to have no parent
+        conn.execute("UPDATE categories SET parent_id = NULL WHERE parent_id = ?", (category_id,))
+        # Rules assigning the category go with it
+        conn.execute("DELETE FROM categorization_rules WHERE category_id = ?", (category_id,))
+        conn.execute("UPDATE recurring_rules SET category_id = NULL WHERE category_id = ?", (category_id,))
+        # Finally, delete the category
+        conn.execute("DELETE FROM categories WHERE id = ?", (category_id,))
+    invalidate_category_tree()
@@ -0,0 +1,69 @@
+import hashlib
+from collections import OrderedDict
+
+# Distinct transaction contents FingerprintCounter remembers; statements
+# are sorted by date, so copies of a transaction are always close together
+COUNTER_WINDOW = 100000
+
+
+def normalize_account(account):
+    """Drops spaces and case from an account number, e.g. an IBAN as printed on a statement."""
+    return ''.join((account or '').split()).upper()
+
+
+def _digest(date, cents, description, account, occurrence):
+    """Hashes a transaction whose description and account are already normalized."""
+    key = f"{date}|{cents}|{description}|{account}|{occurrence}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def fingerprint(date, cents, description, account=None, occurrence=1):
+    """Returns the content fingerprint of a transaction as a hex string.
+
+    The fingerprint is a hash of the ISO date, the amount in cents, the
+    description without case and repeated whitespace, the account when
+    known and the occurrence number given by FingerprintCounter.
+    """
+    return _digest(date, cents, ' '.join(description.casefold().split()), normalize_account(account), occurrence)
+
+
+class FingerprintCounter:
+    """Hands out fingerprints, numbering transactions with identical content.
+
+    Two coffees for the same price on the same day are two transactions.
+    The n-th identical copy gets occurrence n, and gets it again when the
+    same statement, or one overlapping it, is imported again, so only real
+    re-imports collide.
+
+    Only the `window` most recently seen contents are remembered, so the
+    memory used does not grow with the size of the import.
+    """
+
+    def __init__(self, window=COUNTER_WINDOW):
+        self.window = window
+        self._occurrences = OrderedDict()
+
+    def __call__(self, date, cents, description, account=None):
+        return self.many([(date, cents, description, account)])[0]
+
+    def many(self, transactions):
+        """Returns the fingerprints of a list of (date, cents, description, account) tuples.
+
+        Equivalent to calling the counter on each tuple in turn, but each
+        distinct account is normalized once per call.
+        """
+        occurrences = self._occurrences
+        window = self.window
+        accounts = {}
+        fingerprints = []
+        for date, cents, description, account in transactions:
+            normalized = accounts.get(account)
+            if normalized is None:
+                normalized = accounts[account] = normalize_account(account)
+            key = (date, cents, ' '.join(description.casefold().split()), normalized)
+            occurrence = occurrences.pop(key, 0) + 1
+            occurrences[key] = occurrence
+            if len(occurrences) > window:
+                occurrences.popitem(last=False)
+            fingerprints.append(_digest(*key, occurrence))
+        return fingerprints
@@ -0,0 +1,439 @@
+"""Versioned schema migrations.
+
+The schema version of a database is stored in the `schema_version` setting.
+At startup every step newer than that version is applied in order, inside
+the same transaction as the rest of the initialization, so a database is
+never left half-migrated. Released steps must never be edited or reordered;
+schema changes are made by appending a new step.
+"""
+
+from .fingerprint import FingerprintCounter
+
+# Key of the month a transaction belongs to ('YYYY-MM'). Queries have to use
+# the exact same expression to be served by the index on it.
+MONTH_KEY = "substr(date, 1, 7)"
+
+# Days since 1970-01-01 of a date column, the key of the daily_totals rollup
+# and of the date column of columnar exports
+DAY_KEY = "CAST(julianday({date}) - 2440587.5 AS INTEGER)"
+
+# Rows fingerprinted at a time when migration 5 fills in the fingerprints
+FINGERPRINT_BATCH = 10000
+
+# Main currency until one is set in the settings; transactions in the main
+# currency have currency NULL
+DEFAULT_CURRENCY = 'PLN'
+MAIN_CURRENCY = f"COALESCE((SELECT value FROM settings WHERE key = 'main_currency'), '{DEFAULT_CURRENCY}')"
+
+# Amount of a transaction `{row}` in cents of the main currency. Other
+# currencies are converted at the rate of the transaction date or the
+# nearest earlier one, each a single seek on the fx_rates primary key;
+# dates before the first rate take the oldest one and amounts without any
+# rate for their currency are counted unconverted.
+_FX_PAIR = f"from_currency = {{row}}.currency AND to_currency = {MAIN_CURRENCY}"
+MAIN_AMOUNT = (
+    "CASE WHEN {row}.currency IS NULL THEN {row}.amount ELSE CAST(round({row}.amount * COALESCE("
+    f"(SELECT rate FROM fx_rates WHERE {_FX_PAIR} AND date <= {{row}}.date ORDER BY date DESC LIMIT 1), "
+    f"(SELECT rate FROM fx_rates WHERE {_FX_PAIR} ORDER BY date LIMIT 1), "
+    "1.0)) AS INTEGER) END"
+)
+
+
+def create_description_triggers(cursor):
+    """Creates the triggers keeping the transactions_fts index in sync with transactions."""
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts (rowid, description) VALUES (new.id, new.description);
+        END;
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        END;
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            INSERT INTO transactions_fts (rowid, description) VALUES (new.id, new.description);
+        END;
+    ''')
+
+
+def _add_transaction_indexes(cursor):
+    """Adds indexes for date ordering, category lookups and monthly figures."""
+    # Keyset pagination and date ordering of the transaction list
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date_id ON transactions (date, id)")
+    # Category filters and category reassignment in delete_category
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category, date)")
+    # Monthly totals, covering the category and amount so the table is not read
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_transactions_month ON transactions ({MONTH_KEY}, category, amount)"
+    )
+
+
+def _monthly_totals_add(row, category_id, cents):
+    year = f"CAST(substr({row}.date, 1, 4) AS INTEGER)"
+    month = f"CAST(substr({row}.date, 6, 2) AS INTEGER)"
+    return f'''
+        INSERT INTO monthly_totals (year, month, category_id, total_cents, count)
+        VALUES ({year}, {month}, {category_id.format(row=row)}, {cents.format(row=row)}, 1)
+        ON CONFLICT (year, month, category_id) DO UPDATE
+        SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+    '''
+
+
+def _monthly_totals_subtract(row, category_id, cents):
+    year = f"CAST(substr({row}.date, 1, 4) AS INTEGER)"
+    month = f"CAST(substr({row}.date, 6, 2) AS INTEGER)"
+    key = f"year = {year} AND month = {month} AND category_id = {category_id.format(row=row)}"
+    return f'''
+        UPDATE monthly_totals SET total_cents = total_cents - {cents.format(row=row)}, count = count - 1 WHERE {key};
+        DELETE FROM monthly_totals WHERE {key} AND count <= 0;
+    '''
+
+
+def _create_monthly_totals_triggers(cursor, category_id, cents, category_column, update_columns='date, amount'):
+    """Creates the triggers keeping monthly_totals exact.
+
+    `category_id` and `cents` are SQL expression templates evaluated for the
+    `{row}` being added or removed; `category_column` is the transactions
+    column whose changes move a row between categories and `update_columns`
+    the other columns whose changes alter the totals.
+    """
+    for name in ('insert', 'delete', 'update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS monthly_totals_{name}")
+    cursor.execute(f'''
+        CREATE TRIGGER monthly_totals_insert AFTER INSERT ON transactions BEGIN
+            {_monthly_totals_add('new', category_id, cents)}
+        END;
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER monthly_totals_delete AFTER DELETE ON transactions BEGIN
+            {_monthly_totals_subtract('old', category_id, cents)}
+        END;
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER monthly_totals_update AFTER UPDATE OF {update_columns}, {category_column} ON transactions BEGIN
+            {_monthly_totals_subtract('old', category_id, cents)}
+            {_monthly_totals_add('new', category_id, cents)}
+        END;
+    ''')
+
+
+def _add_monthly_totals(cursor):
+    """Adds the monthly_totals rollup and the triggers keeping it exact."""
+    cursor.execute('''
+        CREATE TABLE monthly_totals (
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (year, month, category_id)
+        ) WITHOUT ROWID;
+    ''')
+    _create_monthly_totals_triggers(
+        cursor,
+        # Transactions whose category name is not in the categories table are counted under 0
+        category_id="COALESCE((SELECT id FROM categories WHERE name = {row}.category), 0)",
+        cents="CAST(round({row}.amount * 100) AS INTEGER)",
+        category_column='category',
+    )
+    # Fill the rollup from the existing rows
+    cursor.execute('''
+        INSERT INTO monthly_totals (year, month, category_id, total_cents, count)
+        SELECT CAST(substr(t.date, 1, 4) AS INTEGER), CAST(substr(t.date, 6, 2) AS INTEGER),
+               COALESCE(c.id, 0), SUM(CAST(round(t.amount * 100) AS INTEGER)), COUNT(*)
+        FROM transactions t LEFT JOIN categories c ON c.name = t.category
+        GROUP BY 1, 2, 3
+    ''')
+
+
+def _rebuild_table(cursor, table, create_sql, columns, select_columns):
+    """Recreates a table with a new definition, copying its rows over.
+
+    SQLite cannot change a column's type in place. Dropping the old table
+    also drops its indexes and triggers, which the caller recreates.
+    """
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    sequence = cursor.fetchone()
+    cursor.execute(create_sql.format(table=f"{table}_new"))
+    cursor.execute(f"INSERT INTO {table}_new ({columns}) SELECT {select_columns} FROM {table}")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    if sequence is not None:
+        # Keep AUTOINCREMENT from reusing ids of deleted rows
+        cursor.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (sequence[0], table))
+
+
+def _convert_amounts_to_cents(cursor):
+    """Stores transaction and budget amounts as integer cents instead of REAL."""
+    _rebuild_table(
+        cursor, 'transactions',
+        '''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                description TEXT NOT NULL,
+                amount INTEGER NOT NULL,
+                category TEXT NOT NULL
+            );
+        ''',
+        'id, date, description, amount, category',
+        'id, date, description, CAST(round(amount * 100) AS INTEGER), category',
+    )
+    _rebuild_table(
+        cursor, 'budgets',
+        '''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                amount INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                year INTEGER NOT NULL,
+                UNIQUE(month, year)
+            );
+        ''',
+        'id, amount, month, year',
+        'id, CAST(round(amount * 100) AS INTEGER), month, year',
+    )
+    # Row ids are kept, so the FTS index stays valid; only its triggers are gone
+    create_description_triggers(cursor)
+    _add_transaction_indexes(cursor)
+    _create_monthly_totals_triggers(
+        cursor,
+        category_id="COALESCE((SELECT id FROM categories WHERE name = {row}.category), 0)",
+        cents="{row}.amount",
+        category_column='category',
+    )
+
+
+def _add_category_ids(cursor):
+    """Replaces the transaction category name with a category_id foreign key."""
+    # Names typed before they existed as categories become categories of their own
+    cursor.execute('''
+        INSERT OR IGNORE INTO categories (name, parent_id)
+        SELECT DISTINCT category, NULL FROM transactions
+        WHERE category <> 'Uncategorized' AND category NOT IN (SELECT name FROM categories)
+    ''')
+    _rebuild_table(
+        cursor, 'transactions',
+        '''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                description TEXT NOT NULL,
+                amount INTEGER NOT NULL,
+                category_id INTEGER REFERENCES categories (id)
+            );
+        ''',
+        'id, date, description, amount, category_id',
+        # 'Uncategorized' is not a category, it becomes NULL
+        'id, date, description, amount, (SELECT id FROM categories WHERE name = transactions.category)',
+    )
+    create_description_triggers(cursor)
+    cursor.execute("CREATE INDEX idx_transactions_date_id ON transactions (date, id)")
+    cursor.execute("CREATE INDEX idx_transactions_category_date ON transactions (category_id, date)")
+    cursor.execute(f"CREATE INDEX idx_transactions_month ON transactions ({MONTH_KEY}, category_id, amount)")
+    _create_monthly_totals_triggers(
+        cursor,
+        category_id="COALESCE({row}.category_id, 0)",
+        cents="{row}.amount",
+        category_column='category_id',
+    )
+    # Rows counted under 0 may now have a category of their own
+    cursor.execute("DELETE FROM monthly_totals")
+    cursor.execute(f'''
+        INSERT INTO monthly_totals (year, month, category_id, total_cents, count)
+        SELECT CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER),
+               COALESCE(category_id, 0), SUM(amount), COUNT(*)
+        FROM transactions GROUP BY 1, 2, 3
+    ''')
+
+
+def _add_fingerprints(cursor):
+    """Adds the content fingerprint used to skip transactions that were already imported."""
+    cursor.execute("ALTER TABLE transactions ADD COLUMN fingerprint TEXT")
+    # Copies of a row are numbered in id order, the order they were entered or
+    # imported in; reading by date keeps them within the counter's window
+    counter = FingerprintCounter()
+    rows = cursor.connection.execute("SELECT id, date, amount, description FROM transactions ORDER BY date, id")
+    while True:
+        batch = rows.fetchmany(FINGERPRINT_BATCH)
+        if not batch:
+            break
+        cursor.executemany(
+            "UPDATE transactions SET fingerprint = ? WHERE id = ?",
+            [(counter(row['date'], row['amount'], row['description']), row['id']) for row in batch]
+        )
+    # NULL fingerprints (manually added rows) never collide
+    cursor.execute("CREATE UNIQUE INDEX idx_transactions_fingerprint ON transactions (fingerprint)")
+    # Blocked candidate search of the fuzzy duplicate check: same amount, nearby dates
+    cursor.execute("CREATE INDEX idx_transactions_amount_date ON transactions (amount, date)")
+
+
+def _add_categorization_rules(cursor):
+    """Adds the rules that categorize transactions automatically."""
+    # A rule matches a keyword in the description, a regular expression or
+    # an amount range (cents, either end may be open); of all matching rules
+    # the one with the highest priority wins, the oldest one on ties.
+    cursor.execute('''
+        CREATE TABLE categorization_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_type TEXT NOT NULL CHECK (match_type IN ('keyword', 'regex', 'amount')),
+            pattern TEXT,
+            min_amount INTEGER,
+            max_amount INTEGER,
+            category_id INTEGER NOT NULL REFERENCES categories (id),
+            priority INTEGER NOT NULL DEFAULT 0
+        );
+    ''')
+
+
+def _add_recurring_rules(cursor):
+    """Adds the rules of transactions repeating on a schedule, like rent or salary."""
+    # `frequency` is 'monthly' on day `day` (clamped to shorter months),
+    # 'weekly' on the weekday of start_date, or 'last_business_day' of the
+    # month, every `interval` months or weeks counted from start_date.
+    # next_date is the high-water mark: every occurrence before it has been
+    # posted, so the scheduler starts there; NULL once the rule has ended.
+    cursor.execute('''
+        CREATE TABLE recurring_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            category_id INTEGER REFERENCES categories (id),
+            frequency TEXT NOT NULL CHECK (frequency IN ('monthly', 'weekly', 'last_business_day')),
+            interval INTEGER NOT NULL DEFAULT 1 CHECK (interval >= 1),
+            day INTEGER CHECK (day BETWEEN 1 AND 31),
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_date TEXT
+        );
+    ''')
+    # Finds the due rules without reading the others
+    cursor.execute("CREATE INDEX idx_recurring_rules_next_date ON recurring_rules (next_date)")
+
+
+def _daily_totals_add(row, cents='{row}.amount'):
+    return f'''
+        INSERT INTO daily_totals (day, category_id, total_cents, count)
+        VALUES ({DAY_KEY.format(date=f'{row}.date')}, COALESCE({row}.category_id, 0), {cents.format(row=row)}, 1)
+        ON CONFLICT (day, category_id) DO UPDATE
+        SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+    '''
+
+
+def _daily_totals_subtract(row, cents='{row}.amount'):
+    key = f"day = {DAY_KEY.format(date=f'{row}.date')} AND category_id = COALESCE({row}.category_id, 0)"
+    return f'''
+        UPDATE daily_totals SET total_cents = total_cents - {cents.format(row=row)}, count = count - 1 WHERE {key};
+        DELETE FROM daily_totals WHERE {key} AND count <= 0;
+    '''
+
+
+def _create_daily_totals_triggers(cursor, cents='{row}.amount', update_columns='date, amount, category_id'):
+    """Creates the triggers keeping daily_totals exact; `cents` is an expression template like in monthly_totals."""
+    for name in ('insert', 'delete', 'update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS daily_totals_{name}")
+    cursor.execute(f'''
+        CREATE TRIGGER daily_totals_insert AFTER INSERT ON transactions BEGIN
+            {_daily_totals_add('new', cents)}
+        END;
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER daily_totals_delete AFTER DELETE ON transactions BEGIN
+            {_daily_totals_subtract('old', cents)}
+        END;
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER daily_totals_update AFTER UPDATE OF {update_columns} ON transactions BEGIN
+            {_daily_totals_subtract('old', cents)}
+            {_daily_totals_add('new', cents)}
+        END;
+    ''')
+
+
+def _add_daily_totals(cursor):
+    """Adds the daily_totals rollup read by the analytics, and the triggers keeping it exact."""
+    # One row per day and category (0 for uncategorized): a few hundred
+    # thousand rows at most, however long the ledger
+    cursor.execute('''
+        CREATE TABLE daily_totals (
+            day INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, category_id)
+        ) WITHOUT ROWID;
+    ''')
+    _create_daily_totals_triggers(cursor)
+    cursor.execute(f'''
+        INSERT INTO daily_totals (day, category_id, total_cents, count)
+        SELECT {DAY_KEY.format(date='date')}, COALESCE(category_id, 0), SUM(amount), COUNT(*)
+        FROM transactions GROUP BY 1, 2
+    ''')
+
+
+def _add_currencies(cursor):
+    """Adds the transaction currency and the fx_rates table; the rollups sum amounts in the main currency."""
+    # NULL is the main currency, so a ledger kept in one currency never converts anything
+    cursor.execute("ALTER TABLE transactions ADD COLUMN currency TEXT")
+    # Rows in other currencies only, for refreshing their rollup rows when rates change
+    cursor.execute("CREATE INDEX idx_transactions_currency ON transactions (currency, date) WHERE currency IS NOT NULL")
+    # 1 unit of from_currency is worth `rate` units of to_currency from `date`
+    # on; the primary key finds the rate in force on a date with one seek
+    cursor.execute('''
+        CREATE TABLE fx_rates (
+            date TEXT NOT NULL,
+            from_currency TEXT NOT NULL,
+            to_currency TEXT NOT NULL,
+            rate REAL NOT NULL CHECK (rate > 0),
+            PRIMARY KEY (from_currency, to_currency, date)
+        ) WITHOUT ROWID;
+    ''')
+    _create_monthly_totals_triggers(
+        cursor,
+        category_id="COALESCE({row}.category_id, 0)",
+        cents=MAIN_AMOUNT,
+        category_column='category_id',
+        update_columns='date, amount, currency',
+    )
+    _create_daily_totals_triggers(cursor, cents=MAIN_AMOUNT, update_columns='date, amount, currency, category_id')
+
+
+# Ordered (version, description, step) entries
+MIGRATIONS = [
+    (1, "Add indexes on transaction dates and categories", _add_transaction_indexes),
+    (2, "Add the monthly_totals rollup", _add_monthly_totals),
+    (3, "Store amounts as integer cents", _convert_amounts_to_cents),
+    (4, "Reference categories by id from transactions", _add_category_ids),
+    (5, "Add transaction fingerprints for duplicate detection", _add_fingerprints),
+    (6, "Add categorization rules", _add_categorization_rules),
+    (7, "Add recurring transaction rules", _add_recurring_rules),
+    (8, "Add the daily_totals rollup", _add_daily_totals),
+    (9, "Add transaction currencies and exchange rates", _add_currencies),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor):
+    """Returns the schema version of the database, 0 for a database without one."""
+    cursor.execute("SELECT value FROM settings WHERE key = 'schema_version'")
+    result = cursor.fetchone()
+    return int(result[0]) if result else 0
+
+
+def migrate(cursor):
+    """Applies all pending migrations and returns the resulting schema version."""
+    version = get_schema_version(cursor)
+    for step_version, _description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        step(cursor)
+        cursor.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('schema_version', ?)",
+            (str(step_version),)
+        )
+        version = step_version
+    return version
@@ -0,0 +1,124 @@
+"""Runs database queries away from the GUI thread.
+
+The worker owns a single thread, and with it a SQLite connection of its
+own, since the connection manager hands out one connection per thread.
+WAL mode lets it read while the GUI thread writes.
+
+Requests are submitted under a key such as 'transactions' or 'chart'.
+Submitting the same key again supersedes the earlier request: it is
+skipped if it has not started yet, and interrupted and its result dropped
+otherwise, so only the result of the latest request of a key is
+delivered. Results come back through a queued signal, so callbacks run in
+the GUI thread.
+
+With instrumentation enabled, the time from submitting a request to the
+end of its callback is recorded as "worker.<key>".
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, Signal
+from app import instrumentation
+from app.database import database as db
+
+
+class DatabaseWorker(QObject):
+    """Single background thread running database requests in submission order."""
+
+    # Emitted with the key and the exception when a request fails
+    failed = Signal(str, object)
+    # Emitted when the last awaited result has been delivered
+    idle = Signal()
+    # Internal: key, generation, success flag and result, crossing to the GUI thread
+    _done = Signal(str, int, bool, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-worker')
+        # Latest generation submitted per key and the callback waiting for it
+        self._generations = {}
+        self._callbacks = {}
+        # Submission time per key, kept while instrumentation is enabled
+        self._submitted = {}
+        # (key, generation) of the request being run, and the worker's connection
+        self._running = None
+        self._connection = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._done.connect(self._deliver)
+
+    def submit(self, key, callback, function, *args, **kwargs):
+        """Runs function(*args, **kwargs) in the worker and passes the result to callback.
+
+        Any earlier request under the same key that is still queued or
+        running is superseded. Requests made after shutdown() are ignored.
+        """
+        if self._closed:
+            return
+        generation = self._supersede(key)
+        self._callbacks[key] = callback
+        if instrumentation.is_enabled():
+            self._submitted[key] = time.perf_counter()
+        self._executor.submit(self._run, key, generation, function, args, kwargs)
+
+    def cancel(self, key):
+        """Supersedes the pending request of a key without submitting a new one."""
+        if self._callbacks.pop(key, None) is not None:
+            self._supersede(key)
+
+    def _supersede(self, key):
+        """Starts a new generation of a key, interrupting its running query; returns the generation."""
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            if self._running is not None and self._running[0] == key:
+                # Aborts the statement with an "interrupted" error, dropped in _deliver
+                self._connection.interrupt()
+        return generation
+
+    def pending(self, *keys):
+        """Checks whether a result is still awaited for any of the keys."""
+        return any(key in self._callbacks for key in keys)
+
+    def _run(self, key, generation, function, args, kwargs):
+        self._connection = db.get_db_connection()
+        with self._lock:
+            if self._generations.get(key) != generation:
+                return  # superseded while queued
+            self._running = (key, generation)
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            self._done.emit(key, generation, False, error)
+        else:
+            self._done.emit(key, generation, True, result)
+        finally:
+            with self._lock:
+                self._running = None
+
+    def _deliver(self, key, generation, ok, result):
+        if self._generations.get(key) != generation:
+            return  # superseded while running
+        callback = self._callbacks.pop(key)
+        try:
+            if ok:
+                callback(result)
+            else:
+                self.failed.emit(key, result)
+        finally:
+            # A failing callback must not leave the key looking busy
+            submitted = self._submitted.pop(key, None)
+            if submitted is not None:
+                instrumentation.record(f"worker.{key}", time.perf_counter() - submitted)
+            if not self._callbacks:
+                self.idle.emit()
+
+    def shutdown(self):
+        """Drops pending requests, waits for the running one and closes the worker's connection."""
+        if self._closed:
+            return
+        self._closed = True
+        for key in list(self._callbacks):
+            self.cancel(key)
+        self._executor.submit(db.close_connection)
+        self._executor.shutdown(wait=True)
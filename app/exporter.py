@@ -0,0 +1,259 @@
+"""Streaming export of transactions to CSV, JSON Lines and a columnar file.
+
+Rows are read with db.iter_transactions(), whose cursor hands them over in
+fetchmany() batches, and the description, category and date filters are
+part of its SQL query. Every format is written while the rows arrive, so
+exporting any number of transactions runs in constant memory.
+
+The columnar format stores the transactions in row groups. Within a group
+each column is one contiguous little-endian array:
+
+    id           int64   transaction id
+    date         int32   days since 1970-01-01
+    amount       int64   cents of the main currency, expenses positive
+    category_id  int32   0 for uncategorized
+    description  uint32 end offsets followed by the UTF-8 text
+
+A JSON footer describes the columns, the byte ranges of every chunk,
+the category names and the currency of the amounts, followed by the
+footer length and the magic bytes, like Parquet. ColumnarFile loads a
+column with a single read into an array.array (numpy.frombuffer works on
+the same bytes), without parsing any rows.
+"""
+import csv
+import itertools
+import json
+import struct
+import sys
+from array import array
+from datetime import date
+from app.database import database as db
+from app.database.migrations import DEFAULT_CURRENCY
+from app.instrumentation import timed
+from app.models.money import Money
+
+FORMATS = ('csv', 'jsonl', 'columnar')
+TEXT_FORMATS = ('csv', 'jsonl')
+
+TRANSACTION_FIELDS = ('id', 'date', 'description', 'amount', 'currency', 'category')
+
+# Rows fetched from SQLite at a time
+FETCH_SIZE = 10000
+
+# Rows per row group of a columnar file; bounds the memory used by the writer
+ROW_GROUP_SIZE = 65536
+
+COLUMNAR_MAGIC = b'FMCOL1\0\0'
+COLUMNAR_VERSION = 1
+_FOOTER_LENGTH = struct.Struct('<I')
+
+# Column name -> array type code and type name of the numeric columns
+COLUMN_TYPES = {
+    'id': ('q', 'int64'),
+    'date': ('i', 'int32'),
+    'amount': ('q', 'int64'),
+    'category_id': ('i', 'int32'),
+}
+COLUMNS = ('id', 'date', 'amount', 'category_id', 'description')
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+class ColumnarFormatError(ValueError):
+    """Raised for a file that is not a valid columnar export."""
+
+
+def write_rows(rows, fields, output_format, stream):
+    """Writes tuples of field values as CSV with a header or as JSON lines; returns the row count."""
+    # zip() stops at the end of `rows` without taking another number, so the
+    # counter's next value is the number of rows written
+    counter = itertools.count()
+    rows = (row for row, _ in zip(rows, counter))
+    if output_format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+        writer.writerows(rows)
+    else:
+        dumps = json.dumps
+        stream.writelines(dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n' for row in rows)
+    return next(counter)
+
+
+def transaction_values(rows):
+    """Turns transaction rows into TRANSACTION_FIELDS tuples, amounts as decimal strings in their own currency."""
+    main_currency = db.get_main_currency()
+    for row in rows:
+        yield (row['id'], row['date'], row['description'], str(Money(row['amount'])),
+               row['currency'] or main_currency, row['category'])
+
+
+def iter_transactions(text_filter=None, categories=None, date_range=None):
+    """Yields the transactions to export, newest first, filtered in SQL."""
+    return db.iter_transactions(text_filter, categories, FETCH_SIZE, date_range)
+
+
+@timed
+def export_transactions(path, file_format, text_filter=None, categories=None, date_range=None):
+    """Exports the matching transactions to a file and returns their number.
+
+    `categories` is a list of category ids and `date_range` an inclusive
+    (start, end) pair of ISO dates.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Nieobsługiwany format eksportu: {file_format}")
+    rows = iter_transactions(text_filter, categories, date_range)
+    if file_format == 'columnar':
+        with open(path, 'wb') as stream:
+            return write_columnar(rows, stream)
+    with open(path, 'w', encoding='utf-8', newline='') as stream:
+        return write_rows(transaction_values(rows), TRANSACTION_FIELDS, file_format, stream)
+
+
+# --- Columnar files -----------------------------------------------------------
+
+def _array_bytes(values):
+    if _BIG_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_columnar(rows, stream, row_group_size=ROW_GROUP_SIZE):
+    """Writes transaction rows to a binary stream as a columnar file; returns the row count."""
+    stream.write(COLUMNAR_MAGIC)
+    position = len(COLUMNAR_MAGIC)
+    row_groups = []
+    category_names = {}
+    day_numbers = {}
+    count = 0
+
+    def new_group():
+        group = {name: array(type_code) for name, (type_code, _type) in COLUMN_TYPES.items()}
+        group['description'] = array('I')
+        return group, bytearray()
+
+    def flush(group, text):
+        nonlocal position
+        chunks = {}
+        for name in COLUMNS:
+            data = _array_bytes(group[name])
+            if name == 'description':
+                data += text
+            stream.write(data)
+            chunks[name] = [position, len(data)]
+            position += len(data)
+        row_groups.append({'rows': len(group['id']), 'columns': chunks})
+
+    group, text = new_group()
+    for row in rows:
+        category_id = row['category_id'] or 0
+        if category_id not in category_names:
+            category_names[category_id] = row['category']
+        day = day_numbers.get(row['date'])
+        if day is None:
+            day = day_numbers[row['date']] = date.fromisoformat(row['date']).toordinal() - _EPOCH_ORDINAL
+        group['id'].append(row['id'])
+        group['date'].append(day)
+        group['amount'].append(row['main_amount'])
+        group['category_id'].append(category_id)
+        text += row['description'].encode('utf-8')
+        group['description'].append(len(text))
+        count += 1
+        if len(group['id']) == row_group_size:
+            flush(group, text)
+            group, text = new_group()
+    if group['id']:
+        flush(group, text)
+
+    footer = json.dumps({
+        'version': COLUMNAR_VERSION,
+        'rows': count,
+        'columns': [{'name': name, 'type': COLUMN_TYPES[name][1]} for name in COLUMNS if name in COLUMN_TYPES]
+                   + [{'name': 'description', 'type': 'utf8'}],
+        'categories': {str(category_id): name for category_id, name in category_names.items()},
+        'currency': db.get_main_currency(),
+        'row_groups': row_groups,
+    }, ensure_ascii=False).encode('utf-8')
+    stream.write(footer)
+    stream.write(_FOOTER_LENGTH.pack(len(footer)))
+    stream.write(COLUMNAR_MAGIC)
+    return count
+
+
+class ColumnarFile:
+    """Reads columns of a columnar export without parsing rows.
+
+    Numeric columns come back as array.array objects, descriptions as a
+    list of strings. `categories` maps category ids (0 for uncategorized)
+    to names and `currency` is the currency of the amounts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as stream:
+            if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+                raise ColumnarFormatError(f"Nieprawidłowy plik kolumnowy: {path}")
+            trailer_size = _FOOTER_LENGTH.size + len(COLUMNAR_MAGIC)
+            size = stream.seek(0, 2)
+            if size < len(COLUMNAR_MAGIC) + trailer_size:
+                raise ColumnarFormatError(f"Niekompletny plik kolumnowy: {path}")
+            stream.seek(-trailer_size, 2)
+            trailer = stream.read(trailer_size)
+            if trailer[_FOOTER_LENGTH.size:] != COLUMNAR_MAGIC:
+                raise ColumnarFormatError(f"Niekompletny plik kolumnowy: {path}")
+            footer_length, = _FOOTER_LENGTH.unpack(trailer[:_FOOTER_LENGTH.size])
+            if footer_length > size - len(COLUMNAR_MAGIC) - trailer_size:
+                raise ColumnarFormatError(f"Niekompletny plik kolumnowy: {path}")
+            stream.seek(-trailer_size - footer_length, 2)
+            footer = json.loads(stream.read(footer_length))
+        if footer['version'] != COLUMNAR_VERSION:
+            raise ColumnarFormatError(f"Nieobsługiwana wersja pliku kolumnowego: {footer['version']}")
+        self.rows = footer['rows']
+        self.row_groups = footer['row_groups']
+        self.categories = {int(category_id): name for category_id, name in footer['categories'].items()}
+        # Files written before amounts had currencies are in the default one
+        self.currency = footer.get('currency', DEFAULT_CURRENCY)
+
+    def column(self, name):
+        """Loads one column of every row group."""
+        if name not in COLUMNS:
+            raise KeyError(name)
+        if name == 'description':
+            values = []
+        else:
+            values = array(COLUMN_TYPES[name][0])
+        with open(self.path, 'rb') as stream:
+            for group in self.row_groups:
+                offset, length = group['columns'][name]
+                stream.seek(offset)
+                data = stream.read(length)
+                if name == 'description':
+                    values.extend(_decode_descriptions(data, group['rows']))
+                else:
+                    values.frombytes(data)
+        if _BIG_ENDIAN and name != 'description':
+            values.byteswap()
+        return values
+
+    def columns(self, names=COLUMNS):
+        return {name: self.column(name) for name in names}
+
+
+def _decode_descriptions(data, rows):
+    ends = array('I')
+    ends.frombytes(data[:rows * ends.itemsize])
+    if _BIG_ENDIAN:
+        ends.byteswap()
+    text = data[rows * ends.itemsize:]
+    start = 0
+    descriptions = []
+    for end in ends:
+        descriptions.append(text[start:end].decode('utf-8'))
+        start = end
+    return descriptions
+
+
+def days_to_iso(day):
+    """Converts a date column value back to an ISO date."""
+    return date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
@@ -0,0 +1,120 @@
+"""Import of exchange rates from local CSV files into the fx_rates table.
+
+A file has a header row and one rate per line, in the long format
+
+    date;from;to;rate
+    2025-01-02;EUR;PLN;4,2718
+
+The 'to' column may be left out, the rates are then to the main currency,
+which is what a table downloaded from a central bank usually holds. Dates
+are read like in bank exports (app.importer.parse_date) and rates may use
+a decimal comma. Rows are checked one by one; invalid rows are counted and
+reported instead of stopping the import.
+
+All rates of a file are stored with db.add_fx_rates() in one transaction,
+which also moves the rollups to the new rates, so the totals are never
+seen half converted.
+"""
+import csv
+import io
+import re
+from app.database import database as db
+from app.importer import MAX_ERRORS, detect_encoding, parse_date
+from app.instrumentation import timed
+
+# Header names recognized for each column
+COLUMN_ALIASES = {
+    'date': ('date', 'data', 'data kursu', 'effective date'),
+    'from': ('from', 'from_currency', 'currency', 'z', 'waluta', 'kod', 'kod waluty'),
+    'to': ('to', 'to_currency', 'do', 'waluta docelowa'),
+    'rate': ('rate', 'kurs', 'kurs średni', 'mid'),
+}
+
+_CURRENCY = re.compile(r'^[A-Z]{3}$')
+
+
+class RatesFormatError(ValueError):
+    """Raised when a file cannot be read as a table of exchange rates."""
+
+
+def parse_rate(text):
+    """Converts a rate like '4.2718' or '4,2718' to a positive float."""
+    try:
+        rate = float(text.strip().replace(' ', '').replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"Nieprawidłowy kurs: {text!r}") from None
+    if not rate > 0 or rate == float('inf'):
+        raise ValueError(f"Nieprawidłowy kurs: {text!r}")
+    return rate
+
+
+def parse_currency(text):
+    """Returns a three-letter currency code in upper case."""
+    code = text.strip().upper()
+    if not _CURRENCY.match(code):
+        raise ValueError(f"Nieprawidłowy kod waluty: {text!r}")
+    return code
+
+
+def _resolve_columns(header):
+    names = [name.strip().casefold() for name in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    missing = [field for field in ('date', 'from', 'rate') if field not in columns]
+    if missing:
+        raise RatesFormatError(f"Nie rozpoznano kolumn: {', '.join(missing)}.")
+    return columns
+
+
+def parse_rates(stream, main_currency, dayfirst=True, result=None):
+    """Yields (date, from_currency, to_currency, rate) tuples from a CSV stream.
+
+    Rows without a 'to' column are rates to `main_currency`. Invalid rows
+    are counted in `result`.
+    """
+    header_line = stream.readline()
+    delimiter = max(';,\t|', key=header_line.count)
+    columns = _resolve_columns(next(csv.reader([header_line], delimiter=delimiter), []))
+    to_column = columns.get('to')
+    width = max(columns.values()) + 1
+    for line_number, row in enumerate(csv.reader(stream, delimiter=delimiter), 2):
+        if not any(field.strip() for field in row):
+            continue
+        try:
+            if len(row) < width:
+                raise ValueError("Za mało kolumn")
+            source = parse_currency(row[columns['from']])
+            target = parse_currency(row[to_column]) if to_column is not None else main_currency
+            if source == target:
+                raise ValueError(f"Kurs waluty do niej samej: {source}")
+            yield (parse_date(row[columns['date']], dayfirst), source, target, parse_rate(row[columns['rate']]))
+        except ValueError as error:
+            if result is not None:
+                result['invalid'] += 1
+                if len(result['errors']) < MAX_ERRORS:
+                    result['errors'].append((line_number, str(error)))
+
+
+@timed
+def import_rates(path, encoding=None, dayfirst=True):
+    """Imports the exchange rates of a CSV file.
+
+    Returns a dictionary with the number of 'imported' and 'invalid' rows
+    and the first (line number, message) 'errors'.
+    """
+    result = {'imported': 0, 'invalid': 0, 'errors': []}
+    with open(path, 'rb') as raw:
+        head = raw.read(65536)
+        raw.seek(0)
+        stream = io.TextIOWrapper(raw, encoding=encoding or detect_encoding(head), newline='')
+        try:
+            rates = list(parse_rates(stream, db.get_main_currency(), dayfirst, result))
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise RatesFormatError(f"Nie można odczytać pliku: {error}") from error
+    if rates:
+        result['imported'] = db.add_fx_rates(rates)
+    return result
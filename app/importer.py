@@ -0,0 +1,569 @@
+"""Bulk import of transactions from CSV files and bank statements.
+
+Files are read as a stream: parsers are generators yielding one record per
+transaction, so memory use does not depend on the file size. Records are
+normalized (ISO dates, integer cents, single-spaced descriptions) and
+inserted with executemany in large batches, all inside one transaction, so
+a failed import leaves the ledger untouched.
+
+Supported formats are CSV with a header row, MT940 (.sta/.mt940) and OFX.
+
+Every imported row gets a content fingerprint (see
+app.database.fingerprint); rows already in the ledger are skipped as
+duplicates, so statements can be imported again or overlap safely. An
+optional fuzzy check also skips rows resembling an existing transaction.
+"""
+import csv
+import html
+import io
+import os
+import re
+from datetime import date
+from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import islice
+from app import categorizer
+from app.database import database as db
+from app.database.fingerprint import FingerprintCounter
+from app.instrumentation import timed
+
+BATCH_SIZE = 10000
+
+# Errors kept in the result; invalid rows beyond that are only counted
+MAX_ERRORS = 100
+
+# Minimum SequenceMatcher ratio of two descriptions in the fuzzy duplicate check
+SIMILARITY = 0.6
+
+# Date window of the fuzzy duplicate check when it is turned on in the UI
+FUZZY_DAYS = 3
+
+FORMATS = ('csv', 'mt940', 'ofx')
+
+_EXTENSIONS = {
+    '.csv': 'csv',
+    '.sta': 'mt940',
+    '.mt940': 'mt940',
+    '.940': 'mt940',
+    '.ofx': 'ofx',
+    '.qfx': 'ofx',
+}
+
+# Header names recognized when a CSV file is imported without a column mapping
+COLUMN_ALIASES = {
+    'date': ('data', 'data operacji', 'data transakcji', 'data księgowania', 'data waluty',
+             'date', 'transaction date', 'booking date', 'posted date'),
+    'description': ('opis', 'opis operacji', 'tytuł', 'tytuł operacji', 'szczegóły', 'nazwa',
+                    'description', 'details', 'title', 'memo', 'payee'),
+    'amount': ('kwota', 'kwota operacji', 'kwota transakcji', 'wartość',
+               'amount', 'value'),
+    'category': ('kategoria', 'category'),
+    'currency': ('waluta', 'currency'),
+    'account': ('numer rachunku', 'rachunek', 'konto', 'account', 'account number'),
+}
+
+
+class ImportFormatError(ValueError):
+    """Raised when a file cannot be read as the requested format."""
+
+
+class ImportCancelled(Exception):
+    """Raised by a progress callback to abort an import; nothing is imported."""
+
+
+# --- Normalization ---------------------------------------------------------
+
+_DATE_PATTERNS = (
+    # 2024-01-31, 2024/01/31, 2024.01.31, optionally followed by a time
+    (re.compile(r'(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})'), ('y', 'm', 'd')),
+    # 31.01.2024, 31-01-2024, 31/01/2024 (01/31/2024 with dayfirst=False)
+    (re.compile(r'(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})'), ('d', 'm', 'y')),
+    # 20240131, as in OFX timestamps
+    (re.compile(r'(\d{4})(\d{2})(\d{2})'), ('y', 'm', 'd')),
+)
+
+
+@lru_cache(maxsize=8192)
+def parse_date(text, dayfirst=True):
+    """Converts a date as written in bank exports to 'YYYY-MM-DD'.
+
+    Raises ValueError for text that is not a valid date. Results are cached,
+    since a ledger has far fewer distinct dates than rows.
+    """
+    text = text.strip()
+    for pattern, order in _DATE_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            parts = dict(zip(order, map(int, match.groups())))
+            if order[0] == 'd' and not dayfirst:
+                parts['d'], parts['m'] = parts['m'], parts['d']
+            return date(parts['y'], parts['m'], parts['d']).isoformat()
+    raise ValueError(f"Nieprawidłowa data: {text!r}")
+
+
+_AMOUNT_NOISE = re.compile(r"[^\d.,+\-()]")
+# Plain amounts such as '-12.50' or '1234,5', the usual case in CSV files, skip the general rules
+_PLAIN_AMOUNT = re.compile(r'(-?)(\d+)(?:[.,](\d\d?))?')
+
+
+def parse_amount(text):
+    """Converts an amount as written in bank exports to signed integer cents.
+
+    Accepts both '1 234,56' and '1,234.56' styles, currency symbols, a
+    leading or trailing minus and accounting parentheses. The last '.' or
+    ',' followed by one or two digits is the decimal separator; any other
+    separators group thousands.
+    """
+    plain = _PLAIN_AMOUNT.fullmatch(text)
+    if plain:
+        sign, whole, fraction = plain.groups()
+        cents = int(whole) * 100 + int((fraction or '').ljust(2, '0'))
+        return -cents if sign else cents
+    cleaned = _AMOUNT_NOISE.sub('', text)
+    negative = False
+    if cleaned.startswith('(') and cleaned.endswith(')'):
+        negative, cleaned = True, cleaned[1:-1]
+    if cleaned.endswith('-'):
+        negative, cleaned = True, cleaned[:-1]
+    if cleaned[:1] in ('+', '-'):
+        negative, cleaned = negative or cleaned[0] == '-', cleaned[1:]
+    separator = max(cleaned.rfind('.'), cleaned.rfind(','))
+    fraction = ''
+    if separator >= 0 and len(cleaned) - separator - 1 in (1, 2):
+        cleaned, fraction = cleaned[:separator], cleaned[separator + 1:]
+    whole = cleaned.replace('.', '').replace(',', '')
+    if not (whole + fraction).isdigit():
+        raise ValueError(f"Nieprawidłowa kwota: {text!r}")
+    cents = int(whole or 0) * 100 + int(fraction.ljust(2, '0'))
+    return -cents if negative else cents
+
+
+def normalize_description(text):
+    """Collapses whitespace, including line breaks from multi-line statement fields."""
+    return ' '.join(text.split())
+
+
+# --- Parsers -----------------------------------------------------------------
+#
+# Every parser takes a text stream and yields (line number, record) pairs,
+# where a record is a dictionary of raw 'date', 'amount' and 'description'
+# strings, the 'account' when the file names it and, for CSV files, an
+# optional 'category' name and 'currency' code.
+
+def _resolve_columns(header, mapping):
+    """Returns field -> column index for a CSV header, using aliases where unmapped."""
+    names = [name.strip().casefold() for name in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        column = (mapping or {}).get(field)
+        if isinstance(column, int):
+            columns[field] = column
+        elif column is not None:
+            if column.strip().casefold() not in names:
+                raise ImportFormatError(f"Brak kolumny {column!r} w pliku CSV.")
+            columns[field] = names.index(column.strip().casefold())
+        else:
+            for alias in aliases:
+                if alias in names:
+                    columns[field] = names.index(alias)
+                    break
+    missing = [field for field in ('date', 'description', 'amount') if field not in columns]
+    if missing:
+        raise ImportFormatError(f"Nie rozpoznano kolumn: {', '.join(missing)}.")
+    return columns
+
+
+def parse_csv(stream, mapping=None, delimiter=None):
+    """Parses a CSV file with a header row.
+
+    `mapping` maps the fields 'date', 'description', 'amount', 'category',
+    'currency' and 'account' to column names or indexes; unmapped fields
+    are found by their usual header names. The delimiter is detected from
+    the header line when not given.
+    """
+    header_line = stream.readline()
+    if delimiter is None:
+        delimiter = max(';,\t|', key=header_line.count)
+    header = next(csv.reader([header_line], delimiter=delimiter), [])
+    columns = _resolve_columns(header, mapping)
+    date_column = columns['date']
+    description_column = columns['description']
+    amount_column = columns['amount']
+    category_column = columns.get('category')
+    currency_column = columns.get('currency')
+    account_column = columns.get('account')
+    width = max(columns.values()) + 1
+    for line_number, row in enumerate(csv.reader(stream, delimiter=delimiter), 2):
+        if len(row) < width:
+            if any(field.strip() for field in row):
+                yield line_number, None  # reported as an invalid row
+            continue
+        record = {
+            'date': row[date_column],
+            'description': row[description_column],
+            'amount': row[amount_column],
+        }
+        if category_column is not None:
+            record['category'] = row[category_column]
+        if currency_column is not None:
+            record['currency'] = row[currency_column]
+        if account_column is not None:
+            record['account'] = row[account_column]
+        yield line_number, record
+
+
+# :61: value date (YYMMDD), optional entry date (MMDD), debit/credit mark,
+# optional funds code and the amount with a decimal comma
+_MT940_STATEMENT_LINE = re.compile(r'(\d{6})(\d{4})?(R?[CD])[A-Z]?(\d+(?:,\d*)?)')
+_MT940_TAG = re.compile(r':(\d{2}[A-Z]?):')
+# Structured :86: subfields, e.g. '~20' or '?20'; 20-29 hold the title, 32-33 the counterparty
+_MT940_SUBFIELD = re.compile(r'[~?^](\d{2})')
+_MT940_DESCRIPTION_SUBFIELDS = {str(number) for number in range(20, 30)} | {'32', '33'}
+
+
+def _mt940_description(lines):
+    text = ''.join(lines)
+    parts = _MT940_SUBFIELD.split(text)
+    if len(parts) == 1:
+        # Free text: the lines were wrapped at word boundaries
+        return ' '.join(lines)
+    # parts = [prefix, code, value, code, value, ...]
+    return ' '.join(value for code, value in zip(parts[1::2], parts[2::2])
+                    if code in _MT940_DESCRIPTION_SUBFIELDS)
+
+
+def parse_mt940(stream):
+    """Parses an MT940 statement, one record per :61: line with its :86: details."""
+    pending = None
+    tag = None
+    information = []
+    account = None
+
+    def finish():
+        if pending is None:
+            return None
+        line_number, record = pending
+        record['description'] = _mt940_description(information) or record['description']
+        return line_number, record
+
+    for line_number, line in enumerate(stream, 1):
+        line = line.rstrip('\r\n')
+        match = _MT940_TAG.match(line)
+        if match:
+            tag = match.group(1)
+            value = line[match.end():]
+            if tag == '61':
+                finished = finish()
+                if finished:
+                    yield finished
+                information = []
+                statement = _MT940_STATEMENT_LINE.match(value)
+                if statement is None:
+                    pending = None
+                    yield line_number, None
+                    continue
+                value_date, _entry_date, mark, amount = statement.groups()
+                year = int(value_date[:2])
+                year += 2000 if year < 70 else 1900
+                # Debits and reversed credits take money out of the account
+                sign = '-' if mark in ('D', 'RC') else ''
+                pending = (line_number, {
+                    'date': f"{year}-{value_date[2:4]}-{value_date[4:6]}",
+                    'amount': sign + amount,
+                    'description': value[statement.end():],
+                    'account': account,
+                })
+            elif tag == '86' and pending is not None:
+                information.append(value)
+            elif tag != '86':
+                if tag == '25':
+                    account = value
+                finished = finish()
+                if finished:
+                    yield finished
+                pending = None
+        elif tag == '86' and pending is not None and not line.startswith('-'):
+            information.append(line)
+    finished = finish()
+    if finished:
+        yield finished
+
+
+_OFX_ELEMENT = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def _ofx_elements(stream, chunk_size=65536):
+    """Yields (closing, tag, text) for the elements of an SGML or XML OFX file."""
+    buffer = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if chunk:
+            buffer += chunk
+            # Only complete elements are parsed; the rest waits for the next chunk
+            end = max(buffer.rfind('<'), 0)
+        else:
+            end = len(buffer)
+        for match in _OFX_ELEMENT.finditer(buffer, 0, end):
+            closing, tag, text = match.groups()
+            text = text.strip()
+            if '&' in text:
+                text = html.unescape(text)
+            yield closing == '/', tag.upper(), text
+        buffer = buffer[end:]
+        if not chunk:
+            break
+
+
+def parse_ofx(stream):
+    """Parses the STMTTRN transactions of an OFX (or QFX) file."""
+    record = None
+    number = 0
+    account = None
+    for closing, tag, text in _ofx_elements(stream):
+        if tag == 'ACCTID' and not closing:
+            account = text
+        elif tag == 'STMTTRN':
+            if closing and record is not None:
+                number += 1
+                names = [record.pop('NAME', ''), record.pop('MEMO', '')]
+                yield number, {
+                    'date': record.get('DTPOSTED', ''),
+                    'amount': record.get('TRNAMT', ''),
+                    'description': ' '.join(dict.fromkeys(name for name in names if name)),
+                    'account': account,
+                }
+                record = None
+            elif not closing:
+                record = {}
+        elif record is not None and not closing and text:
+            record[tag] = text
+
+
+_PARSERS = {
+    'csv': parse_csv,
+    'mt940': parse_mt940,
+    'ofx': parse_ofx,
+}
+
+
+def detect_format(path, head):
+    """Guesses the format of a file from its extension or its first bytes."""
+    file_format = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if file_format:
+        return file_format
+    text = head.lstrip()
+    if b'OFXHEADER' in text[:100] or text.startswith(b'<OFX') or b'<OFX>' in text:
+        return 'ofx'
+    if re.search(rb'^:(20|25|28C|60F|61):', text, re.MULTILINE):
+        return 'mt940'
+    return 'csv'
+
+
+def detect_encoding(head):
+    """Returns 'utf-8-sig' if the sample decodes as UTF-8, else the Polish Windows code page."""
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as error:
+        # A sample cut through a multi-byte character is still UTF-8
+        if error.start < len(head) - 3:
+            return 'cp1250'
+    return 'utf-8-sig'
+
+
+# --- Import ------------------------------------------------------------------
+
+def normalize_records(records, dayfirst=True, debits_only=False, account=None, rules=None, result=None,
+                      chunk_size=BATCH_SIZE):
+    """Turns parsed records into (date, description, cents, category_id, fingerprint, currency) rows.
+
+    Amounts are stored as positive expense values, in the record's
+    currency when it names one (None for the main currency); with
+    `debits_only` records with a positive (incoming) amount are skipped.
+    `account` is used in the fingerprint of records that do not name their
+    own. Records without a known category are categorized with the `rules`
+    RuleEngine, if given. Invalid records are counted in `result` instead
+    of stopping the import.
+
+    Records are parsed `chunk_size` at a time; each chunk is then
+    categorized and fingerprinted in one call.
+    """
+    if result is None:
+        result = new_result()
+    # app.fx reads its files with the helpers of this module
+    from app.fx import parse_currency
+    tree = db.get_category_tree()
+    categories = {}
+    main_currency = db.get_main_currency()
+    fingerprint = FingerprintCounter()
+    records = iter(records)
+    for block in iter(lambda: list(islice(records, chunk_size)), []):
+        chunk = []
+        for line_number, record in block:
+            try:
+                if record is None:
+                    raise ValueError("Nieprawidłowy wiersz")
+                cents = parse_amount(record['amount'])
+                transaction_date = parse_date(record['date'], dayfirst)
+                currency = record.get('currency')
+                currency = parse_currency(currency) if currency and currency.strip() else None
+            except ValueError as error:
+                result['invalid'] += 1
+                if len(result['errors']) < MAX_ERRORS:
+                    result['errors'].append((line_number, str(error)))
+                continue
+            if debits_only and cents >= 0:
+                result['skipped'] += 1
+                continue
+            category = record.get('category')
+            category_id = None
+            if category:
+                category_id = categories.get(category)
+                if category_id is None and category not in categories:
+                    category_id = categories[category] = tree.id_for_name(category.strip())
+            chunk.append((
+                transaction_date, normalize_description(record['description']), abs(cents), category_id,
+                record.get('account') or account, None if currency == main_currency else currency,
+            ))
+        category_ids = [row[3] for row in chunk]
+        if rules:
+            missing = [index for index, category_id in enumerate(category_ids) if category_id is None]
+            found = rules.categorize_many([(chunk[index][1], chunk[index][2]) for index in missing])
+            for index, category_id in zip(missing, found):
+                category_ids[index] = category_id
+        fingerprints = fingerprint.many([(row[0], row[2], row[1], row[4]) for row in chunk])
+        for row, category_id, row_fingerprint in zip(chunk, category_ids, fingerprints):
+            yield row[0], row[1], row[2], category_id, row_fingerprint, row[5]
+
+
+def new_result():
+    """Returns the counters filled in by an import."""
+    return {'imported': 0, 'skipped': 0, 'duplicates': 0, 'similar': 0, 'invalid': 0, 'errors': []}
+
+
+@lru_cache(maxsize=8192)
+def _ordinal(iso_date):
+    return date.fromisoformat(iso_date).toordinal()
+
+
+def _without_similar(batch, days, max_id):
+    """Drops the rows of a batch that resemble a transaction already in the ledger.
+
+    A row resembles a transaction with the same amount, a date at most
+    `days` apart and a description with a SequenceMatcher ratio of at least
+    SIMILARITY. Candidates are looked up per batch by amount and date
+    window, so each row is only compared with the few transactions in its
+    block instead of the whole ledger. Rows with an exact fingerprint match
+    are kept, to be counted as plain duplicates when inserted.
+    """
+    first = date.fromordinal(min(_ordinal(row[0]) for row in batch) - days).isoformat()
+    last = date.fromordinal(max(_ordinal(row[0]) for row in batch) + days).isoformat()
+    blocks = {}
+    for candidate in db.find_duplicate_candidates([row[2] for row in batch], (first, last), max_id):
+        blocks.setdefault(candidate['amount'], []).append((
+            _ordinal(candidate['date']),
+            ' '.join(candidate['description'].casefold().split()),
+            candidate['fingerprint'],
+        ))
+    known = {fingerprint for block in blocks.values() for _day, _description, fingerprint in block}
+    kept = []
+    for row in batch:
+        transaction_date, description, cents, _category_id, row_fingerprint, _currency = row
+        if row_fingerprint in known:
+            kept.append(row)
+            continue
+        day = _ordinal(transaction_date)
+        matcher = SequenceMatcher(None, b=description.casefold())
+        for candidate_day, candidate_description, _fingerprint in blocks.get(cents, ()):
+            if abs(candidate_day - day) > days:
+                continue
+            matcher.set_seq1(candidate_description)
+            if matcher.real_quick_ratio() >= SIMILARITY and matcher.quick_ratio() >= SIMILARITY \
+                    and matcher.ratio() >= SIMILARITY:
+                break
+        else:
+            kept.append(row)
+    return kept
+
+
+def import_rows(rows, batch_size=BATCH_SIZE, progress=None, fuzzy_days=None, result=None):
+    """Inserts normalized rows in batches inside a single transaction.
+
+    Rows whose fingerprint is already in the ledger are counted as
+    'duplicates'. With `fuzzy_days`, rows resembling a transaction that was
+    in the ledger before the import (same amount, date within that many
+    days, similar description) are counted as 'similar' and skipped too.
+    `progress` is called with the running count of imported rows after
+    every batch.
+    """
+    if result is None:
+        result = new_result()
+    with db.bulk_insert() as insert:
+        max_id = db.get_last_transaction_id()
+
+        def flush(batch):
+            if fuzzy_days is not None:
+                kept = _without_similar(batch, fuzzy_days, max_id)
+                result['similar'] += len(batch) - len(kept)
+                batch = kept
+            inserted = insert(batch) if batch else 0
+            result['imported'] += inserted
+            result['duplicates'] += len(batch) - inserted
+            if progress:
+                progress(result['imported'])
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    return result
+
+
+@timed
+def import_file(path, file_format=None, mapping=None, encoding=None, dayfirst=True,
+                debits_only=None, account=None, fuzzy_days=None, apply_rules=True,
+                batch_size=BATCH_SIZE, progress=None):
+    """Imports transactions from a CSV, MT940 or OFX file.
+
+    The format and encoding are detected when not given. `debits_only`
+    defaults to True for bank statements, where incoming payments are not
+    expenses, and to False for CSV files. `account` identifies the account
+    of files that do not name it. `fuzzy_days` enables the fuzzy duplicate
+    check (see import_rows). With `apply_rules`, rows without a category
+    are categorized by the categorization rules. `progress` is called with
+    (bytes read, file size, rows imported) after every batch.
+
+    Returns a dictionary with the number of 'imported', 'skipped' (incoming),
+    'duplicates', 'similar' and 'invalid' rows and the first
+    (line number, message) 'errors'.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as raw:
+        head = raw.read(65536)
+        raw.seek(0)
+        if file_format is None:
+            file_format = detect_format(path, head)
+        if file_format not in _PARSERS:
+            raise ImportFormatError(f"Nieobsługiwany format: {file_format}.")
+        if debits_only is None:
+            debits_only = file_format != 'csv'
+        stream = io.TextIOWrapper(raw, encoding=encoding or detect_encoding(head), newline='')
+        parser = _PARSERS[file_format]
+        records = parser(stream, mapping) if file_format == 'csv' else parser(stream)
+
+        result = new_result()
+        report = None
+        if progress:
+            # The binary file's position tells how much of it has been decoded
+            def report(imported):
+                progress(min(raw.tell(), size), size, imported)
+        try:
+            rules = categorizer.RuleEngine.from_database() if apply_rules else None
+            rows = normalize_records(records, dayfirst, debits_only, account, rules, result)
+            import_rows(rows, batch_size, report, fuzzy_days, result)
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise ImportFormatError(f"Nie można odczytać pliku: {error}") from error
+    return result
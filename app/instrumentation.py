@@ -0,0 +1,273 @@
+"""Opt-in timing of database calls, UI refreshes and SQL statements.
+
+Nothing is measured until enable() is called, e.g. by `main.py --profile`,
+`python -m app.cli --profile` or the FINANCE_PROFILE=1 environment
+variable. Until then a timed function costs one flag check per call.
+
+Once enabled:
+
+- functions decorated with @timed and blocks in `with span(name)` record
+  their duration under their name;
+- every connection opened afterwards traces its statements with
+  set_trace_callback. A statement is timed until the next one starts or
+  the span around it ends, so its time includes fetching its rows.
+  Statements are grouped with their literals replaced by '?';
+- a statement slower than the slow query threshold is logged with its
+  EXPLAIN QUERY PLAN, and plans scanning a whole table are counted.
+
+summary() gives the count, p50, p95 and maximum per operation over the
+last SAMPLES calls; report() writes it as a table.
+"""
+import functools
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+ENV_VARIABLE = 'FINANCE_PROFILE'
+
+# Durations kept per operation for the percentiles
+SAMPLES = 2000
+
+DEFAULT_SLOW_QUERY_MS = 50
+
+# Slow queries kept for the diagnostics panel
+SLOW_QUERIES = 50
+
+# Prefix of the names statements are recorded under
+SQL_PREFIX = 'sql: '
+
+_enabled = False
+_slow_query_seconds = DEFAULT_SLOW_QUERY_MS / 1000
+_log_path = None
+_lock = threading.Lock()
+# name -> [count, total seconds, deque of recent durations]
+_stats = {}
+# (time, milliseconds, statement, plan lines, full scan) of recent slow statements
+_slow_queries = deque(maxlen=SLOW_QUERIES)
+# Normalized statement -> its plan lines, so each statement is explained once
+_plans = {}
+_full_scans = 0
+_local = threading.local()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+# A plan step reading every row of a table, not through an index
+_FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(?!.*\b(?:USING|VIRTUAL TABLE)\b)')
+
+
+def enable(log_path=None, slow_query_ms=DEFAULT_SLOW_QUERY_MS):
+    """Starts recording; slow statements and their plans are appended to `log_path`."""
+    global _enabled, _slow_query_seconds, _log_path
+    _slow_query_seconds = slow_query_ms / 1000
+    _log_path = log_path
+    _enabled = True
+
+
+def enabled_by_environment():
+    return os.environ.get(ENV_VARIABLE, '') not in ('', '0')
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Drops everything recorded so far."""
+    global _full_scans
+    with _lock:
+        _stats.clear()
+        _slow_queries.clear()
+        _full_scans = 0
+
+
+def record(name, seconds):
+    with _lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = [0, 0.0, deque(maxlen=SAMPLES)]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2].append(seconds)
+
+
+@contextmanager
+def span(name):
+    """Records how long the enclosed block takes."""
+    if not _enabled:
+        yield
+        return
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _end_statement()
+        _local.depth -= 1
+        record(name, time.perf_counter() - start)
+        if _local.depth == 0:
+            _explain_slow_statements()
+
+
+def timed(function):
+    """Decorator recording the duration of every call under the function's name.
+
+    Module-level functions are named after their module, e.g.
+    "database.expenses_by_category", methods after their class. Qt slots
+    connected to signals with arguments need span() instead, since Qt
+    would pass those arguments to the wrapper.
+    """
+    name = function.__qualname__
+    if '.' not in name:
+        name = f"{function.__module__.rsplit('.', 1)[-1]}.{name}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        with span(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# --- SQL statements -----------------------------------------------------------
+
+def watch_connection(conn):
+    """Traces the statements of a new connection while recording is on."""
+    if _enabled:
+        conn.set_trace_callback(lambda statement: _start_statement(conn, statement))
+
+
+def normalize_statement(statement):
+    """Replaces the literals of a statement with '?' and collapses whitespace."""
+    return ' '.join(_LITERALS.sub('?', statement).split())
+
+
+def _start_statement(conn, statement):
+    # Statements run by triggers and virtual tables come with a "--" prefix;
+    # they are part of the statement being timed
+    if getattr(_local, 'explaining', False) or statement.startswith('--'):
+        return
+    _end_statement()
+    _local.statement = (conn, statement, time.perf_counter())
+
+
+def _end_statement():
+    current = getattr(_local, 'statement', None)
+    if current is None:
+        return
+    _local.statement = None
+    conn, statement, start = current
+    seconds = time.perf_counter() - start
+    normalized = normalize_statement(statement)
+    record(SQL_PREFIX + normalized, seconds)
+    if seconds >= _slow_query_seconds and normalized.split(' ', 1)[0].upper() in _EXPLAINABLE:
+        if not hasattr(_local, 'slow'):
+            _local.slow = []
+        # Explained when the current or the next span of the thread ends
+        _local.slow.append((conn, statement, normalized, seconds))
+
+
+def _explain_slow_statements():
+    """Logs the plans of the slow statements of a finished span.
+
+    Runs once the span is over, since a connection cannot run EXPLAIN from
+    inside its trace callback.
+    """
+    global _full_scans
+    slow = getattr(_local, 'slow', None)
+    if not slow:
+        return
+    _local.slow = []
+    for conn, statement, normalized, seconds in slow:
+        plan = _plans.get(normalized)
+        if plan is None:
+            _local.explaining = True
+            try:
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+            except sqlite3.Error as error:
+                plan = [f"(no plan: {error})"]
+            finally:
+                _local.explaining = False
+            _plans[normalized] = plan
+        full_scan = any(_FULL_SCAN.match(line) for line in plan)
+        entry = (datetime.now(), seconds * 1000, normalized, plan, full_scan)
+        with _lock:
+            _slow_queries.append(entry)
+            _full_scans += full_scan
+        _log_slow_query(entry)
+
+
+def _log_slow_query(entry):
+    if _log_path is None:
+        return
+    taken, milliseconds, statement, plan, full_scan = entry
+    lines = [f"{taken.isoformat(timespec='seconds')} slow query {milliseconds:.1f} ms"
+             + (" (full table scan)" if full_scan else "") + f": {statement}"]
+    lines.extend(f"    {line}" for line in plan)
+    with _lock, open(_log_path, 'a', encoding='utf-8') as stream:
+        stream.write('\n'.join(lines) + '\n')
+
+
+# --- Reports ------------------------------------------------------------------
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summary():
+    """Returns (name, count, total, p50, p95, max) per operation in seconds, slowest p95 first."""
+    with _lock:
+        entries = [(name, count, total, sorted(samples)) for name, (count, total, samples) in _stats.items()]
+    rows = [
+        (name, count, total, _percentile(ordered, 0.5), _percentile(ordered, 0.95), ordered[-1])
+        for name, count, total, ordered in entries
+    ]
+    rows.sort(key=lambda row: -row[4])
+    return rows
+
+
+def slow_queries():
+    """Returns the recent slow statements as (time, ms, statement, plan lines, full scan), newest last."""
+    with _lock:
+        return list(_slow_queries)
+
+
+def full_scan_count():
+    return _full_scans
+
+
+def report(stream=None, limit=None, slow_queries=False):
+    """Writes the summary as a table, by default to stderr, and optionally the slow queries with their plans."""
+    stream = sys.stderr if stream is None else stream
+    # The statement the calling thread ran last is still being timed
+    _end_statement()
+    _explain_slow_statements()
+    rows = summary()[:limit]
+    print(f"{'operation':<60} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}", file=stream)
+    for name, count, _total, p50, p95, maximum in rows:
+        if len(name) > 60:
+            name = name[:57] + '...'
+        print(f"{name:<60} {count:7d} {p50 * 1000:9.2f} {p95 * 1000:9.2f} {maximum * 1000:9.2f}", file=stream)
+    if _full_scans:
+        print(f"Slow queries scanning a whole table: {_full_scans}", file=stream)
+    if slow_queries:
+        with _lock:
+            entries = list(_slow_queries)
+        for _taken, milliseconds, statement, plan, full_scan in entries:
+            print(f"slow query {milliseconds:.1f} ms" + (" (full table scan)" if full_scan else "")
+                  + f": {statement}", file=stream)
+            for line in plan:
+                print(f"    {line}", file=stream)
+
+
+def write_report(path):
+    """Appends the summary to a file."""
+    with open(path, 'a', encoding='utf-8') as stream:
+        print(f"--- {datetime.now().isoformat(timespec='seconds')}", file=stream)
+        report(stream)
@@ -0,0 +1,100 @@
+class CategoryTree:
+    """The category hierarchy, built once from the rows of the categories table.
+
+    Parent, children and descendant lookups are dictionary reads, and the
+    flattened display order (depth-first, siblings sorted by name) is
+    computed up front. Any nesting depth is supported. The tree is a
+    snapshot: the database layer drops it whenever categories change.
+    """
+
+    def __init__(self, categories):
+        self.names = {}
+        self.parents = {}
+        self.children = {None: []}
+        for category in categories:
+            self.names[category['id']] = category['name']
+            self.parents[category['id']] = category['parent_id']
+        for category_id, parent_id in self.parents.items():
+            # A parent that no longer exists leaves the category at the top level
+            if parent_id not in self.names:
+                parent_id = self.parents[category_id] = None
+            self.children.setdefault(parent_id, []).append(category_id)
+        for siblings in self.children.values():
+            siblings.sort(key=lambda category_id: self.names[category_id])
+        self._ids_by_name = {name.casefold(): category_id for category_id, name in self.names.items()}
+
+        # (id, name, depth, has_children) in display order, and every category's subtree
+        self.display_order = []
+        self._subtrees = {}
+        self._roots = {}
+        self._walk()
+
+    def _walk(self):
+        """Fills the display order, subtrees and roots in one depth-first pass."""
+        stack = [(category_id, 0, category_id) for category_id in reversed(self.children[None])]
+        post_order = []
+        while stack:
+            category_id, depth, root_id = stack.pop()
+            if category_id in self._roots:
+                continue  # guards against cycles in parent_id
+            self._roots[category_id] = root_id
+            children = self.children.get(category_id, [])
+            self.display_order.append((category_id, self.names[category_id], depth, bool(children)))
+            post_order.append(category_id)
+            stack.extend((child_id, depth + 1, root_id) for child_id in reversed(children))
+        for category_id in reversed(post_order):
+            subtree = {category_id}
+            for child_id in self.children.get(category_id, []):
+                subtree |= self._subtrees.get(child_id, frozenset())
+            self._subtrees[category_id] = frozenset(subtree)
+
+    def __contains__(self, category_id):
+        return category_id in self.names
+
+    def name(self, category_id):
+        return self.names.get(category_id)
+
+    def id_for_name(self, name):
+        """Returns the id of a category by name, ignoring case, or None."""
+        return self._ids_by_name.get(name.casefold())
+
+    def parent(self, category_id):
+        return self.parents.get(category_id)
+
+    def roots(self):
+        """Returns the ids of the top-level categories, sorted by name."""
+        return list(self.children[None])
+
+    def subcategories(self, category_id):
+        """Returns the ids of the direct subcategories, sorted by name."""
+        return list(self.children.get(category_id, []))
+
+    def has_children(self, category_id):
+        return bool(self.children.get(category_id))
+
+    def subtree(self, category_id):
+        """Returns the category and all of its descendants, at any depth."""
+        return self._subtrees.get(category_id, frozenset())
+
+    def descendants(self, category_id):
+        """Returns all descendants of a category, at any depth."""
+        return self.subtree(category_id) - {category_id}
+
+    def root(self, category_id):
+        """Returns the top-level ancestor of a category."""
+        return self._roots.get(category_id)
+
+    def groups(self, parent=None):
+        """Maps category ids to the name of the group they are summed under.
+
+        Without a parent every category maps to its top-level ancestor; with a
+        parent, the parent's descendants map to the parent's direct child
+        they belong to. This matches db.expenses_by_category().
+        """
+        if parent is None:
+            return {category_id: self.names[root_id] for category_id, root_id in self._roots.items()}
+        groups = {}
+        for child_id in self.children.get(parent, []):
+            for category_id in self.subtree(child_id):
+                groups[category_id] = self.names[child_id]
+        return groups
@@ -0,0 +1,102 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+
+class Money:
+    """An amount of money held as an integer number of minor units (cents).
+
+    Amounts are stored, summed and compared as integers, so totals over a
+    long history do not drift the way float sums do. Conversion from user
+    input goes through Decimal and rounds half up to whole cents.
+    """
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        self.cents = int(cents)
+
+    @classmethod
+    def from_value(cls, value):
+        """Converts a Money, Decimal, float, int or string amount in major units."""
+        if isinstance(value, Money):
+            return value
+        units = Decimal(str(value))
+        return cls(int((units * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+
+    def to_decimal(self):
+        return Decimal(self.cents).scaleb(-2)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __int__(self):
+        return self.cents
+
+    def __str__(self):
+        sign = '-' if self.cents < 0 else ''
+        whole, fraction = divmod(abs(self.cents), 100)
+        return f"{sign}{whole}.{fraction:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec) if spec else str(self)
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    # Lets sum() start from its default 0
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __mul__(self, factor):
+        if isinstance(factor, int):
+            return Money(self.cents * factor)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, Money):
+            return self.cents <= other.cents
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, Money):
+            return self.cents > other.cents
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, Money):
+            return self.cents >= other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
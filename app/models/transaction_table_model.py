@@ -0,0 +1,313 @@
+from array import array
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, Signal
+from app.database import database as db
+from app.instrumentation import timed
+from app.models.money import Money
+
+# Column indexes, shared with the views and proxies built on top of the model
+COLUMN_ID = 0
+COLUMN_DATE = 1
+COLUMN_DESCRIPTION = 2
+COLUMN_AMOUNT = 3
+COLUMN_CATEGORY = 4
+
+HEADERS = ['ID', 'Data', 'Opis', 'Kwota', 'Kategoria']
+
+
+class TransactionTableModel(QAbstractTableModel):
+    """Table model reading transactions straight from SQLite, page by page.
+
+    Rows are fetched lazily through canFetchMore/fetchMore using keyset
+    pagination on (date, id), newest first. Loaded rows are kept column by
+    column in compact arrays and lists instead of one item object per cell;
+    formatting and alignment are produced on demand in data().
+
+    Description and category filters are part of the SQL query, so the
+    model only ever holds rows of the current result set.
+
+    With a DatabaseWorker pages are read in the worker thread and appended
+    when they arrive; a reload supersedes the page still being read.
+
+    When new filters can only drop rows of the current result set, e.g.
+    more letters typed into the search box, the loaded rows are filtered
+    in memory and loading resumes where the previous result set stopped.
+
+    Amounts are shown in their own currency; sorting and loaded_rows()
+    use the amount converted to the main currency by the query.
+    """
+
+    PAGE_SIZE = 500
+    WORKER_KEY = 'transactions'
+
+    # Emitted when the first page of a reload has been appended
+    first_page_loaded = Signal()
+
+    def __init__(self, parent=None, page_size=PAGE_SIZE, worker=None):
+        super().__init__(parent)
+        self.page_size = page_size
+        self.worker = worker
+        self.text_filter = ""
+        self.categories = []
+        self._clear()
+
+    def _clear(self):
+        self._ids = array('q')
+        self._dates = []
+        self._descriptions = []
+        self._amounts = array('q')  # integer cents
+        self._main_amounts = array('q')  # integer cents of the main currency
+        self._currencies = []  # None for the main currency
+        self._category_ids = array('q')  # 0 for uncategorized
+        self._category_names = {0: 'Uncategorized'}
+        # Dates repeat a lot, so one string object is shared per value
+        self._strings = {}
+        self._exhausted = False
+        self._fetching = False
+        # (date, id) key the next page starts after
+        self._after = None
+
+    def reload(self):
+        """Drops the loaded rows and fetches the first page again."""
+        self.beginResetModel()
+        self._clear()
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    @timed
+    def set_filters(self, text_filter, categories):
+        """Changes the description and category filters and reloads or narrows the rows."""
+        categories = list(categories)
+        if text_filter == self.text_filter and categories == self.categories:
+            return
+        narrows = db.filters_narrow(self.text_filter, self.categories, text_filter, categories)
+        self.text_filter = text_filter
+        self.categories = categories
+        if narrows:
+            self._narrow()
+        else:
+            self.reload()
+
+    @timed
+    def _narrow(self):
+        """Drops the loaded rows the current filters reject, without a query."""
+        self.stop_loading()
+        matches = db.description_matcher(self.text_filter)
+        categories = set(self.categories)
+        keep = [row for row in range(len(self._ids))
+                if (not categories or (self._category_ids[row] or None) in categories)
+                and matches(self._descriptions[row])]
+        self.beginResetModel()
+        self._ids = array('q', (self._ids[row] for row in keep))
+        self._dates = [self._dates[row] for row in keep]
+        self._descriptions = [self._descriptions[row] for row in keep]
+        self._amounts = array('q', (self._amounts[row] for row in keep))
+        self._main_amounts = array('q', (self._main_amounts[row] for row in keep))
+        self._currencies = [self._currencies[row] for row in keep]
+        self._category_ids = array('q', (self._category_ids[row] for row in keep))
+        self.endResetModel()
+        # Loading goes on after the last row of the previous result set
+        if len(self._ids) < self.page_size and self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def stop_loading(self):
+        """Drops the page being read, e.g. because the filters are about to change."""
+        if self._fetching:
+            self.worker.cancel(self.WORKER_KEY)
+            self._fetching = False
+
+    def is_complete(self):
+        """Checks whether every row of the result set is loaded."""
+        return self._exhausted and not self._fetching
+
+    def loaded_rows(self):
+        """Yields (date, amount in cents of the main currency, category id or None) of the loaded rows."""
+        for date, amount, category_id in zip(self._dates, self._main_amounts, self._category_ids):
+            yield date, amount, category_id or None
+
+    def accepts(self, transaction):
+        """Checks whether a transaction belongs to the current result set."""
+        if self.categories and transaction['category_id'] not in self.categories:
+            return False
+        return db.description_matches(transaction['description'], self.text_filter)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role == Qt.DisplayRole:
+            if column == COLUMN_AMOUNT:
+                currency = self._currencies[row]
+                return f"{Money(self._amounts[row])} {currency}" if currency else str(Money(self._amounts[row]))
+            if column == COLUMN_ID:
+                return str(self._ids[row])
+            return self._column_value(row, column)
+        if role == Qt.UserRole:
+            # Raw value (amounts in cents of the main currency), used for sorting
+            return self._column_value(row, column)
+        if role == Qt.TextAlignmentRole and column == COLUMN_AMOUNT:
+            return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+    def _column_value(self, row, column):
+        if column == COLUMN_ID:
+            return self._ids[row]
+        if column == COLUMN_DATE:
+            return self._dates[row]
+        if column == COLUMN_DESCRIPTION:
+            return self._descriptions[row]
+        if column == COLUMN_AMOUNT:
+            return self._main_amounts[row]
+        return self._category_names.get(self._category_ids[row], '')
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted or self._fetching:
+            return
+        self._request_page()
+
+    def _request_page(self):
+        args = (self._after, self.page_size, self.text_filter, self.categories)
+        if self.worker is None:
+            self._append_page(db.get_transactions_page(*args))
+            return
+        self._fetching = True
+        self.worker.submit(self.WORKER_KEY, self._append_page, db.get_transactions_page, *args)
+
+    @timed
+    def _append_page(self, rows):
+        self._fetching = False
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if not rows:
+            return
+        self._after = (rows[-1]['date'], rows[-1]['id'])
+        first = len(self._ids)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        shared = self._strings.setdefault
+        for row in rows:
+            self._ids.append(row['id'])
+            self._dates.append(shared(row['date'], row['date']))
+            self._descriptions.append(row['description'])
+            self._amounts.append(row['amount'])
+            self._main_amounts.append(row['main_amount'])
+            self._currencies.append(row['currency'])
+            self._category_ids.append(self._remember_category(row))
+        self.endInsertRows()
+        if first == 0:
+            self.first_page_loaded.emit()
+
+    def _remember_category(self, transaction):
+        """Records the category name of a row and returns its id, 0 if uncategorized."""
+        category_id = transaction['category_id'] or 0
+        if category_id:
+            self._category_names[category_id] = transaction['category']
+        return category_id
+
+    def _find_insert_row(self, date, transaction_id):
+        """Binary search for the row a (date, id) key belongs at, newest first."""
+        key = (date, transaction_id)
+        low, high = 0, len(self._ids)
+        while low < high:
+            middle = (low + high) // 2
+            if (self._dates[middle], self._ids[middle]) > key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def row_of(self, transaction_id):
+        """Returns the row of a loaded transaction, or -1 if it is not loaded."""
+        try:
+            return self._ids.index(transaction_id)
+        except ValueError:
+            return -1
+
+    def insert_transaction(self, transaction):
+        """Inserts a new transaction row at its sorted position.
+
+        Rows that sort after the loaded window are left for fetchMore to
+        pick up, since the next page starts from the last loaded key.
+        """
+        if not self.accepts(transaction):
+            return
+        key = (transaction['date'], transaction['id'])
+        if not self._exhausted and (self._after is None or key < self._after):
+            self._refetch_page()
+            return
+        row = self._find_insert_row(*key)
+        shared = self._strings.setdefault
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._ids.insert(row, transaction['id'])
+        self._dates.insert(row, shared(transaction['date'], transaction['date']))
+        self._descriptions.insert(row, transaction['description'])
+        self._amounts.insert(row, transaction['amount'])
+        self._main_amounts.insert(row, transaction['main_amount'])
+        self._currencies.insert(row, transaction['currency'])
+        self._category_ids.insert(row, self._remember_category(transaction))
+        self.endInsertRows()
+        self._refetch_page()
+
+    def update_transaction(self, transaction):
+        """Refreshes a changed transaction, moving it if its date changed."""
+        row = self.row_of(transaction['id'])
+        if row < 0:
+            self.insert_transaction(transaction)
+            return
+        if self._dates[row] != transaction['date'] or not self.accepts(transaction):
+            self.remove_transaction(transaction['id'])
+            self.insert_transaction(transaction)
+            return
+        self._descriptions[row] = transaction['description']
+        self._amounts[row] = transaction['amount']
+        self._main_amounts[row] = transaction['main_amount']
+        self._currencies[row] = transaction['currency']
+        self._category_ids[row] = self._remember_category(transaction)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADERS) - 1))
+
+    def remove_transaction(self, transaction_id):
+        """Removes a deleted transaction's row if it is loaded."""
+        row = self.row_of(transaction_id)
+        if row < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._ids[row]
+        del self._dates[row]
+        del self._descriptions[row]
+        del self._amounts[row]
+        del self._main_amounts[row]
+        del self._currencies[row]
+        del self._category_ids[row]
+        self.endRemoveRows()
+        self._refetch_page()
+
+    def _refetch_page(self):
+        """Asks again for a page being read, whose starting key may have changed."""
+        if self._fetching:
+            self._request_page()
+
+    def transaction_at(self, row):
+        """Returns the transaction shown in a source row as a dictionary."""
+        return {
+            'id': self._ids[row],
+            'date': self._dates[row],
+            'description': self._descriptions[row],
+            'amount': Money(self._amounts[row]),
+            'currency': self._currencies[row],
+            'main_amount': Money(self._main_amounts[row]),
+            'category_id': self._category_ids[row] or None,
+            'category': self._category_names.get(self._category_ids[row], ''),
+        }
@@ -0,0 +1,141 @@
+"""Scheduling of the recurring_rules table: rent, salary, subscriptions.
+
+Every rule keeps a high-water mark, next_date: all of its occurrences
+before that date have been posted. materialize_due() therefore only reads
+the rules with next_date on or before today, through the index on that
+column, and starts each of them at its mark. The first occurrence at or
+after a date is found with arithmetic instead of stepping from the start
+date, so neither the posted history nor the age of a rule adds work.
+
+All due occurrences are inserted with bulk_insert(), in the same
+transaction that moves the marks forward. Each row carries the
+fingerprint "recurring:<rule id>:<date>", so an occurrence is never
+posted twice, even if a mark is moved back.
+
+projected() yields the occurrences not posted yet up to a date without
+writing anything, e.g. for a cash-flow forecast.
+"""
+import calendar
+import heapq
+from datetime import date, timedelta
+from app.database import database as db
+from app.instrumentation import timed
+
+FREQUENCIES = ('monthly', 'weekly', 'last_business_day')
+
+# Rows handed to the bulk insert at a time
+INSERT_BATCH = 10000
+
+# Saturday and Sunday; public holidays are not taken into account
+_WEEKEND = (5, 6)
+
+
+def fingerprint(rule_id, day):
+    """Returns the fingerprint of the transaction posted for an occurrence."""
+    return f"recurring:{rule_id}:{day.isoformat()}"
+
+
+def _month_occurrence(frequency, day, year, month):
+    last_day = calendar.monthrange(year, month)[1]
+    if frequency == 'monthly':
+        return date(year, month, min(day, last_day))
+    occurrence = date(year, month, last_day)
+    while occurrence.weekday() in _WEEKEND:
+        occurrence -= timedelta(days=1)
+    return occurrence
+
+
+def occurrences(rule, since=None):
+    """Yields the dates of a rule's occurrences from `since` on, in order.
+
+    `rule` is a row of the recurring_rules table. The sequence ends at the
+    rule's end_date and is endless without one.
+    """
+    start = date.fromisoformat(rule['start_date'])
+    end = date.fromisoformat(rule['end_date']) if rule['end_date'] else date.max
+    since = max(since or start, start)
+    interval = rule['interval']
+
+    if rule['frequency'] == 'weekly':
+        step = timedelta(weeks=interval)
+        # The first whole number of steps from the start reaching `since`
+        occurrence = start + step * -(-(since - start).days // step.days)
+        while occurrence <= end:
+            yield occurrence
+            occurrence += step
+        return
+
+    day = rule['day'] or start.day
+    # Months counted from the start month, rounded down to a month with an occurrence
+    months = (since.year - start.year) * 12 + since.month - start.month
+    months -= months % interval
+    while True:
+        year, month = divmod(start.year * 12 + start.month - 1 + months, 12)
+        occurrence = _month_occurrence(rule['frequency'], day, year, month + 1)
+        if occurrence > end:
+            return
+        if occurrence >= since:
+            yield occurrence
+        months += interval
+
+
+def _due_rows(rules, today, changes):
+    """Yields the transaction rows of the occurrences up to `today`, collecting the new marks in `changes`."""
+    for rule in rules:
+        next_date = None
+        for occurrence in occurrences(rule, date.fromisoformat(rule['next_date'])):
+            if occurrence > today:
+                next_date = occurrence.isoformat()
+                break
+            yield (occurrence.isoformat(), rule['description'], rule['amount'], rule['category_id'],
+                   fingerprint(rule['id'], occurrence), None)
+        # None once the rule has ended
+        changes.append((next_date, rule['id']))
+
+
+@timed
+def materialize_due(today=None):
+    """Posts every occurrence due by `today` (default: today); returns the number of transactions added."""
+    today = today or date.today()
+    rules = db.get_due_recurring_rules(today.isoformat())
+    if not rules:
+        return 0
+    inserted = 0
+    changes = []
+    with db.bulk_insert() as insert:
+        batch = []
+        for row in _due_rows(rules, today, changes):
+            batch.append(row)
+            if len(batch) == INSERT_BATCH:
+                inserted += insert(batch)
+                batch = []
+        if batch:
+            inserted += insert(batch)
+        # Joins the transaction of the inserts, so the marks move only with their rows
+        db.set_recurring_next_dates(changes)
+    return inserted
+
+
+def projected(until, since=None, rules=None):
+    """Yields (date, rule) for the occurrences not posted yet up to `until`, in date order.
+
+    Starts at each rule's next_date, or at `since` if that is later.
+    Nothing is written to the database.
+    """
+    rules = db.get_recurring_rules() if rules is None else rules
+    series = []
+    for rule in rules:
+        if rule['next_date'] is None:
+            continue
+        start = date.fromisoformat(rule['next_date'])
+        if since is not None and since > start:
+            start = since
+        series.append(_projected_series(rule, start, until))
+    return heapq.merge(*series, key=lambda item: item[0])
+
+
+def _projected_series(rule, since, until):
+    for occurrence in occurrences(rule, since):
+        if occurrence > until:
+            return
+        yield occurrence, rule
@@ -0,0 +1,24 @@
+import sys
+import time
+
+
+class StartupProfile:
+    """Records how long each startup phase took, for the --profile-startup switch."""
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self._last = self.start
+        # (phase, duration, time since start) in seconds
+        self.phases = []
+
+    def mark(self, phase):
+        """Ends a phase that started when the previous one ended."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last, now - self.start))
+        self._last = now
+
+    def report(self, stream=None):
+        stream = sys.stderr if stream is None else stream
+        print("Startup phase              duration     elapsed", file=stream)
+        for phase, duration, elapsed in self.phases:
+            print(f"{phase:<24} {duration * 1000:8.1f} ms {elapsed * 1000:8.1f} ms", file=stream)
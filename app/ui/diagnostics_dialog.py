@@ -0,0 +1,83 @@
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget, QTableWidgetItem,
+    QAbstractItemView, QPlainTextEdit, QSplitter
+)
+from app import instrumentation
+
+# The tables are refreshed this often while the dialog is open
+REFRESH_MS = 2000
+
+
+class DiagnosticsDialog(QDialog):
+    """Shows the latencies recorded by app.instrumentation and the recent slow queries."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostyka wydajności")
+        self.setMinimumSize(900, 600)
+
+        layout = QVBoxLayout(self)
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        splitter = QSplitter(Qt.Vertical)
+        self.operations_table = QTableWidget(0, 6)
+        self.operations_table.setHorizontalHeaderLabels(
+            ["Operacja", "Liczba", "p50 [ms]", "p95 [ms]", "Maks. [ms]", "Łącznie [ms]"]
+        )
+        self.operations_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.operations_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.operations_table.setSortingEnabled(True)
+        splitter.addWidget(self.operations_table)
+        self.slow_queries_text = QPlainTextEdit()
+        self.slow_queries_text.setReadOnly(True)
+        splitter.addWidget(self.slow_queries_text)
+        layout.addWidget(splitter)
+
+        buttons_layout = QHBoxLayout()
+        reset_button = QPushButton("Wyczyść")
+        reset_button.clicked.connect(self.reset)
+        close_button = QPushButton("Zamknij")
+        close_button.clicked.connect(self.accept)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(reset_button)
+        buttons_layout.addWidget(close_button)
+        layout.addLayout(buttons_layout)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+        self.refresh()
+
+    def refresh(self):
+        rows = instrumentation.summary()
+        self.operations_table.setSortingEnabled(False)
+        self.operations_table.setRowCount(len(rows))
+        for row, (name, count, total, p50, p95, maximum) in enumerate(rows):
+            self.operations_table.setItem(row, 0, QTableWidgetItem(name))
+            for column, value in enumerate((count, p50 * 1000, p95 * 1000, maximum * 1000, total * 1000), 1):
+                item = QTableWidgetItem()
+                # Numbers as display data sort numerically
+                item.setData(Qt.DisplayRole, value if column == 1 else round(value, 2))
+                self.operations_table.setItem(row, column, item)
+        self.operations_table.setSortingEnabled(True)
+        self.operations_table.resizeColumnsToContents()
+
+        slow_queries = instrumentation.slow_queries()
+        self.summary_label.setText(
+            f"Operacje: {len(rows)}    Wolne zapytania: {len(slow_queries)}    "
+            f"Wolne zapytania przeszukujące całą tabelę: {instrumentation.full_scan_count()}"
+        )
+        lines = []
+        for taken, milliseconds, statement, plan, full_scan in reversed(slow_queries):
+            marker = "  [cała tabela]" if full_scan else ""
+            lines.append(f"{taken:%H:%M:%S}  {milliseconds:.1f} ms{marker}\n{statement}")
+            lines.extend(f"    {line}" for line in plan)
+            lines.append("")
+        self.slow_queries_text.setPlainText("\n".join(lines))
+
+    def reset(self):
+        instrumentation.reset()
+        self.refresh()
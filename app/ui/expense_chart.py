@@ -0,0 +1,100 @@
+import time
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QPainter
+from PySide6.QtCharts import QChart, QPieSeries
+from app.instrumentation import timed
+
+CHART_COLORS = [
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'
+]
+
+# Slices below this share of the total are merged into one "Inne" slice
+SMALL_SLICE_PERCENT = 2
+OTHER_LABEL = "Inne"
+
+# Minimum time in seconds between two animated updates; updates coming
+# faster than that are applied without animation
+ANIMATION_INTERVAL = 1.0
+
+
+class ExpenseChart:
+    """Pie chart of expenses by category, created once for a chart view.
+
+    set_expenses() compares the new totals with the slices on screen:
+    existing slices get their new value, and only categories that appeared
+    or disappeared are added or removed. Each category keeps its color for
+    the whole session. The chart, series and signal connections are never
+    replaced, so nothing piles up in the view over a long session.
+    """
+
+    def __init__(self, chart_view, on_hovered, on_clicked):
+        self.chart = QChart()
+        self.series = QPieSeries()
+        self.series.setHoleSize(0.35)
+        self.series.hovered.connect(on_hovered)
+        self.series.clicked.connect(on_clicked)
+        self.chart.addSeries(self.series)
+        self.chart.legend().setVisible(True)
+        self.chart.legend().setAlignment(Qt.AlignBottom)
+        font = self.chart.legend().font()
+        font.setPointSize(8)
+        self.chart.legend().setFont(font)
+        chart_view.setChart(self.chart)
+        chart_view.setRenderHint(QPainter.Antialiasing)
+
+        # Slice on screen and color handed out per category name
+        self._slices = {}
+        self._colors = {}
+        self._last_animation = float('-inf')
+
+    def _color(self, category):
+        if category not in self._colors:
+            self._colors[category] = CHART_COLORS[len(self._colors) % len(CHART_COLORS)]
+        return self._colors[category]
+
+    @staticmethod
+    def slice_values(expenses_by_category, group_small=True):
+        """Returns the slices to draw as {label: value}, merging small ones when `group_small`."""
+        total = sum(amount.cents for amount in expenses_by_category.values())
+        if total <= 0:
+            return {}
+        values = {}
+        other_cents = 0
+        for category, amount in expenses_by_category.items():
+            if group_small and 100 * amount.cents / total < SMALL_SLICE_PERCENT:
+                other_cents += amount.cents
+            else:
+                values[category] = float(amount)
+        if other_cents > 0:
+            values[OTHER_LABEL] = other_cents / 100
+        return values
+
+    @timed
+    def set_expenses(self, expenses_by_category, title, group_small=True):
+        """Shows new totals, changing only the slices that differ."""
+        values = self.slice_values(expenses_by_category, group_small)
+        removed = [category for category in self._slices if category not in values]
+        now = time.monotonic()
+        if removed:
+            # Qt Charts crashes when a slice is removed while it is animated
+            self.chart.setAnimationOptions(QChart.NoAnimation)
+        elif now - self._last_animation >= ANIMATION_INTERVAL:
+            self._last_animation = now
+            self.chart.setAnimationOptions(QChart.SeriesAnimations)
+        else:
+            self.chart.setAnimationOptions(QChart.NoAnimation)
+        if self.chart.title() != title:
+            self.chart.setTitle(title)
+
+        for category in removed:
+            self.series.remove(self._slices.pop(category))
+        for category, value in values.items():
+            slice_ = self._slices.get(category)
+            if slice_ is None:
+                slice_ = self.series.append(category, value)
+                slice_.setProperty("original_category", category)
+                slice_.setColor(self._color(category))
+                self._slices[category] = slice_
+            elif slice_.value() != value:
+                slice_.setValue(value)
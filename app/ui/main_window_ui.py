@@ -3,7 +3,6 @@ from PySide6.QtCore import QCoreApplication, QMetaObject, QRect, Qt
 from PySide6.QtGui import QAction
 from PySide6.QtWidgets import (QHeaderView, QMainWindow, QMenu,
     QMenuBar, QPushButton, QStatusBar, QTableView, QVBoxLayout, QWidget, QSplitter)
-from PySide6.QtCharts import QChartView
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -37,13 +36,10 @@ class Ui_MainWindow(object):
         self.verticalLayout.addWidget(self.transactions_table_view)
         self.splitter.addWidget(self.left_widget)
 
-        # Right side (chart)
+        # Right side (chart); the chart view is added by MainWindow after the first frame
         self.right_widget = QWidget(self.splitter)
         self.chart_layout = QVBoxLayout(self.right_widget)
         self.chart_layout.setObjectName(u"chart_layout")
-        self.chart_view = QChartView(self.right_widget)
-        self.chart_view.setObjectName(u"chart_view")
-        self.chart_layout.addWidget(self.chart_view)
         self.splitter.addWidget(self.right_widget)
 
         self.horizontalLayout.addWidget(self.splitter)
@@ -86,19 +86,13 @@ class OnboardingWindow(QDialog):
 
     def populate_categories(self):
         self.categories_tree.clear()
-        categories = db.get_all_categories()
-        
-        category_items = {}
-        for category in categories:
-            if category['parent_id'] is None:
-                item = QTreeWidgetItem(self.categories_tree, [category['name'], str(category['id'])])
-                category_items[category['id']] = item
+        tree = db.get_category_tree()
 
-        for category in categories:
-            if category['parent_id'] is not None:
-                parent_item = category_items.get(category['parent_id'])
-                if parent_item:
-                    QTreeWidgetItem(parent_item, [category['name'], str(category['id'])])
+        # Display order lists every parent before its children
+        category_items = {}
+        for category_id, name, _depth, _has_children in tree.display_order:
+            parent_item = category_items.get(tree.parent(category_id), self.categories_tree)
+            category_items[category_id] = QTreeWidgetItem(parent_item, [name, str(category_id)])
 
     def add_category(self):
         # Simple dialog to add a category
@@ -112,9 +106,9 @@ class OnboardingWindow(QDialog):
         parent_combo = QComboBox()
         parent_combo.addItem("Brak", None)
 
-        for item in db.get_all_categories():
-            if item['parent_id'] is None:
-                parent_combo.addItem(item['name'], item['id'])
+        tree = db.get_category_tree()
+        for category_id in tree.roots():
+            parent_combo.addItem(tree.name(category_id), category_id)
 
         add_button = QPushButton("Dodaj")
 
@@ -140,8 +134,7 @@ class OnboardingWindow(QDialog):
                 return
 
             # Check for uniqueness
-            existing_categories = [cat['name'].lower() for cat in db.get_all_categories()]
-            if name.lower() in existing_categories:
+            if db.get_category_tree().id_for_name(name) is not None:
                 QMessageBox.warning(dialog, "Błąd walidacji", "Kategoria o tej nazwie już istnieje.")
                 return
 
@@ -0,0 +1,165 @@
+import re
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QComboBox,
+    QTableWidget, QTableWidgetItem, QAbstractItemView, QMessageBox, QDoubleSpinBox, QSpinBox
+)
+from app.database import database as db
+from app.models.money import Money
+from app import categorizer
+
+MATCH_TYPE_LABELS = {
+    'keyword': "Fraza w opisie",
+    'regex': "Wyrażenie regularne",
+    'amount': "Zakres kwot",
+}
+
+
+class RulesDialog(QDialog):
+    """Lists the categorization rules and lets the user add, delete and apply them."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Reguły kategorii")
+        self.setMinimumSize(600, 400)
+        # Number of transactions recategorized while the dialog was open
+        self.changed = 0
+
+        layout = QVBoxLayout(self)
+        self.rules_table = QTableWidget(0, 5)
+        self.rules_table.setHorizontalHeaderLabels(["ID", "Typ", "Warunek", "Kategoria", "Priorytet"])
+        self.rules_table.setColumnHidden(0, True)
+        self.rules_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.rules_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        layout.addWidget(self.rules_table)
+
+        buttons_layout = QHBoxLayout()
+        add_button = QPushButton("Dodaj regułę")
+        add_button.clicked.connect(self.add_rule)
+        delete_button = QPushButton("Usuń regułę")
+        delete_button.clicked.connect(self.delete_rule)
+        apply_button = QPushButton("Zastosuj do transakcji")
+        apply_button.clicked.connect(self.apply_rules)
+        close_button = QPushButton("Zamknij")
+        close_button.clicked.connect(self.accept)
+        for button in (add_button, delete_button, apply_button, close_button):
+            buttons_layout.addWidget(button)
+        layout.addLayout(buttons_layout)
+
+        self.populate_rules()
+
+    def populate_rules(self):
+        rules = db.get_categorization_rules()
+        self.rules_table.setRowCount(len(rules))
+        for row, rule in enumerate(rules):
+            if rule['match_type'] == 'amount':
+                low = "" if rule['min_amount'] is None else str(Money(rule['min_amount']))
+                high = "" if rule['max_amount'] is None else str(Money(rule['max_amount']))
+                condition = f"{low} – {high}"
+            else:
+                condition = rule['pattern']
+            values = [str(rule['id']), MATCH_TYPE_LABELS[rule['match_type']], condition,
+                      rule['category'], str(rule['priority'])]
+            for column, value in enumerate(values):
+                self.rules_table.setItem(row, column, QTableWidgetItem(value))
+        self.rules_table.resizeColumnsToContents()
+
+    def add_rule(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Dodaj regułę")
+        layout = QVBoxLayout(dialog)
+
+        type_combo = QComboBox()
+        for match_type in categorizer.MATCH_TYPES:
+            type_combo.addItem(MATCH_TYPE_LABELS[match_type], match_type)
+        pattern_input = QLineEdit()
+        pattern_input.setPlaceholderText("np. biedronka")
+        # 0 means no bound
+        min_input = QDoubleSpinBox()
+        max_input = QDoubleSpinBox()
+        for spinbox in (min_input, max_input):
+            spinbox.setRange(0.00, 1000000.00)
+            spinbox.setSpecialValueText("brak")
+        category_combo = QComboBox()
+        for category_id, name, depth, _has_children in db.get_category_tree().display_order:
+            category_combo.addItem("  " * depth + name, category_id)
+        priority_input = QSpinBox()
+        priority_input.setRange(-100, 100)
+
+        layout.addWidget(QLabel("Typ reguły:"))
+        layout.addWidget(type_combo)
+        layout.addWidget(QLabel("Fraza lub wyrażenie:"))
+        layout.addWidget(pattern_input)
+        layout.addWidget(QLabel("Kwota od / do:"))
+        amounts_layout = QHBoxLayout()
+        amounts_layout.addWidget(min_input)
+        amounts_layout.addWidget(max_input)
+        layout.addLayout(amounts_layout)
+        layout.addWidget(QLabel("Kategoria:"))
+        layout.addWidget(category_combo)
+        layout.addWidget(QLabel("Priorytet (wyższy wygrywa):"))
+        layout.addWidget(priority_input)
+        add_button = QPushButton("Dodaj")
+        layout.addWidget(add_button)
+
+        def update_inputs():
+            is_amount = type_combo.currentData() == 'amount'
+            pattern_input.setEnabled(not is_amount)
+            min_input.setEnabled(is_amount)
+            max_input.setEnabled(is_amount)
+
+        def do_add():
+            match_type = type_combo.currentData()
+            pattern = pattern_input.text().strip() or None
+            min_amount = max_amount = None
+            if match_type == 'amount':
+                min_amount = min_input.value() or None
+                max_amount = max_input.value() or None
+                if min_amount is None and max_amount is None:
+                    QMessageBox.warning(dialog, "Błąd walidacji", "Podaj co najmniej jedną granicę kwoty.")
+                    return
+                if min_amount and max_amount and min_amount > max_amount:
+                    QMessageBox.warning(dialog, "Błąd walidacji", "Kwota minimalna jest większa od maksymalnej.")
+                    return
+                pattern = None
+            elif not pattern:
+                QMessageBox.warning(dialog, "Błąd walidacji", "Fraza nie może być pusta.")
+                return
+            elif match_type == 'regex':
+                try:
+                    re.compile(pattern)
+                except re.error as error:
+                    QMessageBox.warning(dialog, "Błąd walidacji", f"Nieprawidłowe wyrażenie regularne: {error}")
+                    return
+
+            db.add_categorization_rule(
+                match_type, category_combo.currentData(), pattern,
+                min_amount, max_amount, priority_input.value()
+            )
+            self.populate_rules()
+            dialog.accept()
+
+        type_combo.currentIndexChanged.connect(update_inputs)
+        add_button.clicked.connect(do_add)
+        update_inputs()
+        dialog.exec()
+
+    def delete_rule(self):
+        row = self.rules_table.currentRow()
+        if row < 0:
+            QMessageBox.warning(self, "Błąd", "Wybierz regułę do usunięcia.")
+            return
+        db.delete_categorization_rule(int(self.rules_table.item(row, 0).text()))
+        self.populate_rules()
+
+    def apply_rules(self):
+        reply = QMessageBox.question(
+            self, "Zastosuj reguły",
+            "Czy zmienić także kategorie transakcji, które już mają kategorię?\n"
+            "Wybierz „Nie”, aby skategoryzować tylko transakcje bez kategorii.",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.No
+        )
+        if reply == QMessageBox.Cancel:
+            return
+        changed = categorizer.apply_rules(include_categorized=reply == QMessageBox.Yes)
+        self.changed += changed
+        QMessageBox.information(self, "Zastosuj reguły", f"Zmieniono kategorię transakcji: {changed}.")
@@ -0,0 +1,170 @@
+from datetime import timedelta
+import numpy as np
+from PySide6.QtCore import Qt, QDateTime
+from PySide6.QtGui import QPainter, QPen, QColor
+from PySide6.QtCharts import QChart, QLineSeries, QDateTimeAxis, QValueAxis
+from app import analytics
+from app.instrumentation import timed
+from app.ui.expense_chart import CHART_COLORS
+
+# Chart kinds drawn by load_chart_data()
+KINDS = ('category_trend', 'monthly', 'weekly', 'forecast')
+
+MONTHS_SHOWN = 24
+WEEKS_SHOWN = 52
+
+# Windows of the rolling means drawn with the monthly and weekly totals
+MONTHLY_WINDOW = 3
+WEEKLY_WINDOW = 4
+
+BUDGET_COLOR = '#D32F2F'
+
+# Points are placed at noon, so the date shown never shifts with the time zone
+_NOON_MS = 12 * 60 * 60 * 1000
+_DAY_MS = 24 * 60 * 60 * 1000
+
+
+class ChartData:
+    """Lines of a trend chart, computed off the UI thread.
+
+    `lines` are (name, days, values, dashed) with days as datetime64[D]
+    and values in cents; NaN values are not drawn.
+    """
+
+    def __init__(self, kind, title, date_format, lines):
+        self.kind = kind
+        self.title = title
+        self.date_format = date_format
+        self.lines = lines
+
+
+def _change_text(change):
+    return f"{change * 100:+.1f}%" if np.isfinite(change) else "brak danych"
+
+
+@timed
+def load_chart_data(kind, today, text_filter=None, categories=None, groups=None, other=None):
+    """Loads the expenses and computes the lines of a chart kind; safe to run in a worker thread.
+
+    `kind` is one of KINDS. `groups` and `other` group the categories of
+    the 'category_trend' chart, see analytics.time_series().
+    """
+    month = int(analytics.period_numbers(analytics.day_number(today), 'month'))
+    if kind == 'forecast':
+        # The forecast compares with up to SEASONAL_YEARS years back
+        first_day = analytics.period_starts(month - 12 * analytics.SEASONAL_YEARS - 11, 'month')
+    elif kind == 'weekly':
+        first_day = np.datetime64(today - timedelta(weeks=WEEKS_SHOWN + 52 + WEEKLY_WINDOW), 'D')
+    else:
+        first_day = analytics.period_starts(month - MONTHS_SHOWN - 12 - MONTHLY_WINDOW, 'month')
+    date_range = (str(first_day), today.isoformat())
+    totals = analytics.load_daily_totals(text_filter, categories, date_range)
+
+    if kind == 'forecast':
+        forecast = analytics.month_forecast(totals, today)
+        title = f"Prognoza na koniec miesiąca: {forecast.total / 100:.2f}"
+        lines = [
+            ("Wydatki", forecast.days, forecast.actual, False),
+            ("Prognoza", forecast.days, forecast.projected, True),
+        ]
+        return ChartData(kind, title, "dd.MM", lines)
+
+    if kind == 'category_trend':
+        series = analytics.time_series(totals, 'month', groups, other, month - MONTHS_SHOWN + 1, month)
+        order = np.argsort(-series.values.sum(axis=1), kind='stable')
+        lines = [(series.names[index], series.starts, series.values[index], False)
+                 for index in order if series.values[index].any()]
+        return ChartData(kind, "Wydatki miesięczne według kategorii", "MM.yyyy", lines)
+
+    period = 'week' if kind == 'weekly' else 'month'
+    shown = WEEKS_SHOWN if kind == 'weekly' else MONTHS_SHOWN
+    window = WEEKLY_WINDOW if kind == 'weekly' else MONTHLY_WINDOW
+    last = int(analytics.period_numbers(analytics.day_number(today), period))
+    # Earlier periods only feed the rolling mean and the year-over-year values
+    extra = analytics.PERIODS_PER_YEAR[period] + window
+    series = analytics.time_series(totals, period, first=last - shown - extra + 1, last=last)
+    total = series.total()
+    means = analytics.rolling_mean(total, window)
+    previous, change = analytics.year_over_year(total, period)
+    shown_slice = slice(-shown, None)
+    starts = series.starts[shown_slice]
+    if kind == 'weekly':
+        title = f"Wydatki tygodniowe (poprzedni tydzień r/r: {_change_text(change[-2])})"
+        mean_name = f"Średnia {window}-tygodniowa"
+    else:
+        title = f"Wydatki miesięczne (poprzedni miesiąc r/r: {_change_text(change[-2])})"
+        mean_name = f"Średnia {window}-miesięczna"
+    lines = [
+        ("Suma", starts, total[shown_slice], False),
+        (mean_name, starts, means[shown_slice], True),
+        ("Rok wcześniej", starts, previous[shown_slice], True),
+    ]
+    return ChartData(kind, title, "dd.MM.yyyy" if kind == 'weekly' else "MM.yyyy", lines)
+
+
+class TrendChart:
+    """Line chart of the ChartData from load_chart_data().
+
+    Created once and put in the chart view with show_in(); the chart and
+    its axes live as long as the window, set_data() replaces the series only.
+    """
+
+    def __init__(self):
+        self.chart = QChart()
+        self.chart.legend().setVisible(True)
+        self.chart.legend().setAlignment(Qt.AlignBottom)
+        font = self.chart.legend().font()
+        font.setPointSize(8)
+        self.chart.legend().setFont(font)
+        self.x_axis = QDateTimeAxis()
+        self.y_axis = QValueAxis()
+        self.y_axis.setLabelFormat("%.0f")
+        self.chart.addAxis(self.x_axis, Qt.AlignBottom)
+        self.chart.addAxis(self.y_axis, Qt.AlignLeft)
+        self.data = None
+
+    def show_in(self, chart_view):
+        chart_view.setChart(self.chart)
+        chart_view.setRenderHint(QPainter.Antialiasing)
+
+    @timed
+    def set_data(self, data, budget=None):
+        """Draws new lines; a `budget` (Money) adds a budget line to the forecast."""
+        self.data = data
+        self.chart.removeAllSeries()
+        self.chart.setTitle(data.title)
+        self.x_axis.setFormat(data.date_format)
+        lines = list(data.lines)
+        if data.kind == 'forecast' and budget is not None and len(data.lines[0][1]):
+            days = data.lines[0][1]
+            lines.append(("Budżet", days[[0, -1]], np.array([budget.cents, budget.cents], dtype=float), False))
+
+        low, high = 0.0, 0.0
+        first_ms = last_ms = None
+        for index, (name, days, values, dashed) in enumerate(lines):
+            series = QLineSeries()
+            series.setName(name)
+            visible = np.isfinite(values)
+            x = days[visible].astype(np.int64) * _DAY_MS + _NOON_MS
+            y = values[visible] / 100
+            for x_value, y_value in zip(x.tolist(), y.tolist()):
+                series.append(x_value, y_value)
+            self.chart.addSeries(series)
+            series.attachAxis(self.x_axis)
+            series.attachAxis(self.y_axis)
+            color = BUDGET_COLOR if name == "Budżet" else CHART_COLORS[index % len(CHART_COLORS)]
+            pen = QPen(QColor(color))
+            pen.setWidth(2)
+            if dashed:
+                pen.setStyle(Qt.DashLine)
+            series.setPen(pen)
+            if len(x):
+                low, high = min(low, float(y.min())), max(high, float(y.max()))
+                first_ms = x[0] if first_ms is None else min(first_ms, x[0])
+                last_ms = x[-1] if last_ms is None else max(last_ms, x[-1])
+
+        if first_ms is not None:
+            self.x_axis.setRange(QDateTime.fromMSecsSinceEpoch(int(first_ms)),
+                                 QDateTime.fromMSecsSinceEpoch(int(last_ms)))
+        self.y_axis.setRange(low, high * 1.05 if high > 0 else 1)
+        self.y_axis.applyNiceNumbers()
@@ -0,0 +1,171 @@
+"""Synthetic ledgers for benchmarks.
+
+    python -m benchmarks.ledger OUT.db --rows 100000 [--seed 0] [--csv OUT.csv]
+
+Generates a database over the default category tree created by
+initialize_database(): monthly rent, bills and subscriptions on fixed
+days, and everyday spending at a set of Polish merchants with log-normal
+amounts around a typical price per category. Part of the rows is left
+uncategorized, as after an import without rules. The same row count and
+seed always give the same ledger, so benchmark runs are comparable.
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+from datetime import date, timedelta
+from app.database import database as db
+from app.database.fingerprint import FingerprintCounter
+from app.models.money import Money
+
+# Category -> merchants and typical amount in zlotys of everyday spending
+MERCHANTS = {
+    'Artykuły spożywcze': (('BIEDRONKA', 'LIDL', 'ZABKA', 'CARREFOUR', 'AUCHAN', 'KAUFLAND', 'NETTO'), 60),
+    'Restauracje': (('MCDONALDS', 'KFC', 'PIZZA HUT', 'BAR MLECZNY', 'SUSHI MASTER', 'PYSZNE.PL'), 55),
+    'Kawa': (('STARBUCKS', 'COSTA COFFEE', 'COFFEEDESK', 'GREEN CAFFE NERO'), 16),
+    'Paliwo': (('ORLEN', 'BP', 'SHELL', 'CIRCLE K', 'MOYA'), 250),
+    'Bilety': (('JAKDOJADE', 'PKP INTERCITY', 'KOLEO', 'ZTM'), 30),
+    'Części samochodowe': (('INTER CARS', 'AUTO PARTNER', 'NORAUTO'), 300),
+    'Naprawy': (('CASTORAMA', 'LEROY MERLIN', 'OBI', 'BRICOMARCHE'), 150),
+    'Kino': (('CINEMA CITY', 'MULTIKINO', 'HELIOS'), 45),
+    'Koncerty': (('EBILET', 'EVENTIM', 'GOING'), 180),
+    'Gry': (('STEAM', 'PLAYSTATION STORE', 'GOG.COM'), 90),
+    'Książki': (('EMPIK', 'TANIAKSIAZKA', 'LEGIMI'), 45),
+    'Lekarz': (('LUXMED', 'MEDICOVER', 'ENEL-MED'), 200),
+    'Apteka': (('APTEKA GEMINI', 'DOZ APTEKA', 'SUPER-PHARM'), 40),
+    'Sport': (('DECATHLON', 'MARTES SPORT', 'INTERSPORT'), 150),
+    'Muzyka': (('THOMANN', 'MUZYCZNY.PL', 'SALON MUZYCZNY'), 120),
+    'Podróże': (('BOOKING.COM', 'AIRBNB', 'RYANAIR', 'WIZZ AIR'), 600),
+}
+
+# Relative frequency of everyday spending per category
+WEIGHTS = {
+    'Artykuły spożywcze': 30, 'Restauracje': 10, 'Kawa': 14, 'Paliwo': 6, 'Bilety': 8,
+    'Części samochodowe': 1, 'Naprawy': 2, 'Kino': 2, 'Koncerty': 1, 'Gry': 2, 'Książki': 2,
+    'Lekarz': 1, 'Apteka': 4, 'Sport': 2, 'Muzyka': 1, 'Podróże': 1,
+}
+
+# (day of month, category, description, amount) paid every month
+MONTHLY = (
+    (1, 'Czynsz', 'CZYNSZ ZA LOKAL', 2400),
+    (10, 'Rachunki', 'PGE OBROT ENERGIA', 180),
+    (12, 'Rachunki', 'ORANGE POLSKA ABONAMENT', 75),
+    (15, 'Rachunki', 'PGNIG GAZ', 120),
+    (5, 'Siłownia', 'KARNET MULTISPORT', 139),
+    (20, 'Rozrywka', 'NETFLIX.COM', 60),
+    (22, 'Muzyka', 'SPOTIFY', 24),
+)
+
+CITIES = ('WARSZAWA', 'KRAKOW', 'GDANSK', 'POZNAN', 'WROCLAW', 'LODZ')
+
+# Share of everyday rows left without a category
+UNCATEGORIZED_SHARE = 0.1
+
+# Spread of the log-normal amounts
+AMOUNT_SIGMA = 0.6
+
+DEFAULT_YEARS = 5
+INSERT_BATCH = 10000
+
+
+def _amount_cents(rng, typical):
+    cents = int(typical * 100 * math.exp(rng.gauss(0, AMOUNT_SIGMA) - AMOUNT_SIGMA ** 2 / 2))
+    return max(cents, 100)
+
+
+def generate_records(rows, seed=0, end=date(2025, 12, 31), years=DEFAULT_YEARS):
+    """Yields (date, description, cents, category) records in date order.
+
+    The ledger covers `years` years up to `end`; the number of everyday
+    transactions per day grows with `rows`. `category` is a category name
+    or None.
+    """
+    rng = random.Random(seed)
+    start = end.replace(year=end.year - years) + timedelta(days=1)
+    days = (end - start).days + 1
+    monthly_rows = len(MONTHLY) * years * 12
+    everyday = max(rows - monthly_rows, 0)
+    categories = list(WEIGHTS)
+    weights = list(WEIGHTS.values())
+    produced = 0
+    for offset in range(days):
+        if produced >= rows:
+            return
+        day = start + timedelta(days=offset)
+        iso_date = day.isoformat()
+        for day_of_month, category, description, typical in MONTHLY:
+            if day.day == day_of_month and produced < rows:
+                produced += 1
+                yield iso_date, description, int(typical * 100 * rng.uniform(0.9, 1.1)), category
+        # Spreads the everyday rows evenly over the days, the remainder included
+        count = everyday * (offset + 1) // days - everyday * offset // days
+        for category in rng.choices(categories, weights, k=min(count, rows - produced)):
+            merchants, typical = MERCHANTS[category]
+            description = f"{rng.choice(merchants)} {rng.choice(CITIES)} {rng.randrange(1000, 10000)}"
+            produced += 1
+            yield (iso_date, description, _amount_cents(rng, typical),
+                   None if rng.random() < UNCATEGORIZED_SHARE else category)
+
+
+def create_ledger(path, rows, seed=0, years=DEFAULT_YEARS):
+    """Creates a database with a synthetic ledger and a budget for every month; returns its path.
+
+    Leaves the module database configured to `path`.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    db.configure_database(path=path)
+    db.initialize_database()
+    db.set_onboarding_complete()
+    tree = db.get_category_tree()
+    months = set()
+    with db.bulk_insert() as insert:
+        batch = []
+        last_date = None
+        for iso_date, description, cents, category in generate_records(rows, seed, years=years):
+            if iso_date != last_date:
+                # Identical rows can only share a date, so numbering restarts every day
+                fingerprint = FingerprintCounter()
+                last_date = iso_date
+                months.add(iso_date[:7])
+            category_id = tree.id_for_name(category) if category else None
+            batch.append((iso_date, description, cents, category_id, fingerprint(iso_date, cents, description), None))
+            if len(batch) == INSERT_BATCH:
+                insert(batch)
+                batch = []
+        if batch:
+            insert(batch)
+    for month in sorted(months):
+        year, month = (int(part) for part in month.split('-'))
+        db.set_budget_for_month(Money.from_value(5000), month, year)
+    return path
+
+
+def write_statement(path, rows, seed=0, years=DEFAULT_YEARS):
+    """Writes a synthetic ledger as a bank CSV statement for import benchmarks."""
+    with open(path, 'w', encoding='utf-8', newline='') as stream:
+        writer = csv.writer(stream)
+        writer.writerow(('Data operacji', 'Opis operacji', 'Kwota', 'Kategoria'))
+        for iso_date, description, cents, category in generate_records(rows, seed, years=years):
+            writer.writerow((iso_date, description, str(Money(-cents)), category or ''))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.ledger', description="Generates a synthetic ledger.")
+    parser.add_argument('database')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS)
+    parser.add_argument('--csv', help="also write the ledger as a CSV statement")
+    args = parser.parse_args(argv)
+    create_ledger(args.database, args.rows, args.seed, args.years)
+    if args.csv:
+        write_statement(args.csv, args.rows, args.seed, args.years)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,457 @@
+"""Benchmark suite over a synthetic ledger.
+
+    python -m benchmarks.run [--rows 100000] [--output results.json]
+                             [--baseline old.json] [--only PATTERN]
+
+Times the database functions behind the main window, the analytics, the
+table model, search keystrokes and chart updates in a headless main window,
+and import, export and backup throughput. Each benchmark runs a number of
+times on a copy of the ledger made by benchmarks.ledger, which is cached in
+--workdir per row count and seed. Results are saved as JSON; with
+--baseline every benchmark is compared with an earlier run by its fastest
+run, the one least disturbed by other load on the machine, and the exit
+status is 1 when one got slower by more than --threshold.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from app import analytics, exporter, importer
+from app.database import backup
+from app.database import database as db
+from benchmarks import ledger
+
+DEFAULT_ROWS = 100000
+DEFAULT_REPEAT = 10
+
+# Fast benchmarks are called repeatedly within a run until it takes this long
+MIN_RUN_TIME = 0.05
+MAX_CALLS_PER_RUN = 1000
+
+# A fastest run this much slower than the baseline is reported as a regression
+DEFAULT_THRESHOLD = 0.2
+
+# Typed one character at a time in the search box
+SEARCH_WORD = 'biedronka'
+
+# Registered benchmarks: (name, function, repeat, setup)
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=DEFAULT_REPEAT, setup=None):
+    """Registers a benchmark function taking the Context.
+
+    `setup(context)` runs untimed before every run. A function returning a
+    number of rows also gets a rows-per-second figure.
+    """
+    def register(function):
+        BENCHMARKS.append((name, function, repeat, setup))
+        return function
+    return register
+
+
+class Context:
+    """Ledger paths, the Qt application and the main window shared by the benchmarks."""
+
+    def __init__(self, ledger_path, statement_path, workdir, rows):
+        self.ledger_path = ledger_path
+        self.statement_path = statement_path
+        self.workdir = workdir
+        self.rows = rows
+        self.database = os.path.join(workdir, 'bench.db')
+        # (date, id) key of the row in the middle of the ledger
+        self.middle_key = None
+        self._app = None
+        self._window = None
+        shutil.copy(ledger_path, self.database)
+        self.use_database()
+
+    def use_database(self, path=None):
+        db.configure_database(path=path or self.database)
+        db.initialize_database()
+
+    def app(self):
+        if self._app is None:
+            from PySide6.QtWidgets import QApplication
+            self._app = QApplication.instance() or QApplication([])
+        return self._app
+
+    def new_window(self):
+        """Opens a main window and waits until its data is loaded."""
+        import main
+        self.app()
+        window = main.MainWindow()
+        # Snapshots run in their own thread and are not what is measured here
+        window.backup_if_due = lambda: None
+        window.show()
+        self.settle(window)
+        return window
+
+    def window(self):
+        if self._window is None:
+            self._window = self.new_window()
+        return self._window
+
+    def settle(self, window):
+        """Processes events until the window's queries are answered."""
+        app = self.app()
+        while (window.expense_chart is None or window.filter_timer.isActive()
+               or window.db_worker.pending('chart', 'budget', 'month_expenses', 'transactions')):
+            app.processEvents()
+            time.sleep(0.0005)
+        app.processEvents()
+
+    def close(self):
+        if self._window is not None:
+            self._window.close()
+            self._window = None
+        db.close_connections()
+
+
+# --- Database -----------------------------------------------------------------
+
+@benchmark('db.initialize_database')
+def bench_initialize(context):
+    db.initialize_database()
+
+
+@benchmark('db.transactions_page.first')
+def bench_first_page(context):
+    return len(db.get_transactions_page())
+
+
+@benchmark('db.transactions_page.deep')
+def bench_deep_page(context):
+    if context.middle_key is None:
+        context.middle_key = tuple(db.get_db_connection().execute(
+            "SELECT date, id FROM transactions ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?", (context.rows // 2,)
+        ).fetchone())
+    return len(db.get_transactions_page(after=context.middle_key))
+
+
+@benchmark('db.expenses_by_category')
+def bench_expenses_by_category(context):
+    db.expenses_by_category()
+
+
+@benchmark('db.expenses_by_category.search')
+def bench_expenses_by_category_search(context):
+    db.expenses_by_category(text_filter='bie')
+
+
+@benchmark('db.month_expenses')
+def bench_month_expenses(context):
+    db.get_month_expenses(6, 2025)
+
+
+@benchmark('db.month_expenses.search')
+def bench_month_expenses_search(context):
+    db.get_month_expenses(6, 2025, text_filter='bie')
+
+
+@benchmark('db.monthly_totals')
+def bench_monthly_totals(context):
+    db.get_monthly_totals(2025)
+
+
+@benchmark('db.search_transactions')
+def bench_search(context):
+    db.search_transactions('bie')
+
+
+def _foreign_transactions(context):
+    # A copy of the ledger with every 100th transaction in euros, so the
+    # other benchmarks keep their single-currency ledger
+    path = os.path.join(context.workdir, 'fx.db')
+    shutil.copy(context.database, path)
+    context.use_database(path)
+    with db.transaction() as conn:
+        conn.execute("UPDATE transactions SET currency = 'EUR' WHERE id % 100 = 0")
+
+
+@benchmark('db.add_fx_rates', setup=_foreign_transactions)
+def bench_add_fx_rates(context):
+    # A year of monthly rates; the rollup rows of those transactions move to them
+    try:
+        db.add_fx_rates([(f'2025-{month:02d}-01', 'EUR', 'PLN', 4.2 + month / 100) for month in range(1, 13)])
+    finally:
+        context.use_database()
+
+
+# --- Analytics ----------------------------------------------------------------
+
+# A day near the end of the synthetic ledger, for the month forecast
+FORECAST_DAY = date(2025, 12, 15)
+
+
+@benchmark('analytics.load')
+def bench_analytics_load(context):
+    analytics.load_daily_totals()
+
+
+@benchmark('analytics.trends')
+def bench_analytics_trends(context):
+    totals = analytics.load_daily_totals()
+    monthly = analytics.time_series(totals, 'month', db.get_category_tree().groups(), other='Uncategorized')
+    weekly = analytics.time_series(totals, 'week')
+    analytics.rolling_mean(monthly.values, 3)
+    analytics.year_over_year(weekly.total(), 'week')
+
+
+@benchmark('analytics.forecast')
+def bench_analytics_forecast(context):
+    analytics.month_forecast(analytics.load_daily_totals(), FORECAST_DAY)
+
+
+# --- Table model --------------------------------------------------------------
+
+@benchmark('model.first_page')
+def bench_model_first_page(context):
+    from app.models.transaction_table_model import TransactionTableModel
+    context.app()
+    model = TransactionTableModel()
+    model.reload()
+    return model.rowCount()
+
+
+@benchmark('model.load_all', repeat=3)
+def bench_model_load_all(context):
+    from app.models.transaction_table_model import TransactionTableModel
+    context.app()
+    model = TransactionTableModel(page_size=10000)
+    model.reload()
+    while model.canFetchMore():
+        model.fetchMore()
+    return model.rowCount()
+
+
+# --- Main window --------------------------------------------------------------
+
+@benchmark('ui.startup', repeat=3)
+def bench_startup(context):
+    context.new_window().close()
+
+
+def _set_search(context, text):
+    window = context.window()
+    window.description_filter.setText(text)
+    window.apply_filters()
+    context.settle(window)
+
+
+@benchmark('ui.search.first_keystroke', setup=lambda context: _set_search(context, ''))
+def bench_first_keystroke(context):
+    _set_search(context, SEARCH_WORD[0])
+
+
+@benchmark('ui.search.next_keystroke', setup=lambda context: _set_search(context, SEARCH_WORD[:-1]))
+def bench_next_keystroke(context):
+    _set_search(context, SEARCH_WORD)
+
+
+@benchmark('ui.search.clear', setup=lambda context: _set_search(context, SEARCH_WORD))
+def bench_clear_search(context):
+    _set_search(context, '')
+
+
+@benchmark('ui.budget_display', setup=lambda context: _set_search(context, ''))
+def bench_budget_display(context):
+    window = context.window()
+    window.update_budget_display()
+    context.settle(window)
+
+
+@benchmark('ui.chart.update', setup=lambda context: _set_search(context, ''))
+def bench_chart_update(context):
+    window = context.window()
+    window.update_chart()
+    context.settle(window)
+
+
+@benchmark('ui.chart.redraw')
+def bench_chart_redraw(context):
+    window = context.window()
+    expenses = dict(window.expenses_by_category)
+    # Alternates between two sets of slices, so every run changes the chart
+    for category in list(expenses)[:2]:
+        del expenses[category]
+    window.expense_chart.set_expenses(expenses, "Wydatki")
+    window.expense_chart.set_expenses(window.expenses_by_category, "Wydatki")
+    context.app().processEvents()
+
+
+# --- Import, export and backup ------------------------------------------------
+
+def _empty_database(context):
+    path = os.path.join(context.workdir, 'import.db')
+    if os.path.exists(path):
+        os.remove(path)
+    context.use_database(path)
+
+
+@benchmark('import.csv', repeat=3, setup=_empty_database)
+def bench_import(context):
+    try:
+        return importer.import_file(context.statement_path)['imported']
+    finally:
+        context.use_database()
+
+
+def _export_benchmark(file_format):
+    def run(context):
+        return exporter.export_transactions(os.path.join(context.workdir, f'export.{file_format}'), file_format)
+    return run
+
+
+for _format in exporter.FORMATS:
+    benchmark(f'export.{_format}', repeat=3)(_export_benchmark(_format))
+
+
+@benchmark('backup.snapshot', repeat=3)
+def bench_snapshot(context):
+    backup.create_snapshot(os.path.join(context.workdir, 'backups'), keep=1)
+    return context.rows
+
+
+# --- Runner -------------------------------------------------------------------
+
+def run_benchmark(context, function, repeat, setup):
+    """Times a benchmark; returns its median, min and max time per call in seconds.
+
+    One untimed run warms the caches first. Without a setup, calls faster
+    than MIN_RUN_TIME are repeated within a run, like timeit does, so
+    that timer resolution and noise do not dominate short timings.
+    """
+    if setup is not None:
+        setup(context)
+    start = time.perf_counter()
+    rows = function(context)
+    number = 1
+    if setup is None:
+        number = max(1, min(MAX_CALLS_PER_RUN, int(MIN_RUN_TIME / max(time.perf_counter() - start, 1e-9))))
+    timings = []
+    for _run in range(repeat):
+        if setup is not None:
+            setup(context)
+        start = time.perf_counter()
+        for _call in range(number):
+            function(context)
+        timings.append((time.perf_counter() - start) / number)
+    result = {
+        'median': statistics.median(timings),
+        'min': min(timings),
+        'max': max(timings),
+        'runs': repeat,
+        'calls_per_run': number,
+    }
+    if isinstance(rows, int) and rows:
+        result['rows'] = rows
+        result['rows_per_second'] = rows / result['median']
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(args):
+    return {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'rows': args.rows,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, baseline, threshold, stream=sys.stdout):
+    """Prints the change of every fastest run against a baseline; returns the names of the regressions."""
+    regressions = []
+    print(f"{'benchmark':<34} {'baseline':>10} {'current':>10} {'change':>8}", file=stream)
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<34} {'-':>10} {result['min'] * 1000:8.2f}ms {'new':>8}", file=stream)
+            continue
+        change = result['min'] / before['min'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<34} {before['min'] * 1000:8.2f}ms {result['min'] * 1000:8.2f}ms {change:+8.1%}{flag}",
+              file=stream)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description="Runs the benchmark suite.")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help="ledger size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'finance-benchmarks'),
+                        help="where ledgers are cached and benchmarks write their files")
+    parser.add_argument('--only', action='append', help="runs the benchmarks matching a glob pattern")
+    parser.add_argument('--output', help="JSON file to save the results in")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown reported as a regression (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    ledger_path = os.path.join(args.workdir, f'ledger-{args.rows}-{args.seed}.db')
+    statement_path = os.path.join(args.workdir, f'statement-{args.rows}-{args.seed}.csv')
+    if not os.path.exists(ledger_path):
+        print(f"Generating a ledger of {args.rows} rows...", file=sys.stderr)
+        ledger.create_ledger(ledger_path, args.rows, args.seed)
+        db.close_connections()
+    if not os.path.exists(statement_path):
+        ledger.write_statement(statement_path, args.rows, args.seed)
+
+    selected = [
+        entry for entry in BENCHMARKS
+        if not args.only or any(fnmatch.fnmatch(entry[0], pattern) for pattern in args.only)
+    ]
+    context = Context(ledger_path, statement_path, args.workdir, args.rows)
+    results = {}
+    try:
+        for name, function, repeat, setup in selected:
+            results[name] = result = run_benchmark(context, function, repeat, setup)
+            throughput = f"  {result['rows_per_second']:,.0f} rows/s" if 'rows_per_second' in result else ''
+            print(f"{name:<34} {result['median'] * 1000:10.2f} ms{throughput}", file=sys.stderr)
+    finally:
+        context.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as stream:
+            json.dump({'meta': metadata(args), 'results': results}, stream, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as stream:
+            baseline = json.load(stream)
+        if baseline['meta'].get('rows') != args.rows:
+            print(f"Warning: the baseline ran on {baseline['meta'].get('rows')} rows", file=sys.stderr)
+        if compare(results, baseline['results'], args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,56 +1,75 @@
 import sys
+import time
+
+# Origin of the --profile-startup timings, taken before the heavy imports
+START_TIME = time.perf_counter()
+
 import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QMenu, QMessageBox, 
-    QLineEdit, QComboBox, QVBoxLayout, QWidget, QLabel, QHBoxLayout, QDoubleSpinBox, QToolTip, QProgressBar, QInputDialog, QPushButton, QAbstractItemView
+    QLineEdit, QComboBox, QVBoxLayout, QWidget, QLabel, QHBoxLayout, QDoubleSpinBox, QToolTip, QProgressBar, QInputDialog, QPushButton, QAbstractItemView,
+    QFileDialog, QProgressDialog
 )
-from PySide6.QtGui import QStandardItemModel, QStandardItem, QPainter, QCursor, QAction
+from PySide6.QtGui import QCursor, QAction
 from PySide6.QtCore import Qt, QSortFilterProxyModel, QDate, QSize, QTimer, QCoreApplication
-from PySide6.QtCharts import QChart, QPieSeries
 from app.ui.main_window_ui import Ui_MainWindow
-from app.add_transaction_dialog import AddTransactionDialog
+from app.database import backup
 from app.database import database as db
-from app.ui.onboarding_window import OnboardingWindow
-
-class TransactionFilterProxyModel(QSortFilterProxyModel):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.filter_description = ""
-        self.filter_categories = []
-
-    def set_filter_description(self, description):
-        self.filter_description = description.lower()
-        self.invalidateFilter()
-
-    def set_filter_categories(self, categories):
-        self.filter_categories = categories
-        self.invalidateFilter()
-
-    def filterAcceptsRow(self, source_row, source_parent):
-        description_index = self.sourceModel().index(source_row, 2, source_parent)
-        category_index = self.sourceModel().index(source_row, 4, source_parent)
-
-        description = self.sourceModel().data(description_index).lower()
-        category = self.sourceModel().data(category_index)
+from app.db_worker import DatabaseWorker
+from app import instrumentation, recurring
+from app.instrumentation import timed
+from app.models.transaction_table_model import TransactionTableModel
+from app.models.money import Money
+from app.startup_profile import StartupProfile
+# QtCharts, the importer and the dialogs are imported where they are first
+# used, so they do not delay the first frame
+
+# Quiet time after the last keystroke in the search box before the filters are applied
+FILTER_DELAY_MS = 250
+
+# Rows sampled when fitting the table columns to their contents
+RESIZE_PRECISION_ROWS = 50
+
+# A snapshot of the database is made when the newest one is older than this;
+# checked at startup and then every BACKUP_CHECK_MS
+BACKUP_INTERVAL = timedelta(days=1)
+BACKUP_CHECK_MS = 60 * 60 * 1000
+
+# (key, label) of the charts the chart view shows: the pie of ExpenseChart
+# and the line charts of app.ui.trend_chart
+CHART_KINDS = (
+    ('categories', "Struktura wydatków"),
+    ('category_trend', "Trend według kategorii"),
+    ('monthly', "Wydatki miesięczne"),
+    ('weekly', "Wydatki tygodniowe"),
+    ('forecast', "Prognoza miesiąca"),
+)
 
-        description_match = self.filter_description in description
-        
-        if not self.filter_categories:
-            category_match = True
-        else:
-            category_match = category in self.filter_categories
+class MainWindow(QMainWindow, Ui_MainWindow):
+    """The main window.
 
-        return description_match and category_match
+    The constructor only builds the window shell. The chart and the data
+    are loaded by finish_startup() once the first frame has been painted.
+    """
 
-class MainWindow(QMainWindow, Ui_MainWindow):
-    def __init__(self):
+    def __init__(self, ask_for_budget=False, profile=None):
         super().__init__()
         self.setupUi(self)
-
-        self.chart_colors = [
-            '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
-            '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'
-        ]
+        self.ask_for_budget = ask_for_budget
+        self.profile = profile
+        self.startup_finished = False
+        # Every total, the budget included, is in this currency
+        self.main_currency = db.get_main_currency()
+
+        # Created in finish_startup(); the chart and its series then live as
+        # long as the window and updates diff the slices
+        self.chart_view = None
+        self.expense_chart = None
+        # Line charts of the other chart kinds, created when first chosen
+        self.trend_chart = None
 
         # Add summary widgets
         summary_layout = QHBoxLayout()
@@ -59,7 +78,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         # Add budget widgets
         budget_layout = QVBoxLayout()
-        self.budget_label = QLabel("Budżet miesięczny: 0.00 / 0.00 PLN")
+        self.budget_label = QLabel(f"Budżet miesięczny: 0.00 / 0.00 {self.main_currency}")
         self.budget_progress_bar = QProgressBar()
         self.budget_progress_bar.setRange(0, 100)
         self.budget_progress_bar.setValue(0)
@@ -86,7 +105,34 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.chart_back_button.setVisible(False)
         self.chart_layout.insertWidget(0, self.chart_back_button)
 
+        self.chart_kind_combobox = QComboBox()
+        for kind, label in CHART_KINDS:
+            self.chart_kind_combobox.addItem(label, kind)
+        self.chart_layout.insertWidget(0, self.chart_kind_combobox)
+
         self.action_exit.triggered.connect(self.close)
+        self.action_import = QAction("Importuj transakcje...", self)
+        self.action_import.triggered.connect(self.import_transactions)
+        self.menu_file.addAction(self.action_import)
+        self.action_import_rates = QAction("Importuj kursy walut...", self)
+        self.action_import_rates.triggered.connect(self.import_fx_rates)
+        self.menu_file.addAction(self.action_import_rates)
+        self.action_fuzzy_duplicates = QAction("Pomijaj podobne transakcje przy imporcie", self)
+        self.action_fuzzy_duplicates.setCheckable(True)
+        self.menu_file.addAction(self.action_fuzzy_duplicates)
+        self.action_rules = QAction("Reguły kategorii...", self)
+        self.action_rules.triggered.connect(self.show_rules_dialog)
+        self.menu_file.addAction(self.action_rules)
+        self.action_backup = QAction("Utwórz kopię zapasową", self)
+        self.action_backup.triggered.connect(self.backup_now)
+        self.menu_file.addAction(self.action_backup)
+        self.action_restore_backup = QAction("Przywróć kopię zapasową...", self)
+        self.action_restore_backup.triggered.connect(self.restore_backup)
+        self.menu_file.addAction(self.action_restore_backup)
+        if instrumentation.is_enabled():
+            self.action_diagnostics = QAction("Diagnostyka wydajności...", self)
+            self.action_diagnostics.triggered.connect(self.show_diagnostics)
+            self.menu_file.addAction(self.action_diagnostics)
         self.action_factory_reset = QAction("Przywróć ustawienia fabryczne", self)
         self.action_factory_reset.triggered.connect(self.factory_reset)
         self.menu_file.addAction(self.action_factory_reset)
@@ -94,9 +140,14 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.menu_file.addAction(self.action_exit)
 
         self.add_transaction_button.clicked.connect(self.show_add_transaction_dialog)
-        self.description_filter.textChanged.connect(self.apply_filters)
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY_MS)
+        self.filter_timer.timeout.connect(self.apply_filters)
+        self.description_filter.textChanged.connect(self.on_description_filter_changed)
         self.category_filter.currentTextChanged.connect(self.apply_filters)
         self.chart_back_button.clicked.connect(self.show_main_chart)
+        self.chart_kind_combobox.currentIndexChanged.connect(self.on_chart_kind_changed)
 
         # Enable context menu
         self.transactions_table_view.setContextMenuPolicy(Qt.CustomContextMenu)
@@ -121,12 +172,69 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             }
         """)
         self.transactions_table_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.transactions_table_view.horizontalHeader().setResizeContentsPrecision(RESIZE_PRECISION_ROWS)
+
+        # Queries behind the table, chart and budget run in a worker thread
+        self.db_worker = DatabaseWorker(self)
+        self.db_worker.failed.connect(self.on_query_failed)
+        # Snapshots get a thread of their own, so they never hold up the queries
+        self.backup_worker = DatabaseWorker(self)
+        self.backup_worker.failed.connect(self.on_backup_failed)
+        self.backup_stop = threading.Event()
+        self.backup_timer = QTimer(self)
+        self.backup_timer.setInterval(BACKUP_CHECK_MS)
+        self.backup_timer.timeout.connect(self.backup_if_due)
+
+        self.model = TransactionTableModel(self, worker=self.db_worker)
+        self.model.first_page_loaded.connect(self.transactions_table_view.resizeColumnsToContents)
+        # Filtering happens in SQL inside the model; the proxy only sorts the result set
+        self.proxy_model = QSortFilterProxyModel(self)
+        self.proxy_model.setSourceModel(self.model)
+        self.proxy_model.setSortRole(Qt.UserRole)
+        self.transactions_table_view.setModel(self.proxy_model)
+        self.transactions_table_view.hideColumn(0)
 
         self.current_chart_category = None
+        self.current_chart_category_id = None
         self.chart_filter_categories = []
+        self.chart_groups = {}
+        self.expenses_by_category = {}
+        self.budget = None
+        self.budget_month_prefix = ""
+        self.month_expenses = Money()
+        QTimer.singleShot(0, self.update_button_position)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.startup_finished:
+            self.startup_finished = True
+            if self.profile is not None:
+                self.profile.mark("first frame")
+            # Runs once this frame is on screen
+            QTimer.singleShot(0, self.finish_startup)
+
+    @timed
+    def finish_startup(self):
+        """Adds the chart and starts loading the transactions and totals."""
+        from PySide6.QtCharts import QChartView
+        from app.ui.expense_chart import ExpenseChart
+
+        self.chart_view = QChartView(self.right_widget)
+        self.chart_view.setObjectName("chart_view")
+        self.chart_layout.addWidget(self.chart_view)
+        self.expense_chart = ExpenseChart(self.chart_view, self.on_series_hovered, self.on_slice_clicked)
         self.load_transactions()
         self.apply_filters()
-        QTimer.singleShot(0, self.update_button_position)
+        self.backup_timer.start()
+        self.backup_if_due()
+        if self.profile is not None:
+            self.profile.mark("chart and queries")
+            self.db_worker.idle.connect(self.report_startup)
+
+    def report_startup(self):
+        self.db_worker.idle.disconnect(self.report_startup)
+        self.profile.mark("data loaded")
+        self.profile.report()
 
     def update_button_position(self):
         button_size = int(self.left_widget.width() * 0.10)
@@ -147,98 +255,98 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         super().resizeEvent(event)
         self.update_button_position()
 
+    def closeEvent(self, event):
+        self.stop_background_work()
+        super().closeEvent(event)
+
+    def stop_background_work(self):
+        """Cancels a snapshot in progress and stops the worker threads."""
+        self.backup_stop.set()
+        self.backup_worker.shutdown()
+        self.db_worker.shutdown()
+
+    def on_query_failed(self, key, error):
+        QMessageBox.warning(self, "Błąd bazy danych", f"Nie udało się wczytać danych: {error}")
+
+    @timed
     def load_transactions(self):
         """Loads transactions and categories."""
-        transactions = db.get_all_transactions()
-        self.model = QStandardItemModel(len(transactions), 5)
-        self.model.setHorizontalHeaderLabels(['ID', 'Data', 'Opis', 'Kwota', 'Kategoria'])
-
-        for row, transaction in enumerate(transactions):
-            id_item = QStandardItem(str(transaction['id']))
-            date_item = QStandardItem(transaction['date'])
-            description_item = QStandardItem(transaction['description'])
-            amount_item = QStandardItem(f"{transaction['amount']:.2f}")
-            category_item = QStandardItem(transaction['category'])
-            self.model.setItem(row, 0, id_item)
-            self.model.setItem(row, 1, date_item)
-            self.model.setItem(row, 2, description_item)
-            self.model.setItem(row, 3, amount_item)
-            self.model.setItem(row, 4, category_item)
-
-        self.proxy_model = TransactionFilterProxyModel(self)
-        self.proxy_model.setSourceModel(self.model)
-        self.transactions_table_view.setModel(self.proxy_model)
-        self.transactions_table_view.hideColumn(0)
-
-        # Right-align the amount column and resize columns
-        for row in range(self.model.rowCount()):
-            item = self.model.item(row, 3) # Column 3 is 'Kwota'
-            if item:
-                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        self.transactions_table_view.resizeColumnsToContents()
+        self.model.reload()
 
         # Populate category filter with hierarchy
         self.category_filter.blockSignals(True)
         self.category_filter.clear()
         self.category_filter.addItem("Wszystkie kategorie")
-        categories = db.get_all_categories()
-        categories_by_parent = {None: []}
-        for cat in categories:
-            parent_id = cat['parent_id']
-            if parent_id not in categories_by_parent:
-                categories_by_parent[parent_id] = []
-            categories_by_parent[parent_id].append(cat)
-
-        def add_items_recursively(parent_id, indent_level=0):
-            if parent_id in categories_by_parent:
-                for cat in sorted(categories_by_parent[parent_id], key=lambda x: x['name']):
-                    self.category_filter.addItem("  " * indent_level + cat['name'])
-                    add_items_recursively(cat['id'], indent_level + 1)
-        add_items_recursively(None)
+        for category_id, name, depth, _has_children in db.get_category_tree().display_order:
+            self.category_filter.addItem("  " * depth + name, category_id)
         self.category_filter.blockSignals(False)
 
     def get_categories_from_combobox(self):
-        """Gets the category filter list from the combobox selection."""
+        """Gets the category id filter list from the combobox selection."""
         selected_index = self.category_filter.currentIndex()
         if selected_index <= 0:
             return []
         
-        selected_category_name = self.category_filter.currentText().strip()
-        categories_to_filter = [selected_category_name]
-        conn = db.get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM categories WHERE name = ?", (selected_category_name,))
-        result = cursor.fetchone()
-        if result is None:
-            conn.close()
-            return categories_to_filter
-        
-        category_id = result[0]
-        cursor.execute("SELECT name FROM categories WHERE parent_id = ?", (category_id,))
-        subcategories = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return categories_to_filter + subcategories
+        category_id = self.category_filter.currentData()
+        # The category first, then its descendants at any depth
+        return [category_id] + sorted(db.get_category_tree().descendants(category_id))
+
+    def on_description_filter_changed(self):
+        """Restarts the filter delay and drops the work still being done for older input."""
+        self.model.stop_loading()
+        self.db_worker.cancel('chart')
+        self.db_worker.cancel('month_expenses')
+        self.db_worker.cancel('trend')
+        self.filter_timer.start()
 
     def apply_filters(self):
         """Applies all active filters to the transaction view."""
-        self.proxy_model.set_filter_description(self.description_filter.text())
-
-        # Get categories for table filter from the combobox selection
-        categories_for_table = self.get_categories_from_combobox()
-        self.proxy_model.set_filter_categories(categories_for_table)
-
-        # Check if the selected category is a parent to set the chart state
-        selected_category_name = self.category_filter.currentText().strip()
+        # A span rather than @timed: the slot must keep its signature, Qt
+        # passes the signal's arguments to a wrapper taking *args
+        with instrumentation.span('MainWindow.apply_filters'):
+            self.filter_timer.stop()
+            # Get categories for table filter from the combobox selection
+            categories_for_table = self.get_categories_from_combobox()
+            self.model.set_filters(self.description_filter.text(), categories_for_table)
+
+            # Check if the selected category is a parent to set the chart state
+            selected_category_name = self.category_filter.currentText().strip()
         
-        # A parent category will have its subcategories in the list.
-        # A child category will only have itself. "All categories" is an empty list.
-        if len(categories_for_table) > 1:
-            self.current_chart_category = selected_category_name
-        else:
-            self.current_chart_category = None
-
-        self.update_chart()
-        self.update_budget_display()
+            # A parent category will have its subcategories in the list.
+            # A child category will only have itself. "All categories" is an empty list.
+            if len(categories_for_table) > 1:
+                self.current_chart_category = selected_category_name
+                self.current_chart_category_id = categories_for_table[0]
+            else:
+                self.current_chart_category = None
+                self.current_chart_category_id = None
+
+            if self.model.is_complete():
+                # Narrowing left the whole result set in the table, so sum it there
+                self.sum_loaded_transactions()
+            else:
+                self.update_chart()
+                self.update_budget_display()
+
+    @timed
+    def sum_loaded_transactions(self):
+        """Computes the chart and budget totals from the rows loaded in the table."""
+        self.db_worker.cancel('chart')
+        self.db_worker.cancel('month_expenses')
+        self.chart_groups = db.get_category_tree().groups(self.current_chart_category_id)
+        totals = {}
+        month_cents = 0
+        for date, cents, category_id in self.model.loaded_rows():
+            if date.startswith(self.budget_month_prefix):
+                month_cents += cents
+            chart_key = self.chart_key(category_id)
+            if chart_key is not None:
+                totals[chart_key] = totals.get(chart_key, 0) + cents
+        self.expenses_by_category = {
+            key: Money(cents) for key, cents in sorted(totals.items(), key=lambda item: -item[1]) if cents
+        }
+        self.month_expenses = Money(month_cents)
+        self.refresh_aggregates()
 
     def show_context_menu(self, pos):
         proxy_index = self.transactions_table_view.indexAt(pos)
@@ -255,56 +363,146 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.delete_transaction(source_index)
 
     def edit_transaction(self, index):
-        model = self.model
-        transaction_id = int(model.item(index.row(), 0).text())
-        transaction_data = {
-            'date': model.item(index.row(), 1).text(),
-            'description': model.item(index.row(), 2).text(),
-            'amount': float(model.item(index.row(), 3).text()),
-            'category': model.item(index.row(), 4).text()
-        }
-        dialog = AddTransactionDialog(self, transaction_data)
+        old_transaction = self.model.transaction_at(index.row())
+        transaction_id = old_transaction['id']
+        from app.add_transaction_dialog import AddTransactionDialog
+        dialog = AddTransactionDialog(self, old_transaction)
         if dialog.exec():
             new_data = dialog.get_transaction_data()
-            db.update_transaction(transaction_id, new_data)
-            self.load_transactions()
-            self.apply_filters()
+            transaction_id = db.update_transaction(transaction_id, new_data)
+            new_transaction = db.get_transaction(transaction_id)
+            self.model.update_transaction(new_transaction)
+            self.apply_transaction_deltas((old_transaction, -1), (new_transaction, 1))
+            self.warn_if_no_rate(new_transaction)
 
     def delete_transaction(self, index):
-        model = self.model
-        transaction_id = int(model.item(index.row(), 0).text())
+        old_transaction = self.model.transaction_at(index.row())
         reply = QMessageBox.question(self, "Potwierdzenie", 
                                      "Czy na pewno chcesz usunąć tę transakcję?",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            db.delete_transaction(transaction_id)
-            self.load_transactions()
-            self.apply_filters()
+            transaction_id = db.delete_transaction(old_transaction['id'])
+            self.model.remove_transaction(transaction_id)
+            self.apply_transaction_deltas((old_transaction, -1))
 
     def show_add_transaction_dialog(self):
+        from app.add_transaction_dialog import AddTransactionDialog
         dialog = AddTransactionDialog(self)
         if dialog.exec():
             data = dialog.get_transaction_data()
-            db.add_transaction(data)
-            self.load_transactions()
-            self.apply_filters()
+            if data['frequency']:
+                self.add_recurring_transaction(data)
+                return
+            transaction_id = db.add_transaction(data)
+            new_transaction = db.get_transaction(transaction_id)
+            self.model.insert_transaction(new_transaction)
+            self.apply_transaction_deltas((new_transaction, 1))
+            self.warn_if_no_rate(new_transaction)
+
+    def warn_if_no_rate(self, transaction):
+        """Tells the user that a transaction in another currency is summed unconverted."""
+        if transaction['currency'] and transaction['currency'] in db.get_currencies_without_rates():
+            self.statusbar.showMessage(
+                f"Brak kursu {transaction['currency']}/{self.main_currency}: kwota jest liczona bez przeliczenia. "
+                "Zaimportuj kursy walut z menu Plik.", 15000
+            )
+
+    def add_recurring_transaction(self, data):
+        """Adds a recurring rule starting on the entered date and posts its occurrences due so far."""
+        db.add_recurring_rule(
+            data['description'], abs(Money.from_value(data['amount'])), data['frequency'], data['date'],
+            data['category_id']
+        )
+        if recurring.materialize_due():
+            self.model.reload()
+            self.update_chart()
+            self.update_budget_display()
+
+    @timed
+    def apply_transaction_deltas(self, *changes):
+        """Applies (transaction, sign) changes to the totals and redraws the chart and budget."""
+        if self.filter_timer.isActive():
+            return  # the filters about to be applied compute the totals again
+        if self.db_worker.pending('chart', 'month_expenses'):
+            # Totals still being read may predate the change, so read them again
+            self.update_chart()
+            self.update_budget_display()
+            return
+        for transaction, sign in changes:
+            self.apply_transaction_delta(transaction, sign)
+        self.refresh_aggregates()
 
+    def apply_transaction_delta(self, transaction, sign):
+        """Adds (sign=1) or removes (sign=-1) one transaction from the chart and budget totals."""
+        if not self.model.accepts(transaction):
+            return
+        amount = transaction['main_amount']
+        if not isinstance(amount, Money):
+            amount = Money(amount)  # rows read from the database hold cents
+        amount = amount * sign
+        if transaction['date'].startswith(self.budget_month_prefix):
+            self.month_expenses += amount
+        chart_key = self.chart_key(transaction['category_id'])
+        if chart_key is not None:
+            total = self.expenses_by_category.get(chart_key, Money()) + amount
+            if not total:
+                self.expenses_by_category.pop(chart_key, None)
+            else:
+                self.expenses_by_category[chart_key] = total
+
+    def refresh_aggregates(self):
+        """Redraws the chart and the budget from the current totals."""
+        self.draw_chart()
+        self.draw_budget()
+        self.update_trend_chart()
+
+    @timed
     def update_budget_display(self):
         today = QDate.currentDate()
         current_month = today.month()
         current_year = today.year()
-        budget = db.get_budget_for_month(current_month, current_year)
-        total_expenses_this_month = 0
-        for row in range(self.proxy_model.rowCount()):
-            date_index = self.proxy_model.index(row, 1)
-            amount_index = self.proxy_model.index(row, 3)
-            transaction_date_str = self.proxy_model.data(date_index)
-            transaction_date = QDate.fromString(transaction_date_str, "yyyy-MM-dd")
-            if transaction_date.month() == current_month and transaction_date.year() == current_year:
-                total_expenses_this_month += float(self.proxy_model.data(amount_index))
+        self.budget_month_prefix = f"{current_year:04d}-{current_month:02d}"
+        self.db_worker.submit('budget', self.on_budget_loaded, db.get_budget_for_month, current_month, current_year)
+        self.db_worker.submit(
+            'month_expenses', self.on_month_expenses_loaded, db.get_month_expenses,
+            current_month, current_year, self.model.text_filter, self.model.categories
+        )
+
+    def on_budget_loaded(self, budget):
+        self.budget = budget
+        self.draw_budget()
+        if self.trend_chart is not None and self.trend_chart.data is not None:
+            self.trend_chart.set_data(self.trend_chart.data, budget)
+        if self.ask_for_budget:
+            self.ask_for_budget = False
+            if budget is None:
+                QTimer.singleShot(0, self.prompt_for_budget)
+
+    def prompt_for_budget(self):
+        today = QDate.currentDate()
+        current_month = today.month()
+        current_year = today.year()
+        budget_amount, ok = QInputDialog.getDouble(
+            self,
+            "Ustaw budżet miesięczny",
+            f"Nie ustawiono jeszcze budżetu na {current_month}/{current_year}.\nCzy chcesz go teraz zdefiniować?",
+            1000.00, 0.00, 1000000.00, 2
+        )
+        if ok:
+            db.set_budget_for_month(budget_amount, current_month, current_year)
+            self.update_budget_display()
+
+    def on_month_expenses_loaded(self, month_expenses):
+        self.month_expenses = month_expenses
+        self.draw_budget()
+
+    @timed
+    def draw_budget(self):
+        budget = self.budget
+        total_expenses_this_month = self.month_expenses
         if budget is not None:
-            self.budget_label.setText(f"Budżet miesięczny: {total_expenses_this_month:.2f} / {budget:.2f} PLN")
-            progress = int((total_expenses_this_month / budget) * 100) if budget > 0 else 0
+            self.budget_label.setText(f"Budżet miesięczny: {total_expenses_this_month:.2f} / {budget:.2f} {self.main_currency}")
+            progress = total_expenses_this_month.cents * 100 // budget.cents if budget.cents > 0 else 0
             self.budget_progress_bar.setValue(progress)
             self.budget_progress_bar.setFormat(f"{progress}%")
             color = "#4CAF50"
@@ -320,146 +518,304 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
     def on_slice_clicked(self, slice):
         category_name = slice.property("original_category")
-        if category_name == "Inne":
+        from app.ui.expense_chart import OTHER_LABEL
+        if category_name == OTHER_LABEL:
             return
 
         # Find the category in the combobox and select it.
         # This will trigger apply_filters and update the chart correctly.
-        for i in range(self.category_filter.count()):
-            if self.category_filter.itemText(i).strip() == category_name:
-                self.category_filter.setCurrentIndex(i)
-                return
+        category_id = db.get_category_tree().id_for_name(category_name)
+        index = self.category_filter.findData(category_id) if category_id is not None else -1
+        if index >= 0:
+            self.category_filter.setCurrentIndex(index)
 
     def show_main_chart(self):
         self.category_filter.setCurrentIndex(0)
 
+    def chart_key(self, category_id):
+        """Returns the chart slice a transaction category counts towards, or None."""
+        if self.current_chart_category is None:
+            return self.chart_groups.get(category_id, 'Uncategorized')
+        return self.chart_groups.get(category_id)
+
+    @timed
     def update_chart(self):
-        expenses_by_category = {}
+        text_filter, categories = self.model.text_filter, self.model.categories
+        # Category id -> slice it is counted in, used to patch the totals after edits
+        chart_groups = db.get_category_tree().groups(self.current_chart_category_id)
+
+        def on_loaded(expenses_by_category):
+            self.chart_groups = chart_groups
+            self.expenses_by_category = expenses_by_category
+            self.draw_chart()
+
+        self.db_worker.submit(
+            'chart', on_loaded, db.expenses_by_category,
+            parent=self.current_chart_category_id, text_filter=text_filter, categories=categories
+        )
+        self.update_trend_chart()
+
+    def chart_kind(self):
+        return self.chart_kind_combobox.currentData()
+
+    def on_chart_kind_changed(self, index):
+        if self.chart_view is None:
+            return
+        if self.chart_kind() == 'categories':
+            self.chart_view.setChart(self.expense_chart.chart)
+            self.draw_chart()
+            return
+        if self.trend_chart is None:
+            from app.ui.trend_chart import TrendChart
+            self.trend_chart = TrendChart()
+        self.chart_back_button.setVisible(False)
+        self.trend_chart.show_in(self.chart_view)
+        self.update_trend_chart()
+
+    @timed
+    def update_trend_chart(self):
+        """Computes the line chart of the chosen kind in the worker thread."""
+        kind = self.chart_kind()
+        if kind == 'categories' or self.trend_chart is None:
+            return
+        from app.ui.trend_chart import load_chart_data
+        # Lines per slice of the pie: the subcategories of a chosen parent, or the top-level categories
+        groups = db.get_category_tree().groups(self.current_chart_category_id)
+        other = 'Uncategorized' if self.current_chart_category is None else None
+        self.db_worker.submit(
+            'trend', lambda data: self.trend_chart.set_data(data, self.budget), load_chart_data,
+            kind, date.today(), self.model.text_filter, self.model.categories, groups, other
+        )
+
+    @timed
+    def draw_chart(self):
+        if self.expense_chart is None or self.chart_kind() != 'categories':
+            return
+        expenses_by_category = self.expenses_by_category
         if self.current_chart_category is None:
             self.chart_back_button.setVisible(False)
             chart_title = "Wydatki według kategorii"
-            conn = db.get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT c.name, p.name FROM categories c JOIN categories p ON c.parent_id = p.id")
-            sub_to_parent = {row[0]: row[1] for row in cursor.fetchall()}
-            conn.close()
-            for row in range(self.proxy_model.rowCount()):
-                amount_index = self.proxy_model.index(row, 3)
-                category_index = self.proxy_model.index(row, 4)
-                amount = float(self.proxy_model.data(amount_index))
-                category = self.proxy_model.data(category_index)
-                main_category = sub_to_parent.get(category, category)
-                if main_category not in expenses_by_category:
-                    expenses_by_category[main_category] = 0
-                expenses_by_category[main_category] += amount
         else:
             self.chart_back_button.setVisible(True)
             chart_title = f"Wydatki: {self.current_chart_category}"
-            conn = db.get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM categories WHERE name = ?", (self.current_chart_category,))
-            parent_id_result = cursor.fetchone()
-            if parent_id_result:
-                parent_id = parent_id_result[0]
-                cursor.execute("SELECT name FROM categories WHERE parent_id = ?", (parent_id,))
-                sub_categories = [row[0] for row in cursor.fetchall()]
-                for row in range(self.proxy_model.rowCount()):
-                    category_index = self.proxy_model.index(row, 4)
-                    category = self.proxy_model.data(category_index)
-                    if category in sub_categories:
-                        amount_index = self.proxy_model.index(row, 3)
-                        amount = float(self.proxy_model.data(amount_index))
-                        if category not in expenses_by_category:
-                            expenses_by_category[category] = 0
-                        expenses_by_category[category] += amount
-            conn.close()
-
-        series = QPieSeries()
-        series.setHoleSize(0.35)
-        total_expenses = sum(expenses_by_category.values())
-        if total_expenses > 0:
-            other_amount = 0
-            color_index = 0
-            for category, amount in expenses_by_category.items():
-                percentage = 100 * amount / total_expenses
-                if percentage < 2 and self.current_chart_category is None:
-                    other_amount += amount
-                else:
-                    slice_ = series.append(category, amount)
-                    slice_.setProperty("original_category", category)
-                    slice_.setColor(self.chart_colors[color_index % len(self.chart_colors)])
-                    color_index += 1
-            if other_amount > 0:
-                slice_ = series.append("Inne", other_amount)
-                slice_.setProperty("original_category", "Inne")
-                slice_.setColor(self.chart_colors[color_index % len(self.chart_colors)])
-
-        series.hovered.connect(self.on_series_hovered)
-        series.clicked.connect(self.on_slice_clicked)
-
-        chart = QChart()
-        chart.addSeries(series)
-        chart.setTitle(chart_title)
-        chart.legend().setVisible(True)
-        chart.legend().setAlignment(Qt.AlignBottom)
-        font = chart.legend().font()
-        font.setPointSize(8)
-        chart.legend().setFont(font)
-        chart.setAnimationOptions(QChart.SeriesAnimations)
-
-        self.chart_view.setChart(chart)
-        self.chart_view.setRenderHint(QPainter.Antialiasing)
+
+        self.expense_chart.set_expenses(
+            expenses_by_category, chart_title, group_small=self.current_chart_category is None
+        )
 
     def on_series_hovered(self, slice, state):
         if state:
             category_name = slice.property("original_category")
-            tooltip_text = f"{category_name}: {slice.value():.2f} zł"
+            tooltip_text = f"{category_name}: {slice.value():.2f} {self.main_currency}"
             QToolTip.showText(QCursor.pos(), tooltip_text)
         else:
             QToolTip.hideText()
 
+    def import_transactions(self):
+        from app import importer
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Importuj transakcje", "",
+            "Wyciągi bankowe (*.csv *.sta *.mt940 *.940 *.ofx *.qfx);;Wszystkie pliki (*)"
+        )
+        if not path:
+            return
+
+        progress_dialog = QProgressDialog("Importowanie transakcji...", "Anuluj", 0, 100, self)
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def report(done, total, imported):
+            if progress_dialog.wasCanceled():
+                raise importer.ImportCancelled()
+            progress_dialog.setLabelText(f"Zaimportowano transakcji: {imported}")
+            progress_dialog.setValue(done * 100 // total if total else 100)
+
+        try:
+            fuzzy_days = importer.FUZZY_DAYS if self.action_fuzzy_duplicates.isChecked() else None
+            result = importer.import_file(path, fuzzy_days=fuzzy_days, progress=report)
+        except importer.ImportCancelled:
+            return
+        except (importer.ImportFormatError, OSError) as error:
+            QMessageBox.warning(self, "Błąd importu", str(error))
+            return
+        finally:
+            progress_dialog.close()
+
+        self.model.reload()
+        self.update_chart()
+        self.update_budget_display()
+
+        message = f"Zaimportowano transakcji: {result['imported']}."
+        if result['skipped']:
+            message += f"\nPominięto wpływy: {result['skipped']}."
+        if result['duplicates']:
+            message += f"\nPominięto duplikaty: {result['duplicates']}."
+        if result['similar']:
+            message += f"\nPominięto podobne transakcje: {result['similar']}."
+        if result['invalid']:
+            errors = "\n".join(f"Wiersz {line}: {error}" for line, error in result['errors'][:10])
+            message += f"\nNieprawidłowe wiersze: {result['invalid']}.\n{errors}"
+        QMessageBox.information(self, "Import zakończony", message)
+
+    def import_fx_rates(self):
+        from app import fx
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Importuj kursy walut", "", "Pliki CSV (*.csv *.txt);;Wszystkie pliki (*)"
+        )
+        if not path:
+            return
+        try:
+            result = fx.import_rates(path)
+        except (fx.RatesFormatError, OSError) as error:
+            QMessageBox.warning(self, "Błąd importu", str(error))
+            return
+
+        self.model.reload()
+        self.update_chart()
+        self.update_budget_display()
+
+        message = f"Zaimportowano kursów: {result['imported']}."
+        if result['invalid']:
+            errors = "\n".join(f"Wiersz {line}: {error}" for line, error in result['errors'][:10])
+            message += f"\nNieprawidłowe wiersze: {result['invalid']}.\n{errors}"
+        missing = db.get_currencies_without_rates()
+        if missing:
+            message += f"\nBrak kursów do {self.main_currency} dla walut: {', '.join(missing)}."
+        QMessageBox.information(self, "Import zakończony", message)
+
+    def show_rules_dialog(self):
+        from app.ui.rules_dialog import RulesDialog
+        dialog = RulesDialog(self)
+        dialog.exec()
+        if dialog.changed:
+            self.model.reload()
+            self.update_chart()
+            self.update_budget_display()
+
+    def show_diagnostics(self):
+        from app.ui.diagnostics_dialog import DiagnosticsDialog
+        # Not modal, so it can stay open while the window is used
+        dialog = DiagnosticsDialog(self)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.show()
+
+    def backup_if_due(self):
+        latest = backup.latest_snapshot_time()
+        if latest is None or datetime.now() - latest >= BACKUP_INTERVAL:
+            self.create_backup()
+
+    def backup_now(self):
+        self.create_backup(notify=True)
+
+    def create_backup(self, notify=False):
+        """Makes a snapshot in the background; the window stays usable meanwhile."""
+        if self.backup_worker.pending('backup'):
+            return
+        self.statusbar.showMessage("Tworzenie kopii zapasowej...")
+
+        def on_created(path):
+            message = f"Utworzono kopię zapasową: {os.path.basename(path)}"
+            self.statusbar.showMessage(message, 10000)
+            if notify:
+                QMessageBox.information(self, "Kopia zapasowa", message)
+
+        self.backup_worker.submit('backup', on_created, backup.create_snapshot, stop=self.backup_stop)
+
+    def on_backup_failed(self, key, error):
+        self.statusbar.clearMessage()
+        QMessageBox.warning(self, "Błąd kopii zapasowej", f"Nie udało się utworzyć kopii zapasowej: {error}")
+
+    def restore_backup(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Przywróć kopię zapasową", backup.default_directory(), "Kopie zapasowe (*.db.gz)"
+        )
+        if not path:
+            return
+        reply = QMessageBox.question(self, "Potwierdzenie",
+                                     "Obecne dane zostaną zastąpione danymi z kopii zapasowej.\n"
+                                     "Czy chcesz kontynuować?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            backup.restore_snapshot(path, before_replace=self.stop_background_work)
+        except (backup.RestoreError, OSError) as error:
+            QMessageBox.warning(self, "Błąd przywracania", str(error))
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.restart()
+
+    def restart(self):
+        QCoreApplication.quit()
+        os.execl(sys.executable, sys.executable, *sys.argv)
+
     def factory_reset(self):
         reply = QMessageBox.question(self, "Potwierdzenie",
                                      "Czy na pewno chcesz przywrócić ustawienia fabryczne?\n"
-                                     "Wszystkie dane zostaną usunięte.",
+                                     "Wszystkie dane zostaną usunięte. Przedtem zostanie "
+                                     "utworzona ich kopia zapasowa.",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            db_path = os.path.join(os.path.dirname(__file__), 'data', 'finance.db')
-            if os.path.exists(db_path):
-                os.remove(db_path)
-            QCoreApplication.quit()
-            os.execl(sys.executable, sys.executable, *sys.argv)
+            self.stop_background_work()
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                backup.create_snapshot()
+            except (OSError, sqlite3.Error) as error:
+                QMessageBox.warning(self, "Błąd kopii zapasowej", f"Nie udało się utworzyć kopii zapasowej: {error}\n"
+                                    "Dane nie zostały usunięte.")
+                self.restart()
+                return
+            finally:
+                QApplication.restoreOverrideCursor()
+            db.close_connections()
+            db_path = db.database_path()
+            # WAL mode keeps recent writes in side files next to the database
+            for path in (db_path, db_path + '-wal', db_path + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.restart()
 
 def main():
+    # --profile-startup prints how long each startup phase took; Qt ignores the switch
+    profile = StartupProfile(START_TIME) if '--profile-startup' in sys.argv else None
+    if profile is not None:
+        profile.mark("imports")
+    # --profile records latencies, shown under File > Diagnostyka wydajności;
+    # slow queries and a summary at exit go to profile.log next to the database
+    profile_log = None
+    if '--profile' in sys.argv or instrumentation.enabled_by_environment():
+        profile_log = os.path.join(os.path.dirname(db.database_path()), 'profile.log')
+        instrumentation.enable(log_path=profile_log)
+
     db.initialize_database()
+    # Posts the recurring transactions that fell due since the last run;
+    # only the due rules are read, so this is cheap on most starts
+    recurring.materialize_due()
+    onboarding_complete = db.is_onboarding_complete()
+    if profile is not None:
+        profile.mark("database")
     app = QApplication(sys.argv)
+    if profile is not None:
+        profile.mark("application")
 
-    if not db.is_onboarding_complete():
+    if not onboarding_complete:
+        from app.ui.onboarding_window import OnboardingWindow
         onboarding_window = OnboardingWindow()
-        if onboarding_window.exec():
-            window = MainWindow()
-            window.show()
-            sys.exit(app.exec())
-        else:
+        if not onboarding_window.exec():
             sys.exit(0)
-    else:
-        today = QDate.currentDate()
-        current_month = today.month()
-        current_year = today.year()
-        budget = db.get_budget_for_month(current_month, current_year)
-        if budget is None:
-            budget_amount, ok = QInputDialog.getDouble(
-                None, 
-                "Ustaw budżet miesięczny", 
-                f"Nie ustawiono jeszcze budżetu na {current_month}/{current_year}.\nCzy chcesz go teraz zdefiniować?",
-                1000.00, 0.00, 1000000.00, 2
-            )
-            if ok:
-                db.set_budget_for_month(budget_amount, current_month, current_year)
-
         window = MainWindow()
-        window.show()
-        sys.exit(app.exec())
+    else:
+        # The budget of the month is checked once its figures are loaded
+        window = MainWindow(ask_for_budget=True, profile=profile)
+        if profile is not None:
+            profile.mark("window")
+    window.show()
+    status = app.exec()
+    if profile_log is not None:
+        instrumentation.write_report(profile_log)
+    sys.exit(status)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
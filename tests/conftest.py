@@ -0,0 +1,24 @@
+import os
+import shutil
+import pytest
+from app.database import database as db
+
+BASELINE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'finance.db')
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """Returns the path of a copy of the shipped, never migrated database."""
+    path = str(tmp_path / 'finance.db')
+    shutil.copy(BASELINE, path)
+    return path
+
+
+@pytest.fixture
+def ledger(baseline):
+    """Points the database module at a migrated copy of the shipped database."""
+    previous = db.database_path()
+    db.configure_database(path=baseline)
+    db.initialize_database()
+    yield baseline
+    db.configure_database(path=previous)
@@ -0,0 +1,92 @@
+from datetime import date
+import numpy as np
+from app import analytics, exporter
+from app.database import database as db
+
+
+def _totals(*rows):
+    """DailyTotals from (ISO date, category_id, cents) rows."""
+    return analytics.DailyTotals.from_rows([(analytics.day_number(date.fromisoformat(day)), category_id, cents)
+                                            for day, category_id, cents in rows])
+
+
+def _iso(starts):
+    return [str(start) for start in starts]
+
+
+def test_monthly_series_per_group():
+    totals = _totals(('2025-01-05', 1, 100), ('2025-01-20', 2, 50), ('2025-03-01', 1, 30), ('2025-03-02', 3, 7),
+                     ('2025-03-03', 0, 5))
+
+    series = analytics.time_series(totals, 'month', {1: 'Żywność', 2: 'Żywność', 3: 'Transport'}, other='Inne')
+
+    assert _iso(series.starts) == ['2025-01-01', '2025-02-01', '2025-03-01']
+    assert series.names == ['Żywność', 'Transport', 'Inne']
+    assert series.values.tolist() == [[150, 0, 30], [0, 0, 7], [0, 0, 5]]
+    assert series.total().tolist() == [150, 0, 42]
+
+
+def test_weekly_series_starts_on_monday_and_honours_the_bounds():
+    totals = _totals(('2025-03-02', 1, 10), ('2025-03-03', 1, 20), ('2025-03-09', 4, 5), ('2025-03-12', 1, 1))
+    first, last = analytics.period_numbers([analytics.day_number(date(2025, 3, 3)),
+                                            analytics.day_number(date(2025, 3, 10))], 'week')
+
+    series = analytics.time_series(totals, 'week', {1: 'Żywność'}, first=int(first), last=int(last))
+
+    assert _iso(series.starts) == ['2025-03-03', '2025-03-10']
+    assert series.names == ['Żywność']
+    assert series.values.tolist() == [[20, 1]]
+    assert analytics.time_series(totals, 'week').values.tolist() == [[10, 25, 1]]
+
+
+def test_rolling_mean_and_year_over_year():
+    means = analytics.rolling_mean([1, 2, 3, 4], 2)
+    assert np.isnan(means[0]) and means[1:].tolist() == [1.5, 2.5, 3.5]
+    assert np.isnan(analytics.rolling_mean([1, 2], 3)).all()
+
+    values = np.arange(1, 15)
+    previous, change = analytics.year_over_year(values, 'month')
+    assert np.isnan(previous[:12]).all() and previous[12:].tolist() == [1, 2]
+    assert change[12:].tolist() == [12.0, 6.0]
+
+
+def test_month_forecast_follows_the_previous_months():
+    rows = []
+    for month in range(48):
+        year, month = divmod(2021 * 12 + 5 + month, 12)
+        rows += [(f"{year}-{month + 1:02d}-01", 1, 100), (f"{year}-{month + 1:02d}-20", 1, 200)]
+    rows.append(('2025-06-03', 1, 50))
+
+    forecast = analytics.month_forecast(_totals(*rows), date(2025, 6, 15))
+
+    assert len(forecast.days) == 30 and str(forecast.days[0]) == '2025-06-01'
+    assert forecast.spent == 50 and forecast.total == 250
+    assert forecast.actual[14] == 50 and np.isnan(forecast.actual[15:]).all()
+    assert np.isnan(forecast.projected[:14]).all() and forecast.projected[-1] == 250
+
+
+def test_month_forecast_without_history():
+    forecast = analytics.month_forecast(_totals(('2025-02-03', 1, 70)), date(2025, 2, 10))
+
+    assert forecast.total == forecast.spent == 70
+    assert forecast.projected[-1] == 70 and len(forecast.days) == 28
+
+
+def test_daily_totals_match_the_ledger_and_a_columnar_export(ledger, tmp_path):
+    coffee = db.get_category_tree().id_for_name('Kawa')
+    for day, description, amount, category_id in (('2025-03-01', 'Kawiarnia', '12.50', coffee),
+                                                   ('2025-03-01', 'Kawiarnia', '2.50', coffee),
+                                                   ('2025-03-02', 'Kino', '30.00', None)):
+        db.add_transaction({'date': day, 'description': description, 'amount': amount, 'category_id': category_id})
+    path = str(tmp_path / 'export.fmcol')
+    exporter.export_transactions(path, 'columnar')
+
+    loaded = analytics.load_daily_totals()
+    exported = analytics.DailyTotals.from_columnar(path)
+
+    first, second = analytics.day_number(date(2025, 3, 1)), analytics.day_number(date(2025, 3, 2))
+    expected = [(first, coffee, 1500), (second, 0, 3000)]
+    for totals in (loaded, exported):
+        assert sorted(zip(totals.days.tolist(), totals.category_ids.tolist(), totals.cents.tolist())) == expected
+    filtered = analytics.load_daily_totals('kino')
+    assert filtered.cents.tolist() == [3000]
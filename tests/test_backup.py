@@ -0,0 +1,100 @@
+import gzip
+import os
+import sqlite3
+import threading
+import pytest
+from app.database import backup
+from app.database import database as db
+
+
+def _descriptions():
+    cursor = db.get_db_connection().execute("SELECT description FROM transactions ORDER BY id")
+    return [row[0] for row in cursor]
+
+
+def _add(description):
+    db.add_transaction({'date': '2025-03-01', 'description': description, 'amount': '1.00', 'category_id': None})
+
+
+def test_snapshot_can_be_restored(ledger, tmp_path):
+    directory = str(tmp_path / 'backups')
+    _add('Przed kopią')
+    path = backup.create_snapshot(directory)
+    _add('Po kopii')
+
+    backup.restore_snapshot(path)
+
+    assert _descriptions() == ['Przed kopią']
+    assert backup.list_snapshots(directory)[0][1] == path
+    assert os.listdir(directory) == [os.path.basename(path)]
+
+
+def test_damaged_snapshot_leaves_the_database(ledger, tmp_path):
+    _add('Zostaje')
+    path = tmp_path / 'finance-20250301-120000.db.gz'
+    with gzip.open(path, 'wb') as snapshot:
+        snapshot.write(b'to nie jest baza danych' * 100)
+
+    with pytest.raises(backup.RestoreError):
+        backup.restore_snapshot(str(path))
+
+    assert _descriptions() == ['Zostaje']
+    assert [name for name in os.listdir(os.path.dirname(ledger)) if name.endswith('.restore')] == []
+
+
+def test_old_snapshots_are_rotated(ledger, tmp_path):
+    directory = tmp_path / 'backups'
+    directory.mkdir()
+    for stamp in ('20200101-120000', '20200102-120000', '20200103-120000'):
+        with gzip.open(directory / f"finance-{stamp}.db.gz", 'wb'):
+            pass
+    (directory / 'notatki.txt').write_text('')
+
+    newest = backup.create_snapshot(str(directory), keep=2)
+
+    assert [path for _taken, path in backup.list_snapshots(str(directory))] == [
+        newest, str(directory / 'finance-20200103-120000.db.gz')]
+    assert (directory / 'notatki.txt').exists()
+
+
+def test_cancelled_snapshot_leaves_no_files(ledger, tmp_path):
+    directory = tmp_path / 'backups'
+    stop = threading.Event()
+    stop.set()
+
+    with pytest.raises(backup.BackupCancelled):
+        backup.create_snapshot(str(directory), stop=stop)
+
+    assert os.listdir(directory) == []
+
+
+def test_snapshots_taken_in_the_same_second_are_kept(ledger, tmp_path):
+    directory = str(tmp_path / 'backups')
+
+    paths = [backup.create_snapshot(directory, keep=3) for _ in range(3)]
+
+    assert len(set(paths)) == 3
+    assert sorted(path for _taken, path in backup.list_snapshots(directory)) == sorted(paths)
+
+
+def test_rotation_orders_legacy_and_current_names(ledger, tmp_path):
+    directory = tmp_path / 'backups'
+    directory.mkdir()
+    legacy = directory / 'finance-20200101-120000.db.gz'
+    with gzip.open(legacy, 'wb'):
+        pass
+
+    newest = backup.create_snapshot(str(directory), keep=1)
+
+    assert not legacy.exists()
+    assert [path for _taken, path in backup.list_snapshots(str(directory))] == [newest]
+
+
+def test_failed_copy_leaves_no_files(ledger, tmp_path, monkeypatch):
+    directory = tmp_path / 'backups'
+    monkeypatch.setattr(backup.db, 'database_path', lambda: str(tmp_path / 'missing' / 'finance.db'))
+
+    with pytest.raises(sqlite3.OperationalError):
+        backup.create_snapshot(str(directory))
+
+    assert os.listdir(directory) == []
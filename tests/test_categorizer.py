@@ -0,0 +1,86 @@
+import pytest
+from app import categorizer, importer
+from app.database import database as db
+
+
+def _rule(rule_id, match_type, category_id, pattern=None, min_amount=None, max_amount=None, priority=0):
+    return {'id': rule_id, 'match_type': match_type, 'pattern': pattern, 'min_amount': min_amount,
+            'max_amount': max_amount, 'category_id': category_id, 'priority': priority}
+
+
+@pytest.fixture
+def engine():
+    return categorizer.RuleEngine([
+        _rule(1, 'keyword', 10, 'orlen'),
+        _rule(2, 'keyword', 20, 'biedronka'),
+        _rule(3, 'regex', 30, r'uber\s*(eats)?'),
+        _rule(4, 'regex', 40, r'^\d+ zł$'),
+        _rule(5, 'amount', 50, min_amount=100000, max_amount=None),
+        _rule(6, 'amount', 60, min_amount=None, max_amount=99, priority=1),
+        _rule(7, 'keyword', 70, 'biedronka', priority=-1),
+    ])
+
+
+@pytest.mark.parametrize('description, cents, category_id', [
+    ('ORLEN STACJA 123', 5000, 10),
+    ('Sklep Biedronka 1234', 5000, 20),
+    ('UBER   EATS WARSZAWA', 5000, 30),
+    ('Uber *TRIP', 5000, 30),
+    ('12 zł', 5000, 40),
+    ('Czynsz', 180000, 50),
+    ('Orlen', 50, 60),  # higher priority wins
+    ('Apteka', 5000, None),
+])
+def test_best_rule_wins(engine, description, cents, category_id):
+    assert engine.categorize(description, cents) == category_id
+
+
+
+def test_categorize_many_matches_categorize(engine):
+    transactions = [('ORLEN STACJA 123', 5000), ('Apteka', 5000), ('Czynsz', 180000), ('Orlen', 50)]
+
+    assert engine.categorize_many(transactions) == [engine.categorize(*pair) for pair in transactions]
+
+def test_oldest_rule_wins_ties():
+    engine = categorizer.RuleEngine([_rule(2, 'keyword', 20, 'kino'), _rule(1, 'regex', 10, 'KINO')])
+
+    assert engine.categorize('Kino Muranów', 3000) == 10
+
+
+@pytest.mark.parametrize('pattern, literal', [
+    (r'uber\s*eats', 'uber'),
+    (r'netflix\.com', 'netflix.com'),
+    (r'(a|b)c', 'c'),
+    (r'.*', ''),
+    (r'[', ''),
+])
+def test_required_literal(pattern, literal):
+    assert categorizer.required_literal(pattern) == literal
+
+
+def test_apply_rules_categorizes_the_ledger(ledger):
+    fuel = db.get_category_tree().id_for_name('Paliwo')
+    coffee = db.get_category_tree().id_for_name('Kawa')
+    db.add_categorization_rule('keyword', fuel, 'orlen')
+    for description, category_id in (('Orlen', None), ('Orlen', coffee), ('Kino', None)):
+        db.add_transaction({'date': '2025-03-01', 'description': description, 'amount': '10.00',
+                            'category_id': category_id})
+
+    assert categorizer.apply_rules() == 1
+    assert categorizer.apply_rules(include_categorized=True) == 1
+    rows = db.get_db_connection().execute("SELECT category_id FROM transactions ORDER BY id")
+    assert [row[0] for row in rows] == [fuel, fuel, None]
+    assert db.check_monthly_totals() == []
+
+
+def test_import_applies_the_rules(ledger, tmp_path):
+    fuel = db.get_category_tree().id_for_name('Paliwo')
+    db.add_categorization_rule('keyword', fuel, 'orlen')
+    path = tmp_path / 'statement.csv'
+    path.write_text('data;opis;kwota;kategoria\n01.03.2025;Orlen;-200,00;\n02.03.2025;Orlen;-50,00;Kawa\n'
+                    '03.03.2025;Kino;-30,00;\n', encoding='utf-8')
+
+    assert importer.import_file(str(path))['imported'] == 3
+
+    rows = db.get_db_connection().execute("SELECT category_id FROM transactions ORDER BY id")
+    assert [row[0] for row in rows] == [fuel, db.get_category_tree().id_for_name('Kawa'), None]
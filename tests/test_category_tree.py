@@ -0,0 +1,67 @@
+from app.models.category_tree import CategoryTree
+
+CATEGORIES = [
+    {'id': 1, 'name': 'Żywność', 'parent_id': None},
+    {'id': 2, 'name': 'Transport', 'parent_id': None},
+    {'id': 3, 'name': 'Kawa', 'parent_id': 1},
+    {'id': 4, 'name': 'Espresso', 'parent_id': 3},
+    {'id': 5, 'name': 'Bilety', 'parent_id': 2},
+    {'id': 6, 'name': 'Artykuły spożywcze', 'parent_id': 1},
+    {'id': 7, 'name': 'Sierota', 'parent_id': 42},
+]
+
+
+def test_display_order_is_depth_first_with_sorted_siblings():
+    tree = CategoryTree(CATEGORIES)
+
+    assert tree.display_order == [
+        (7, 'Sierota', 0, False),
+        (2, 'Transport', 0, True),
+        (5, 'Bilety', 1, False),
+        (1, 'Żywność', 0, True),
+        (6, 'Artykuły spożywcze', 1, False),
+        (3, 'Kawa', 1, True),
+        (4, 'Espresso', 2, False),
+    ]
+
+
+def test_lookups():
+    tree = CategoryTree(CATEGORIES)
+
+    assert tree.roots() == [7, 2, 1]
+    assert tree.subcategories(1) == [6, 3]
+    assert tree.parent(4) == 3 and tree.parent(1) is None
+    # A missing parent leaves the category at the top level
+    assert tree.parent(7) is None
+    assert tree.has_children(3) and not tree.has_children(4)
+    assert tree.id_for_name('KAWA') == 3 and tree.id_for_name('Uncategorized') is None
+    assert tree.name(4) == 'Espresso' and 4 in tree and 42 not in tree
+
+
+def test_subtrees_and_roots_at_any_depth():
+    tree = CategoryTree(CATEGORIES)
+
+    assert tree.subtree(1) == {1, 3, 4, 6}
+    assert tree.descendants(1) == {3, 4, 6}
+    assert tree.subtree(4) == {4}
+    assert tree.root(4) == 1 and tree.root(5) == 2
+    assert tree.subtree(42) == frozenset()
+
+
+def test_groups_match_the_chart_grouping():
+    tree = CategoryTree(CATEGORIES)
+
+    assert tree.groups() == {1: 'Żywność', 3: 'Żywność', 4: 'Żywność', 6: 'Żywność',
+                             2: 'Transport', 5: 'Transport', 7: 'Sierota'}
+    assert tree.groups(1) == {3: 'Kawa', 4: 'Kawa', 6: 'Artykuły spożywcze'}
+
+
+def test_cycles_do_not_hang():
+    tree = CategoryTree([
+        {'id': 1, 'name': 'A', 'parent_id': 2},
+        {'id': 2, 'name': 'B', 'parent_id': 1},
+        {'id': 3, 'name': 'C', 'parent_id': None},
+    ])
+
+    assert tree.roots() == [3]
+    assert [category[0] for category in tree.display_order] == [3]
@@ -0,0 +1,181 @@
+import csv
+import json
+import pytest
+from app import cli
+from app.database import database as db
+
+
+def _run(capsys, *argv):
+    status = cli.main(list(argv))
+    out, err = capsys.readouterr()
+    return status, out, err
+
+
+MARCH_CSV = ('data;opis;kwota;kategoria\n01.03.2025;Kawiarnia Nero;-12,50;Kawa\n'
+             '02.03.2025;Orlen;-200,00;Paliwo\n03.03.2025;Kino;-30,00;\n')
+
+
+@pytest.fixture
+def march(ledger, tmp_path):
+    """The ledger with three March 2025 transactions imported through the CLI."""
+    path = tmp_path / 'march.csv'
+    path.write_text(MARCH_CSV, encoding='utf-8')
+    assert cli.main(['--db', ledger, 'import', str(path)]) == 0
+    return path
+
+
+def test_import_prints_the_counts(march, capsys):
+    capsys.readouterr()
+
+    status, out, _err = _run(capsys, 'import', str(march))
+
+    assert status == 0
+    result = json.loads(out)
+    assert result['imported'] == 0 and result['duplicates'] == 3
+
+
+def test_import_reports_a_missing_file(ledger, capsys, tmp_path):
+    status, out, err = _run(capsys, '--db', ledger, 'import', str(tmp_path / 'missing.csv'))
+
+    assert status == 1 and out == '' and err.startswith('błąd: ')
+
+
+def test_query_filters_and_formats(march, capsys):
+    status, out, _err = _run(capsys, 'query', '--from', '2025-03-01', '-c', 'Żywność', '-f', 'jsonl')
+
+    assert status == 0
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert [(row['description'], row['amount'], row['category']) for row in rows] == [
+        ('Kawiarnia Nero', '12.50', 'Kawa')]
+
+    status, out, _err = _run(capsys, 'query', '--from', '2025-03-01', '-s', 'ki', '-n', '1')
+    rows = list(csv.DictReader(out.splitlines()))
+    assert [(row['date'], row['description'], row['amount'], row['category']) for row in rows] == [
+        ('2025-03-03', 'Kino', '30.00', 'Uncategorized')]
+
+
+def test_export_can_be_imported_again(march, capsys, tmp_path):
+    exported = tmp_path / 'export.csv'
+    status, _out, err = _run(capsys, 'export', str(exported), '--from', '2025-03-01')
+    assert status == 0 and 'Wyeksportowano transakcji: 3.' in err
+
+    copy = str(tmp_path / 'copy.db')
+    status, out, _err = _run(capsys, '--db', copy, 'import', '--no-rules', str(exported))
+    assert status == 0 and json.loads(out)['imported'] == 3
+    status, out, _err = _run(capsys, 'query')
+    original = list(csv.reader(exported.read_text(encoding='utf-8').splitlines()))
+    copied = list(csv.reader(out.splitlines()))
+    assert [row[1:] for row in copied] == [row[1:] for row in original]
+
+
+def test_summary_reads_the_rollup(march, capsys):
+    status, out, _err = _run(capsys, 'summary', '2025', '3')
+
+    assert status == 0
+    rows = list(csv.DictReader(out.splitlines()))
+    assert {(row['category'], row['amount'], row['count']) for row in rows} == {
+        ('Paliwo', '200.00', '1'), ('Kawa', '12.50', '1'), ('Uncategorized', '30.00', '1')}
+
+
+
+def test_rollups_check_and_rebuild(march, capsys):
+    assert _run(capsys, 'rollups', 'check') == (0, 'source,year,month,category_id,amount,count\r\n', '')
+    with db.transaction() as conn:
+        conn.execute("UPDATE monthly_totals SET total_cents = total_cents + 1 WHERE category_id = 0")
+
+    status, out, err = _run(capsys, 'rollups', 'check', '-f', 'jsonl')
+
+    assert status == 1 and err.startswith('błąd: ')
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert sorted((row['source'], row['year'], row['month'], row['amount']) for row in rows) == [
+        ('actual', 2025, 3, '30.00'), ('stored', 2025, 3, '30.01')]
+
+    status, _out, err = _run(capsys, 'rollups', 'rebuild')
+    assert status == 0 and 'Przeliczono' in err
+    assert _run(capsys, 'rollups', 'check')[0] == 0
+
+def test_budget(ledger, capsys):
+    assert _run(capsys, '--db', ledger, 'budget', 'set', '2500,5', '1999-01')[0] == 0
+
+    assert _run(capsys, 'budget', 'get', '1999-01')[1] == '2500.50\n'
+    status, _out, err = _run(capsys, 'budget', 'get', '1999-02')
+    assert status == 1 and err == "błąd: Brak budżetu na 1999-02.\n"
+
+
+def test_categories(ledger, capsys):
+    status, out, _err = _run(capsys, '--db', ledger, 'categories', 'add', 'Espresso', '--parent', 'kawa')
+    assert status == 0
+    espresso = int(out)
+
+    status, out, _err = _run(capsys, 'categories', 'list', '-f', 'jsonl')
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert {'id': espresso, 'name': 'Espresso', 'parent': 'Kawa', 'depth': 2} in rows
+
+    assert _run(capsys, 'categories', 'add', 'Espresso')[2] == "błąd: Kategoria już istnieje: Espresso\n"
+    assert _run(capsys, 'categories', 'delete', 'Espresso')[0] == 0
+    assert db.get_category_tree().id_for_name('Espresso') is None
+    assert _run(capsys, 'categories', 'delete', 'Espresso')[2] == "błąd: Nieznana kategoria: Espresso\n"
+
+
+def test_backup(march, capsys, tmp_path):
+    directory = str(tmp_path / 'backups')
+    capsys.readouterr()
+
+    status, out, _err = _run(capsys, 'backup', 'create', '--dir', directory)
+    assert status == 0
+    path = out.strip()
+    assert _run(capsys, 'categories', 'delete', 'Kawa')[0] == 0
+
+    status, out, _err = _run(capsys, 'backup', 'list', '--dir', directory, '-f', 'jsonl')
+    assert [json.loads(line)['path'] for line in out.splitlines()] == [path]
+    assert _run(capsys, 'backup', 'restore', path)[0] == 0
+    assert db.get_category_tree().id_for_name('Kawa') is not None
+
+    status, _out, err = _run(capsys, 'backup', 'restore', str(tmp_path / 'missing.db.gz'))
+    assert status == 1 and err.startswith('błąd: ')
+
+
+def test_recurring(ledger, capsys):
+    status, out, _err = _run(capsys, '--db', ledger, 'recurring', 'add', 'Czynsz', '1800', '--start', '2025-01-10',
+                             '-c', 'Czynsz')
+    assert status == 0
+    rule_id = int(out)
+
+    status, out, _err = _run(capsys, 'recurring', 'projected', '2025-02-28', '-f', 'jsonl')
+    assert [(row['date'], row['rule'], row['amount']) for row in map(json.loads, out.splitlines())] == [
+        ('2025-01-10', rule_id, '1800.00'), ('2025-02-10', rule_id, '1800.00')]
+
+    status, _out, err = _run(capsys, 'recurring', 'run', '--date', '2025-02-28')
+    assert status == 0 and 'Zaksięgowano transakcji cyklicznych: 2.' in err
+    status, out, _err = _run(capsys, 'recurring', 'list', '-f', 'jsonl')
+    assert json.loads(out)['next_date'] == '2025-03-10'
+
+    assert _run(capsys, 'recurring', 'delete', str(rule_id))[0] == 0
+    assert list(csv.reader(_run(capsys, 'recurring', 'list')[1].splitlines())) == [list(cli.RECURRING_FIELDS)]
+    status, _out, err = _run(capsys, 'recurring', 'add', 'Kino', '30', '--start', '2025-01-10', '--end', '2025-01-01')
+    assert status == 1 and err.startswith('błąd: ')
+
+
+def test_rates(ledger, capsys, tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text('date;from;to;rate\n2025-01-02;EUR;PLN;4,25\n2025-01-02;XX;PLN;1\n', encoding='utf-8')
+
+    status, out, _err = _run(capsys, '--db', ledger, 'rates', 'import', str(path))
+    assert status == 0 and json.loads(out)['imported'] == 1
+    status, out, _err = _run(capsys, 'rates', 'list', '--from', 'eur', '-f', 'jsonl')
+    assert [json.loads(line) for line in out.splitlines()] == [
+        {'date': '2025-01-02', 'from': 'EUR', 'to': 'PLN', 'rate': 4.25}]
+
+    assert _run(capsys, 'rates', 'main')[1] == 'PLN\n'
+    assert _run(capsys, 'rates', 'main', 'eur')[0] == 0
+    assert db.get_main_currency() == 'EUR'
+    status, _out, err = _run(capsys, 'rates', 'main', 'euro')
+    assert status == 1 and err.startswith('błąd: ')
+
+
+def test_backup_reports_an_unreadable_database(ledger, capsys, tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'database_path', lambda: str(tmp_path / 'missing' / 'finance.db'))
+
+    status, out, err = _run(capsys, 'backup', 'create', '--dir', str(tmp_path / 'backups'))
+
+    assert status == 1 and out == '' and err.startswith('błąd: ')
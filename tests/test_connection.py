@@ -0,0 +1,59 @@
+import threading
+import pytest
+from app.database.connection import ConnectionManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ConnectionManager(str(tmp_path / 'test.db'))
+    with manager.transaction() as conn:
+        conn.execute("CREATE TABLE items (name TEXT)")
+    yield manager
+    manager.close_all()
+
+
+def _names(manager):
+    return [row['name'] for row in manager.connection().execute("SELECT name FROM items ORDER BY name")]
+
+
+def test_connection_is_kept_per_thread(manager):
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.connection()))
+    thread.start()
+    thread.join()
+
+    assert manager.connection() is manager.connection()
+    assert other[0] is not manager.connection()
+    assert manager.connection().execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_transaction_commits_or_rolls_back(manager):
+    with manager.transaction() as conn:
+        conn.execute("INSERT INTO items VALUES ('a')")
+    with pytest.raises(ZeroDivisionError):
+        with manager.transaction() as conn:
+            conn.execute("INSERT INTO items VALUES ('b')")
+            1 / 0
+
+    assert _names(manager) == ['a']
+
+
+def test_failing_nested_block_only_undoes_its_own_changes(manager):
+    with manager.transaction() as conn:
+        conn.execute("INSERT INTO items VALUES ('outer')")
+        with pytest.raises(ValueError):
+            with manager.transaction() as inner:
+                inner.execute("INSERT INTO items VALUES ('inner')")
+                raise ValueError
+        conn.execute("INSERT INTO items VALUES ('after')")
+
+    assert _names(manager) == ['after', 'outer']
+
+
+def test_configure_reopens_connections(manager, tmp_path):
+    first = manager.connection()
+
+    manager.configure(path=str(tmp_path / 'other.db'), pragmas={'journal_mode': 'DELETE'})
+
+    assert manager.connection() is not first
+    assert manager.connection().execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
@@ -0,0 +1,154 @@
+from app.database import database as db
+from app.models.money import Money
+
+MARCH = ('2025-03-01', '2025-03-31')
+
+
+def _add(date, description, amount, category=None, currency=None):
+    category_id = db.get_category_tree().id_for_name(category) if category else None
+    return db.add_transaction({'date': date, 'description': description, 'amount': amount,
+                               'category_id': category_id, 'currency': currency})
+
+
+def test_expenses_are_grouped_under_top_level_categories(ledger):
+    db.add_category('Espresso', db.get_category_tree().id_for_name('Kawa'))
+    _add('2025-03-01', 'Kawiarnia', '10.00', 'Espresso')
+    _add('2025-03-02', 'Obiad', '40.00', 'Restauracje')
+    _add('2025-03-03', 'Bilet', '5.00', 'Bilety')
+    _add('2025-03-04', 'Prezent', '20.00', 'Uncategorized')
+    _add('2025-04-01', 'Obiad', '99.00', 'Restauracje')
+
+    totals = db.expenses_by_category(date_range=MARCH)
+    assert totals == {'Żywność': Money(5000), 'Uncategorized': Money(2000), 'Transport': Money(500)}
+    assert list(totals) == ['Żywność', 'Uncategorized', 'Transport']
+
+
+def test_expenses_of_a_parent_are_grouped_under_its_children(ledger):
+    db.add_category('Espresso', db.get_category_tree().id_for_name('Kawa'))
+    _add('2025-03-01', 'Kawiarnia', '10.00', 'Espresso')
+    _add('2025-03-02', 'Kawiarnia', '2.50', 'Kawa')
+    _add('2025-03-03', 'Obiad', '40.00', 'Restauracje')
+    _add('2025-03-04', 'Bilet', '5.00', 'Bilety')
+
+    tree = db.get_category_tree()
+    food = tree.id_for_name('Żywność')
+    assert db.expenses_by_category(food, date_range=MARCH) == {'Restauracje': Money(4000), 'Kawa': Money(1250)}
+    assert tree.groups(food)[tree.id_for_name('Espresso')] == 'Kawa'
+
+
+def test_expenses_follow_the_filters(ledger):
+    _add('2025-03-01', 'Kawiarnia Nero', '10.00', 'Kawa')
+    _add('2025-03-02', 'Kawiarnia Costa', '4.00', 'Kawa')
+    _add('2025-03-03', 'Bilet', '5.00', 'Bilety')
+
+    assert db.expenses_by_category(date_range=MARCH, text_filter='nero') == {'Żywność': Money(1000)}
+    tickets = db.get_category_tree().id_for_name('Bilety')
+    assert db.expenses_by_category(date_range=MARCH, categories=[tickets]) == {'Transport': Money(500)}
+
+
+def _assert_rollups_exact():
+    assert db.check_monthly_totals() == []
+    # The daily rollup adds up to the monthly one
+    cursor = db.get_db_connection().execute('''
+        SELECT CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) AS year,
+               CAST(strftime('%m', day * 86400, 'unixepoch') AS INTEGER) AS month,
+               category_id, SUM(total_cents), SUM(count)
+        FROM daily_totals GROUP BY 1, 2, 3 HAVING SUM(count) <> 0
+        EXCEPT
+        SELECT year, month, category_id, total_cents, count FROM monthly_totals WHERE count <> 0
+    ''')
+    assert cursor.fetchall() == []
+
+
+def _month_total(year, month):
+    cursor = db.get_db_connection().execute(
+        "SELECT COALESCE(SUM(total_cents), 0) FROM monthly_totals WHERE year = ? AND month = ?", (year, month))
+    return cursor.fetchone()[0]
+
+
+def test_rollups_follow_edits(ledger):
+    first = _add('2025-03-01', 'Kawiarnia', '12.50', 'Kawa')
+    second = _add('2025-03-02', 'Kino', '30.00', 'Uncategorized')
+    _assert_rollups_exact()
+
+    db.update_transaction(first, {'date': '2025-04-01', 'description': 'Kawiarnia', 'amount': '15.00',
+                                  'category_id': None})
+    _assert_rollups_exact()
+    assert _month_total(2025, 3) == 3000 and _month_total(2025, 4) == 1500
+
+    db.delete_transaction(second)
+    _assert_rollups_exact()
+    assert _month_total(2025, 3) == 0
+
+
+def test_check_reports_and_rebuild_repairs_the_rollup(ledger):
+    _add('2025-03-01', 'Kawiarnia', '12.50', 'Kawa')
+    with db.transaction() as conn:
+        conn.execute("UPDATE monthly_totals SET total_cents = total_cents + 1 WHERE year = 2025")
+
+    mismatches = db.check_monthly_totals()
+    assert sorted((row['source'], row['total_cents']) for row in mismatches) == [('actual', 1250), ('stored', 1251)]
+
+    db.rebuild_monthly_totals()
+    _assert_rollups_exact()
+    assert _month_total(2025, 3) == 1250
+
+
+def test_month_expenses_follow_the_filters(ledger):
+    _add('2025-03-01', 'Kawiarnia', '12.50', 'Kawa')
+    _add('2025-03-02', 'Kino', '30.00', 'Kino')
+
+    assert db.get_month_expenses(3, 2025) == Money(4250)
+    assert db.get_month_expenses(3, 2025, categories=[db.get_category_tree().id_for_name('Kawa')]) == Money(1250)
+    assert db.get_month_expenses(3, 2025, text_filter='kino') == Money(3000)
+
+
+def test_category_tree_is_reloaded_after_changes(ledger):
+    tree = db.get_category_tree()
+    assert db.get_category_tree() is tree
+
+    db.add_category('Espresso', tree.id_for_name('Kawa'))
+    tree = db.get_category_tree()
+    espresso = tree.id_for_name('Espresso')
+    assert tree.root(espresso) == tree.id_for_name('Żywność')
+
+    db.delete_category(espresso)
+    assert db.get_category_tree().id_for_name('Espresso') is None
+
+
+def test_rollups_follow_exchange_rates(ledger):
+    hotel = _add('2025-03-10', 'Hotel', '100.00', currency='EUR')
+    _add('2025-03-11', 'Sklep', '50.00')
+    # Without any rate the amount is counted unconverted
+    assert _month_total(2025, 3) == 15000
+
+    db.add_fx_rates([('2025-03-01', 'EUR', 'PLN', 4.0)])
+    _assert_rollups_exact()
+    assert _month_total(2025, 3) == 45000
+
+    db.add_fx_rates([('2025-03-10', 'EUR', 'PLN', 4.5)])
+    _assert_rollups_exact()
+    assert _month_total(2025, 3) == 50000
+
+    db.update_transaction(hotel, {'date': '2025-03-05', 'description': 'Hotel', 'amount': '100.00',
+                                  'category_id': None, 'currency': 'EUR'})
+    _assert_rollups_exact()
+    assert _month_total(2025, 3) == 45000
+    assert db.get_currencies_without_rates() == []
+
+
+def test_rollups_follow_the_main_currency(ledger):
+    _add('2025-03-10', 'Hotel', '100.00', currency='EUR')
+    _add('2025-03-11', 'Sklep', '50.00')
+    db.add_fx_rates([('2025-03-01', 'EUR', 'PLN', 4.0)])
+
+    db.set_main_currency('EUR')
+    _assert_rollups_exact()
+    assert db.get_main_currency() == 'EUR'
+    assert _month_total(2025, 3) == 10000 + 1250
+    currencies = db.get_db_connection().execute("SELECT currency FROM transactions ORDER BY id").fetchall()
+    assert [row[0] for row in currencies] == [None, 'PLN']
+
+    db.set_main_currency('PLN')
+    _assert_rollups_exact()
+    assert _month_total(2025, 3) == 45000
@@ -0,0 +1,123 @@
+import sys
+import threading
+import time
+import pytest
+from PySide6.QtCore import QCoreApplication
+from app.database import database as db
+from app.db_worker import DatabaseWorker
+from app.models.transaction_table_model import TransactionTableModel
+
+
+@pytest.fixture
+def worker(ledger):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    worker = DatabaseWorker()
+    yield app, worker
+    worker.shutdown()
+
+
+def _wait_for(app, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    assert condition()
+
+
+def test_results_arrive_in_the_gui_thread(worker):
+    app, worker = worker
+    results = []
+
+    worker.submit('chart', lambda result: results.append((result, threading.get_ident())), threading.get_ident)
+    _wait_for(app, lambda: results)
+
+    worker_thread, gui_thread = results[0]
+    assert worker_thread != gui_thread == threading.get_ident()
+    assert not worker.pending('chart')
+
+
+def test_a_new_request_supersedes_the_pending_one(worker):
+    app, worker = worker
+    gate = threading.Event()
+    ran = []
+    results = []
+
+    worker.submit('budget', results.append, gate.wait)
+    worker.submit('chart', results.append, lambda: ran.append('old') or 'old')
+    worker.submit('chart', results.append, lambda: ran.append('new') or 'new')
+    assert worker.pending('chart')
+    gate.set()
+    _wait_for(app, lambda: len(results) == 2)
+
+    assert results == [True, 'new'] and ran == ['new']
+
+
+def test_failures_are_reported(worker):
+    app, worker = worker
+    failures = []
+    worker.failed.connect(lambda key, error: failures.append((key, str(error))))
+
+    worker.submit('chart', failures.append, lambda: 1 / 0)
+    _wait_for(app, lambda: failures)
+
+    assert failures == [('chart', 'division by zero')]
+
+
+def test_model_pages_are_read_by_the_worker(worker):
+    app, worker = worker
+    for day in range(1, 6):
+        db.add_transaction({'date': f"2025-01-0{day}", 'description': 'Zakup', 'amount': '1.00', 'category_id': None})
+    loaded = []
+
+    model = TransactionTableModel(page_size=3, worker=worker)
+    model.first_page_loaded.connect(lambda: loaded.append(True))
+    model.reload()
+    # The page is read in the background; the model stays empty until it arrives
+    assert model.rowCount() == 0
+    _wait_for(app, lambda: model.rowCount() == 3)
+
+    assert loaded == [True]
+    assert model.transaction_at(0)['date'] == '2025-01-05'
+    model.fetchMore()
+    _wait_for(app, lambda: model.rowCount() > 3)
+    assert model.transaction_at(3)['date'] == '2025-01-02'
+
+
+def test_a_superseded_running_query_is_interrupted(worker):
+    app, worker = worker
+    started = threading.Event()
+    results = []
+    failures = []
+    worker.failed.connect(lambda key, error: failures.append(error))
+
+    def slow():
+        started.set()
+        return db.get_db_connection().execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n LIMIT 1000000000) SELECT COUNT(*) FROM n"
+        ).fetchone()[0]
+
+    worker.submit('chart', results.append, slow)
+    assert started.wait(5)
+    time.sleep(0.05)
+    worker.submit('chart', results.append, lambda: 'new')
+    _wait_for(app, lambda: results)
+
+    assert results == ['new'] and failures == []
+
+
+def test_failing_callback_still_finishes_the_request(worker, monkeypatch):
+    app, worker = worker
+    raised = []
+    monkeypatch.setattr(sys, 'excepthook', lambda kind, error, traceback: raised.append(error))
+    idle = []
+    worker.idle.connect(lambda: idle.append(True))
+
+    def callback(result):
+        raise RuntimeError(result)
+
+    worker.submit('totals', callback, lambda: 'broken')
+    _wait_for(app, lambda: idle)
+
+    assert [str(error) for error in raised] == ['broken']
+    assert idle == [True]
+    assert worker._submitted == {}
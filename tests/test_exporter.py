@@ -0,0 +1,110 @@
+import json
+import pytest
+from app import exporter, importer
+from app.database import database as db
+
+
+def _add(date, description, amount, category_id=None, currency=None):
+    db.add_transaction({'date': date, 'description': description, 'amount': amount,
+                        'category_id': category_id, 'currency': currency})
+
+
+def _stored():
+    cursor = db.get_db_connection().execute(
+        "SELECT date, description, amount, category_id, currency FROM transactions ORDER BY date, id")
+    return [tuple(row) for row in cursor]
+
+
+def test_csv_round_trip(ledger, tmp_path):
+    _add('2025-01-03', 'Kawiarnia; "Nero"', '12.50', db.get_category_tree().id_for_name('Kawa'))
+    _add('2025-01-04', 'Piekarnia', '4.20')
+    exported = _stored()
+    path = str(tmp_path / 'export.csv')
+    assert exporter.export_transactions(path, 'csv') == len(exported)
+
+    db.get_db_connection().execute("DELETE FROM transactions")
+    result = importer.import_file(path, apply_rules=False)
+
+    assert result['imported'] == len(exported) and result['invalid'] == 0
+    assert _stored() == exported
+    assert db.check_monthly_totals() == []
+
+
+def test_csv_round_trip_keeps_currencies(ledger, tmp_path):
+    _add('2025-01-03', 'Hotel Berlin', '120.50', currency='EUR')
+    _add('2025-01-04', 'Piekarnia', '4.20')
+    _add('2025-01-05', 'Amazon', '19.99', currency='USD')
+    exported = _stored()
+    path = str(tmp_path / 'export.csv')
+    assert exporter.export_transactions(path, 'csv') == 3
+
+    db.get_db_connection().execute("DELETE FROM transactions")
+    result = importer.import_file(path)
+
+    assert result['imported'] == 3 and result['invalid'] == 0
+    assert _stored() == exported
+    assert db.check_monthly_totals() == []
+
+
+def test_invalid_currency_is_reported(ledger, tmp_path):
+    path = tmp_path / 'invalid.csv'
+    path.write_text('date;description;amount;waluta\n05.01.2025;Kino;-30,00;EURO\n06.01.2025;Bilet;-3,40;pln\n',
+                    encoding='utf-8')
+
+    result = importer.import_file(str(path))
+
+    assert result['imported'] == 1 and result['invalid'] == 1
+    assert 'EURO' in result['errors'][0][1]
+    assert _stored() == [('2025-01-06', 'Bilet', 340, None, None)]
+
+
+def test_jsonl_export_applies_the_filters(ledger, tmp_path):
+    _add('2025-01-03', 'Kawiarnia Nero', '12.50')
+    _add('2025-01-04', 'Kawiarnia Costa', '4.20')
+    path = tmp_path / 'export.jsonl'
+
+    count = exporter.export_transactions(str(path), 'jsonl', 'kawiarnia', date_range=('2025-01-04', '2025-01-31'))
+
+    rows = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert count == 1
+    assert [(row['date'], row['description'], row['amount']) for row in rows] == [
+        ('2025-01-04', 'Kawiarnia Costa', '4.20')]
+
+
+def test_columnar_round_trip(ledger, tmp_path):
+    coffee = db.get_category_tree().id_for_name('Kawa')
+    db.add_fx_rates([('2025-01-01', 'EUR', 'PLN', 4.0)])
+    _add('1969-12-31', 'Przed epoką', '1.00')
+    _add('2025-01-03', 'Café ☕', '2.50', coffee, 'EUR')
+    _add('2025-01-04', 'Piekarnia', '4.20')
+    path = str(tmp_path / 'export.fmcol')
+
+    with open(path, 'wb') as stream:
+        count = exporter.write_columnar(exporter.iter_transactions(), stream, row_group_size=2)
+    columns = exporter.ColumnarFile(path)
+
+    assert count == columns.rows == 3
+    assert len(columns.row_groups) == 2
+    assert columns.currency == 'PLN'
+    assert list(columns.column('id')) == [3, 2, 1]
+    assert [exporter.days_to_iso(day) for day in columns.column('date')] == ['2025-01-04', '2025-01-03', '1969-12-31']
+    assert list(columns.column('amount')) == [420, 1000, 100]
+    assert list(columns.column('category_id')) == [0, coffee, 0]
+    assert columns.column('description') == ['Piekarnia', 'Café ☕', 'Przed epoką']
+    assert columns.categories == {0: 'Uncategorized', coffee: 'Kawa'}
+
+
+def test_columnar_file_checks_its_magic(tmp_path):
+    path = tmp_path / 'broken.fmcol'
+    path.write_bytes(b'id,date\n' * 4)
+
+    with pytest.raises(exporter.ColumnarFormatError):
+        exporter.ColumnarFile(str(path))
+
+
+def test_columnar_file_checks_its_trailer(tmp_path):
+    path = tmp_path / 'broken.fmcol'
+    path.write_bytes(exporter.COLUMNAR_MAGIC + b'{}')
+
+    with pytest.raises(exporter.ColumnarFormatError):
+        exporter.ColumnarFile(str(path))
@@ -0,0 +1,30 @@
+from app.database.fingerprint import FingerprintCounter, fingerprint
+
+
+def test_fingerprint_ignores_case_spacing_and_account_format():
+    assert fingerprint('2025-03-01', 900, 'Kawa  Starbucks', 'pl61 1090 1014') == \
+        fingerprint('2025-03-01', 900, 'kawa starbucks', 'PL611090 1014')
+    assert fingerprint('2025-03-01', 900, 'Kawa') != fingerprint('2025-03-01', 901, 'Kawa')
+    assert fingerprint('2025-03-01', 900, 'Kawa', 'PL1') != fingerprint('2025-03-01', 900, 'Kawa', 'PL2')
+
+
+def test_counter_numbers_identical_transactions():
+    counter = FingerprintCounter()
+
+    first, second = counter('2025-03-01', 900, 'Kawa'), counter('2025-03-01', 900, ' KAWA ')
+
+    assert first == fingerprint('2025-03-01', 900, 'Kawa', occurrence=1)
+    assert second == fingerprint('2025-03-01', 900, 'Kawa', occurrence=2)
+
+
+def test_counter_remembers_a_bounded_window():
+    counter = FingerprintCounter(window=2)
+    counter('2025-03-01', 900, 'Kawa')
+    counter('2025-03-01', 100, 'Bułka')
+    # Seeing a content again makes it the most recent one
+    counter('2025-03-01', 900, 'Kawa')
+    counter('2025-03-02', 3000, 'Kino')
+
+    assert len(counter._occurrences) == 2
+    assert counter('2025-03-01', 900, 'Kawa') == fingerprint('2025-03-01', 900, 'Kawa', occurrence=3)
+    assert counter('2025-03-01', 100, 'Bułka') == fingerprint('2025-03-01', 100, 'Bułka', occurrence=1)
@@ -0,0 +1,44 @@
+import pytest
+from app import fx
+from app.database import database as db
+
+
+@pytest.mark.parametrize('text, rate', [('4.2718', 4.2718), ('4,2718', 4.2718), (' 1 000,5 ', 1000.5)])
+def test_parse_rate(text, rate):
+    assert fx.parse_rate(text) == rate
+
+
+@pytest.mark.parametrize('text', ['0', '-4,2', 'abc', 'inf'])
+def test_invalid_rates_raise(text):
+    with pytest.raises(ValueError):
+        fx.parse_rate(text)
+
+
+def test_parse_currency():
+    assert fx.parse_currency(' eur ') == 'EUR'
+    for text in ('EURO', 'E1R', ''):
+        with pytest.raises(ValueError):
+            fx.parse_currency(text)
+
+
+def test_import_rates_to_the_main_currency(ledger, tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text('Data;Waluta;Kurs\n02.01.2025;EUR;4,2718\n03.01.2025;PLN;1\n03.01.2025;USD;-4\n'
+                    '03.01.2025;usd;4,10\n', encoding='utf-8')
+
+    result = fx.import_rates(str(path))
+
+    assert result['imported'] == 2 and result['invalid'] == 2
+    assert [line for line, _message in result['errors']] == [3, 4]
+    rates = [tuple(row) for row in db.get_fx_rates('EUR')] + [tuple(row) for row in db.get_fx_rates(to_currency='USD')]
+    assert [(day, source, target) for day, source, target, _rate in rates] == [
+        ('2025-01-02', 'EUR', 'PLN'), ('2025-01-03', 'PLN', 'USD')]
+    assert rates[1][3] == pytest.approx(1 / 4.1)
+
+
+def test_a_file_without_rate_columns_is_refused(ledger, tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text('data;opis;kwota\n', encoding='utf-8')
+
+    with pytest.raises(fx.RatesFormatError):
+        fx.import_rates(str(path))
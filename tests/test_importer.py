@@ -0,0 +1,183 @@
+import io
+import pytest
+from app import importer
+from app.database import database as db
+
+MT940 = """:20:STATEMENT
+:25:PL61109010140000071219812874
+:28C:1/1
+:60F:C250301PLN1000,00
+:61:2503030303D45,20NTRFNONREF
+:86:020~00PRZELEW~20Opłata za~21 prąd~32ENERGA SA
+:61:2503040304C3000,00NTRFNONREF
+:86:Wynagrodzenie marzec
+:61:2503050305D12,00NTRFNONREF
+:86:Bilet
+komunikacji miejskiej
+:62F:C250305PLN2942,80
+-
+"""
+
+OFX = """OFXHEADER:100
+DATA:OFXSGML
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>
+<BANKACCTFROM><ACCTID>12345</BANKACCTFROM>
+<BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250306120000<TRNAMT>-19.99<NAME>Netflix<MEMO>Subskrypcja &amp; opłata</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250307<TRNAMT>100.00<NAME>Zwrot</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+@pytest.mark.parametrize('text, cents', [
+    ('12,50', 1250),
+    ('-1 234,56 zł', -123456),
+    ('1,234.5', 123450),
+    ('(7.00)', -700),
+    ('15-', -1500),
+    ('+3', 300),
+    ('-45.2', -4520),
+    ('1,234', 123400),
+])
+def test_parse_amount(text, cents):
+    assert importer.parse_amount(text) == cents
+
+
+@pytest.mark.parametrize('text, dayfirst, iso', [
+    ('2025-03-01', True, '2025-03-01'),
+    ('01.03.2025', True, '2025-03-01'),
+    ('03/01/2025', False, '2025-03-01'),
+    ('20250301120000', True, '2025-03-01'),
+])
+def test_parse_date(text, dayfirst, iso):
+    assert importer.parse_date(text, dayfirst) == iso
+
+
+def test_invalid_values_raise():
+    with pytest.raises(ValueError):
+        importer.parse_amount('dwanaście')
+    with pytest.raises(ValueError):
+        importer.parse_date('31.02.2025')
+
+
+def test_parse_csv_finds_columns_by_header():
+    stream = io.StringIO('Data operacji;Opis operacji;Kwota;Kategoria;Waluta\n'
+                         '01.03.2025;Biedronka;-12,34;Artykuły spożywcze;PLN\n\n'
+                         '02.03.2025;Orlen;-250,10;;\n')
+
+    records = list(importer.parse_csv(stream))
+
+    assert records == [
+        (2, {'date': '01.03.2025', 'description': 'Biedronka', 'amount': '-12,34',
+             'category': 'Artykuły spożywcze', 'currency': 'PLN'}),
+        (4, {'date': '02.03.2025', 'description': 'Orlen', 'amount': '-250,10', 'category': '', 'currency': ''}),
+    ]
+
+
+def test_parse_csv_uses_the_mapping():
+    stream = io.StringIO('a,b,c\n2025-03-01,Kino,30.00\n')
+
+    records = list(importer.parse_csv(stream, {'date': 0, 'description': 'b', 'amount': 'c'}))
+
+    assert records == [(2, {'date': '2025-03-01', 'description': 'Kino', 'amount': '30.00'})]
+
+
+def test_parse_mt940():
+    records = [record for _line, record in importer.parse_mt940(io.StringIO(MT940))]
+
+    account = 'PL61109010140000071219812874'
+    assert records == [
+        {'date': '2025-03-03', 'amount': '-45,20', 'description': 'Opłata za  prąd ENERGA SA', 'account': account},
+        {'date': '2025-03-04', 'amount': '3000,00', 'description': 'Wynagrodzenie marzec', 'account': account},
+        {'date': '2025-03-05', 'amount': '-12,00', 'description': 'Bilet komunikacji miejskiej', 'account': account},
+    ]
+
+
+def test_parse_ofx():
+    records = [record for _number, record in importer.parse_ofx(io.StringIO(OFX))]
+
+    assert records == [
+        {'date': '20250306120000', 'amount': '-19.99', 'description': 'Netflix Subskrypcja & opłata',
+         'account': '12345'},
+        {'date': '20250307', 'amount': '100.00', 'description': 'Zwrot', 'account': '12345'},
+    ]
+
+
+@pytest.mark.parametrize('name, text, file_format', [
+    ('statement.sta', MT940, 'mt940'),
+    ('statement.txt', MT940, 'mt940'),
+    ('statement', OFX, 'ofx'),
+    ('statement.csv', 'data;opis;kwota\n', 'csv'),
+])
+def test_detect_format(name, text, file_format):
+    assert importer.detect_format(name, text.encode('utf-8')) == file_format
+
+
+def test_statements_import_debits_only(ledger, tmp_path):
+    path = tmp_path / 'statement.sta'
+    path.write_text(MT940, encoding='utf-8')
+
+    result = importer.import_file(str(path))
+
+    assert result['imported'] == 2 and result['skipped'] == 1
+    rows = db.get_db_connection().execute("SELECT date, description, amount FROM transactions ORDER BY date")
+    assert [tuple(row) for row in rows] == [
+        ('2025-03-03', 'Opłata za prąd ENERGA SA', 4520),
+        ('2025-03-05', 'Bilet komunikacji miejskiej', 1200),
+    ]
+
+
+def test_reimport_skips_duplicates(ledger, tmp_path):
+    path = tmp_path / 'history.csv'
+    # Two identical rows are two transactions, not a duplicate
+    path.write_text('data;opis;kwota\n01.03.2025;Kawa;-9,00\n01.03.2025;Kawa;-9,00\n02.03.2025;Kino;-30,00\n',
+                    encoding='utf-8')
+    assert importer.import_file(str(path))['imported'] == 3
+
+    result = importer.import_file(str(path))
+
+    assert result['imported'] == 0 and result['duplicates'] == 3
+    path.write_text('data;opis;kwota\n01.03.2025;Kawa;-9,00\n01.03.2025;  kawa ;-9,00\n01.03.2025;Kawa;-9,00\n',
+                    encoding='utf-8')
+    result = importer.import_file(str(path))
+    assert result['imported'] == 1 and result['duplicates'] == 2
+    assert db.check_monthly_totals() == []
+
+
+def test_fuzzy_check_skips_similar_rows(ledger, tmp_path):
+    db.add_transaction({'date': '2025-03-01', 'description': 'BIEDRONKA 1234 WARSZAWA', 'amount': '12.34',
+                        'category_id': None})
+    path = tmp_path / 'statement.csv'
+    path.write_text('data;opis;kwota\n02.03.2025;Biedronka 1234 Warszawa PL;-12,34\n10.03.2025;Biedronka;-12,34\n',
+                    encoding='utf-8')
+
+    result = importer.import_file(str(path), fuzzy_days=3)
+
+    assert result['imported'] == 1 and result['similar'] == 1
+
+
+def test_invalid_rows_are_counted(ledger, tmp_path):
+    path = tmp_path / 'broken.csv'
+    path.write_text('data;opis;kwota\n01.03.2025;Kawa;abc\n32.03.2025;Kino;-30,00\n02.03.2025;Kino;-30,00\n',
+                    encoding='utf-8')
+
+    result = importer.import_file(str(path))
+
+    assert result['imported'] == 1 and result['invalid'] == 2
+    assert [line for line, _message in result['errors']] == [2, 3]
+
+
+def test_chunks_do_not_change_the_rows(ledger):
+    records = [(2, {'date': '01.03.2025', 'description': 'Kawa', 'amount': '-9,00', 'category': 'Kawa'}),
+               (3, None),
+               (4, {'date': '01.03.2025', 'description': ' kawa', 'amount': '-9,00'}),
+               (5, {'date': '02.03.2025', 'description': 'Kino', 'amount': '30,00'}),
+               (6, {'date': '02.03.2025', 'description': 'Kawa', 'amount': '-9,00', 'category': 'Brak'})]
+
+    whole, chunked = importer.new_result(), importer.new_result()
+    rows = list(importer.normalize_records(records, debits_only=True, result=whole))
+
+    assert list(importer.normalize_records(records, debits_only=True, result=chunked, chunk_size=2)) == rows
+    assert whole == chunked and whole['invalid'] == 1 and whole['skipped'] == 1
+    assert [row[3] for row in rows] == [db.get_category_tree().id_for_name('Kawa'), None, None]
+    assert rows[0][4] != rows[1][4]
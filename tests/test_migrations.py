@@ -0,0 +1,99 @@
+import sqlite3
+import pytest
+from app.database import database as db
+from app.database import migrations
+from app.models.money import Money
+
+V0_ROWS = [
+    ('2024-01-05', 'Biedronka', 12.34, 'Artykuły spożywcze'),
+    ('2024-01-05', 'Biedronka', 12.34, 'Artykuły spożywcze'),
+    ('2024-01-31', 'Orlen', 250.1, 'Paliwo'),
+    ('2024-02-01', 'Czynsz', 1800.0, 'Czynsz'),
+    ('2024-02-14', 'Kwiaciarnia', 60.5, 'Prezenty'),
+    ('2024-02-15', 'Bez kategorii', 0.3, 'Uncategorized'),
+]
+
+
+@pytest.fixture
+def v0_database(baseline):
+    """Points the database module at the shipped database, never migrated, with a few rows."""
+    conn = sqlite3.connect(baseline)
+    with conn:
+        conn.executemany("INSERT INTO transactions (date, description, amount, category) VALUES (?, ?, ?, ?)",
+                         V0_ROWS)
+        conn.execute("INSERT INTO budgets (amount, month, year) VALUES (2500.5, 1, 1999)")
+    conn.close()
+    db.configure_database(path=baseline)
+    yield baseline
+    db.configure_database(path=db.DB_PATH)
+
+
+def _version():
+    return migrations.get_schema_version(db.get_db_connection().cursor())
+
+
+def _indexes():
+    cursor = db.get_db_connection().execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")
+    return {row[0] for row in cursor}
+
+
+def test_baseline_is_migrated_to_the_latest_version(v0_database):
+    assert _version() == 0
+
+    db.initialize_database()
+
+    conn = db.get_db_connection()
+    assert _version() == migrations.LATEST_VERSION
+    assert {'idx_transactions_date_id', 'idx_transactions_month'} <= _indexes()
+    rows = conn.execute('''
+        SELECT t.date, t.description, t.amount, c.name, t.currency FROM transactions t
+        LEFT JOIN categories c ON c.id = t.category_id ORDER BY t.id
+    ''').fetchall()
+    assert [tuple(row) for row in rows] == [
+        ('2024-01-05', 'Biedronka', 1234, 'Artykuły spożywcze', None),
+        ('2024-01-05', 'Biedronka', 1234, 'Artykuły spożywcze', None),
+        ('2024-01-31', 'Orlen', 25010, 'Paliwo', None),
+        ('2024-02-01', 'Czynsz', 180000, 'Czynsz', None),
+        ('2024-02-14', 'Kwiaciarnia', 6050, 'Prezenty', None),
+        ('2024-02-15', 'Bez kategorii', 30, None, None),
+    ]
+    # A free-text category name becomes a top-level category of its own
+    assert conn.execute("SELECT parent_id FROM categories WHERE name = 'Prezenty'").fetchone()[0] is None
+    assert conn.execute("SELECT amount FROM budgets WHERE year = 1999").fetchone()[0] == 250050
+    fingerprints = [row[0] for row in conn.execute("SELECT fingerprint FROM transactions")]
+    assert None not in fingerprints and len(set(fingerprints)) == len(V0_ROWS)
+    assert db.check_monthly_totals() == []
+    assert conn.execute("SELECT SUM(total_cents), SUM(count) FROM daily_totals").fetchone()[:] == (213558, 6)
+    assert conn.execute("SELECT COUNT(*) FROM categorization_rules").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM recurring_rules").fetchone()[0] == 0
+    assert db.get_month_expenses(1, 2024) == Money(27478)
+    assert len(list(db.iter_transactions('biedronka'))) == 2
+
+
+def test_new_database_gets_the_latest_version(tmp_path):
+    db.configure_database(path=str(tmp_path / 'new.db'))
+    try:
+        db.initialize_database()
+
+        assert _version() == migrations.LATEST_VERSION
+    finally:
+        db.configure_database(path=db.DB_PATH)
+
+
+def test_initialization_is_idempotent(ledger):
+    db.initialize_database()
+
+    assert _version() == migrations.LATEST_VERSION
+
+
+def test_failing_step_leaves_the_database_untouched(v0_database, monkeypatch):
+    def broken(cursor):
+        raise sqlite3.OperationalError("broken step")
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(99, "Broken", broken)])
+
+    with pytest.raises(sqlite3.OperationalError):
+        db.initialize_database()
+
+    assert _version() == 0
+    assert _indexes() == set()
@@ -0,0 +1,57 @@
+from decimal import Decimal
+import pytest
+from app.models.money import Money
+
+
+@pytest.mark.parametrize('value, cents', [
+    ('12.34', 1234),
+    ('0.1', 10),
+    (0.1 + 0.2, 30),
+    ('2.675', 268),
+    ('-2.675', -268),
+    (Decimal('1.005'), 101),
+    (7, 700),
+])
+def test_from_value_rounds_half_up_to_cents(value, cents):
+    assert Money.from_value(value).cents == cents
+
+
+def test_from_value_keeps_money():
+    money = Money(5)
+    assert Money.from_value(money) is money
+
+
+@pytest.mark.parametrize('cents, text', [
+    (0, '0.00'), (5, '0.05'), (123456, '1234.56'), (-5, '-0.05'), (-1234, '-12.34'),
+])
+def test_str_formats_without_float_rounding(cents, text):
+    assert str(Money(cents)) == text
+
+
+def test_format_spec_goes_through_decimal():
+    assert f"{Money(123456):,.2f}" == '1,234.56'
+    assert f"{Money(250):.0f}" == '2'
+    assert f"{Money(250)}" == '2.50'
+
+
+def test_sums_do_not_drift():
+    assert sum([Money.from_value('0.10')] * 1000) == Money(10000)
+    assert sum([], Money()) == Money(0)
+
+
+def test_arithmetic_and_comparisons():
+    assert Money(150) - Money(50) == Money(100)
+    assert Money(150) * 2 == 2 * Money(150) == Money(300)
+    assert -Money(150) == Money(-150) and abs(Money(-150)) == Money(150)
+    assert Money(1) < Money(2) <= Money(2) and Money(3) > Money(2) >= Money(2)
+    assert not Money(0) and Money(1)
+    assert float(Money(1250)) == 12.5 and int(Money(1250)) == 1250
+    assert len({Money(5), Money(5)}) == 1
+
+
+def test_mixing_with_floats_is_refused():
+    assert Money(100) != 1.0
+    with pytest.raises(TypeError):
+        Money(100) + 1.5
+    with pytest.raises(TypeError):
+        Money(100) * 1.5
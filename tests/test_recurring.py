@@ -0,0 +1,79 @@
+from datetime import date
+from app import recurring
+from app.database import database as db
+
+
+def _rule(frequency, start_date, **columns):
+    rule = {'id': 1, 'frequency': frequency, 'start_date': start_date, 'end_date': None, 'interval': 1,
+            'day': None}
+    rule.update(columns)
+    return rule
+
+
+def _dates(rule, since=None, count=4):
+    dates = []
+    for occurrence in recurring.occurrences(rule, since):
+        dates.append(occurrence.isoformat())
+        if len(dates) == count:
+            break
+    return dates
+
+
+def test_monthly_occurrences_keep_their_day():
+    rule = _rule('monthly', '2025-01-31')
+
+    assert _dates(rule) == ['2025-01-31', '2025-02-28', '2025-03-31', '2025-04-30']
+    assert _dates(rule, date(2025, 3, 1), 2) == ['2025-03-31', '2025-04-30']
+
+
+def test_weekly_and_interval_occurrences():
+    assert _dates(_rule('weekly', '2025-01-06', interval=2), date(2025, 1, 7), 2) == ['2025-01-20', '2025-02-03']
+    assert _dates(_rule('monthly', '2025-01-10', interval=3, end_date='2025-08-01')) == ['2025-01-10', '2025-04-10',
+                                                                                          '2025-07-10']
+
+
+def test_last_business_day_skips_weekends():
+    assert _dates(_rule('last_business_day', '2025-05-01'), count=3) == ['2025-05-30', '2025-06-30', '2025-07-31']
+
+
+def test_materialize_due_posts_each_occurrence_once(ledger):
+    rent = db.get_category_tree().id_for_name('Czynsz')
+    rule_id = db.add_recurring_rule('Czynsz', '1800.00', 'monthly', '2025-01-10', category_id=rent)
+    db.add_recurring_rule('Siłownia', '120.00', 'weekly', '2025-03-01', end_date='2025-03-10')
+
+    assert recurring.materialize_due(date(2025, 3, 15)) == 5
+    assert recurring.materialize_due(date(2025, 3, 15)) == 0
+    assert recurring.materialize_due(date(2025, 4, 10)) == 1
+
+    rows = db.get_db_connection().execute(
+        "SELECT date, description, amount, category_id, fingerprint FROM transactions ORDER BY date, id")
+    assert [tuple(row[:4]) for row in rows] == [
+        ('2025-01-10', 'Czynsz', 180000, rent),
+        ('2025-02-10', 'Czynsz', 180000, rent),
+        ('2025-03-01', 'Siłownia', 12000, None),
+        ('2025-03-08', 'Siłownia', 12000, None),
+        ('2025-03-10', 'Czynsz', 180000, rent),
+        ('2025-04-10', 'Czynsz', 180000, rent),
+    ]
+    rules = {rule['id']: rule for rule in db.get_recurring_rules()}
+    assert rules[rule_id]['next_date'] == '2025-05-10'
+    assert [rule['next_date'] for rule in rules.values() if rule['id'] != rule_id] == [None]
+    assert db.check_monthly_totals() == []
+
+
+def test_moved_back_mark_does_not_post_twice(ledger):
+    rule_id = db.add_recurring_rule('Netflix', '43.00', 'monthly', '2025-01-05')
+    recurring.materialize_due(date(2025, 2, 10))
+
+    db.set_recurring_next_dates([('2025-01-01', rule_id)])
+
+    assert recurring.materialize_due(date(2025, 2, 10)) == 0
+
+
+def test_projected_writes_nothing(ledger):
+    db.add_recurring_rule('Czynsz', '1800.00', 'monthly', '2025-01-10')
+
+    dates = [occurrence.isoformat() for occurrence, _rule in recurring.projected(date(2025, 3, 31))]
+
+    assert dates == ['2025-01-10', '2025-02-10', '2025-03-10']
+    assert db.get_db_connection().execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 0
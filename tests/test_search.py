@@ -0,0 +1,76 @@
+import pytest
+from app.database import database as db
+
+DESCRIPTIONS = ['Kawiarnia Café Nero', 'Kawa ziarnista', 'Bilet kolejowy PKP', 'Księgarnia', 'Kino Café']
+
+
+@pytest.fixture
+def descriptions(ledger):
+    for description in DESCRIPTIONS:
+        db.add_transaction({'date': '2025-01-01', 'description': description, 'amount': '1.00',
+                            'category_id': db.get_category_tree().id_for_name('Kawa')})
+    return DESCRIPTIONS
+
+
+def _found(text):
+    return sorted(row['description'] for row in db.iter_transactions(text))
+
+
+@pytest.mark.parametrize('text', ['kaw', 'CAFE', 'café ner', 'ksie', 'pkp bil', 'kino cafe', 'xyz', '  '])
+def test_sql_filter_matches_the_python_check(descriptions, text):
+    expected = sorted(description for description in descriptions if db.description_matches(description, text))
+
+    assert _found(text) == expected
+
+
+
+@pytest.mark.parametrize('text', ['straße', 'STRASSE', 'stras', 'ﬁ', 'fi', '½', '1',
+                                  'łódź', 'lodz', 'Ōdz', 'istanbul'])
+def test_python_check_folds_text_like_the_tokenizer(ledger, text):
+    descriptions = ['Straße 5', 'ﬁlm', '½ litra', 'Łódź Fabryczna', 'Strasse 7', 'İstanbul']
+    for description in descriptions:
+        db.add_transaction({'date': '2025-01-01', 'description': description, 'amount': '1.00',
+                            'category_id': None})
+    matches = db.description_matcher(text)
+
+    assert _found(text) == sorted(description for description in descriptions if matches(description))
+
+def test_every_word_must_match_as_a_prefix(descriptions):
+    assert _found('kaw') == ['Kawa ziarnista', 'Kawiarnia Café Nero']
+    assert _found('cafe kaw') == ['Kawiarnia Café Nero']
+    assert _found('arnia') == []
+
+
+def test_index_follows_edits(descriptions):
+    transaction_id = db.add_transaction({'date': '2025-01-02', 'description': 'Apteka', 'amount': '5.00',
+                                         'category_id': db.get_category_tree().id_for_name('Apteka')})
+    assert _found('apte') == ['Apteka']
+
+    db.update_transaction(transaction_id, {'date': '2025-01-02', 'description': 'Drogeria', 'amount': '5.00',
+                                           'category_id': db.get_category_tree().id_for_name('Apteka')})
+    assert _found('apte') == [] and _found('drog') == ['Drogeria']
+
+    db.delete_transaction(transaction_id)
+    assert _found('drog') == []
+
+
+def test_search_ranks_closer_matches_first(descriptions):
+    results = [row['description'] for row in db.search_transactions('cafe')]
+
+    assert results[0] == 'Kino Café'
+    assert sorted(results) == ['Kawiarnia Café Nero', 'Kino Café']
+
+
+@pytest.mark.parametrize('old_text, old_categories, new_text, new_categories, narrows', [
+    ('kaw', [], 'kawa', [], True),
+    ('kawa', [], 'kawa star', [], True),
+    ('', [], 'kawa', [], True),
+    ('kawa', [], 'kaw', [], False),
+    ('kawa', [], 'herbata', [], False),
+    ('', [1, 2], '', [2], True),
+    ('', [1, 2], '', [2, 3], False),
+    ('', [1], '', [], False),
+    ('', [], '', [1], True),
+])
+def test_filters_narrow(old_text, old_categories, new_text, new_categories, narrows):
+    assert db.filters_narrow(old_text, old_categories, new_text, new_categories) == narrows
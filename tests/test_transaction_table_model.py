@@ -0,0 +1,160 @@
+import pytest
+from PySide6.QtCore import QCoreApplication, Qt
+from app.database import database as db
+from app.models.transaction_table_model import COLUMN_AMOUNT, COLUMN_DESCRIPTION, TransactionTableModel
+
+DAYS = ['2025-01-01', '2025-01-02', '2025-01-02', '2025-01-02', '2025-01-03', '2025-01-05', '2025-01-05']
+
+
+@pytest.fixture
+def model(ledger):
+    QCoreApplication.instance() or QCoreApplication([])
+    for number, day in enumerate(DAYS, 1):
+        db.add_transaction({'date': day, 'description': f"Zakup {number}", 'amount': f"{number}.50",
+                            'category_id': db.get_category_tree().id_for_name('Kawa')})
+    return TransactionTableModel(page_size=3)
+
+
+def _descriptions(model):
+    return [model.data(model.index(row, COLUMN_DESCRIPTION)) for row in range(model.rowCount())]
+
+
+def _load_all(model):
+    while model.canFetchMore():
+        model.fetchMore()
+
+
+def test_rows_are_fetched_page_by_page(model):
+    assert model.rowCount() == 0
+
+    model.fetchMore()
+    assert model.rowCount() == 3 and model.canFetchMore()
+    _load_all(model)
+
+    assert model.rowCount() == len(DAYS)
+    # Newest first; rows of the same day in reverse insertion order
+    assert _descriptions(model) == ['Zakup 7', 'Zakup 6', 'Zakup 5', 'Zakup 4', 'Zakup 3', 'Zakup 2', 'Zakup 1']
+
+
+def test_amounts_are_formatted_and_right_aligned(model):
+    _load_all(model)
+    index = model.index(0, COLUMN_AMOUNT)
+
+    assert model.data(index) == '7.50'
+    assert model.data(index, Qt.TextAlignmentRole) & Qt.AlignRight
+
+
+def test_pages_continue_after_the_last_key(model):
+    rows = []
+    after = None
+    while True:
+        page = db.get_transactions_page(after, 2)
+        if not page:
+            break
+        rows.extend(page)
+        after = (page[-1]['date'], page[-1]['id'])
+
+    assert [row['id'] for row in rows] == [row['id'] for row in db.iter_transactions()]
+    assert len(rows) == len(DAYS)
+
+
+def test_added_rows_are_inserted_at_their_position(model):
+    _load_all(model)
+
+    new_id = db.add_transaction({'date': '2025-01-02', 'description': 'Nowy', 'amount': '1.00',
+                                 'category_id': db.get_category_tree().id_for_name('Kawa')})
+    model.insert_transaction(db.get_transaction(new_id))
+
+    assert _descriptions(model)[3:6] == ['Nowy', 'Zakup 4', 'Zakup 3']
+    assert model.row_of(new_id) == 3
+
+
+def test_rows_beyond_the_loaded_window_are_left_for_fetch_more(model):
+    model.fetchMore()
+
+    old_id = db.add_transaction({'date': '2024-12-31', 'description': 'Stary', 'amount': '1.00',
+                                 'category_id': db.get_category_tree().id_for_name('Kawa')})
+    model.insert_transaction(db.get_transaction(old_id))
+    assert model.row_of(old_id) == -1
+
+    _load_all(model)
+    assert _descriptions(model)[-1] == 'Stary'
+
+
+def test_edited_rows_are_updated_or_moved(model):
+    _load_all(model)
+    changed = []
+    model.dataChanged.connect(lambda first, last: changed.append(first.row()))
+    transaction_id = db.get_transactions_page(None, 1)[0]['id']
+
+    db.update_transaction(transaction_id, {'date': '2025-01-05', 'description': 'Zmieniony', 'amount': '2.00',
+                                           'category_id': db.get_category_tree().id_for_name('Kawa')})
+    model.update_transaction(db.get_transaction(transaction_id))
+    assert changed == [0] and _descriptions(model)[0] == 'Zmieniony'
+
+    db.update_transaction(transaction_id, {'date': '2025-01-01', 'description': 'Przeniesiony', 'amount': '2.00',
+                                           'category_id': db.get_category_tree().id_for_name('Kawa')})
+    model.update_transaction(db.get_transaction(transaction_id))
+    assert _descriptions(model)[-2:] == ['Przeniesiony', 'Zakup 1']
+
+
+def test_deleted_rows_are_removed(model):
+    _load_all(model)
+    transaction_id = model.transaction_at(2)['id']
+
+    model.remove_transaction(db.delete_transaction(transaction_id))
+
+    assert model.rowCount() == len(DAYS) - 1 and model.row_of(transaction_id) == -1
+
+
+def test_filters_are_applied_to_pages_and_new_rows(model):
+    model.set_filters('zakup 1', [])
+    assert _descriptions(model) == ['Zakup 1']
+
+    other_id = db.add_transaction({'date': '2025-01-06', 'description': 'Kino', 'amount': '1.00',
+                                   'category_id': db.get_category_tree().id_for_name('Kino')})
+    model.insert_transaction(db.get_transaction(other_id))
+    assert _descriptions(model) == ['Zakup 1']
+
+    model.set_filters('', [db.get_category_tree().id_for_name('Kino')])
+    assert _descriptions(model) == ['Kino']
+
+
+def _count_page_queries(monkeypatch):
+    queries = []
+    read_page = db.get_transactions_page
+    monkeypatch.setattr(db, 'get_transactions_page', lambda *args: queries.append(args) or read_page(*args))
+    return queries
+
+
+def test_narrowing_filters_the_loaded_rows_without_a_query(model, monkeypatch):
+    model.set_filters('zak', [])
+    _load_all(model)
+    queries = _count_page_queries(monkeypatch)
+
+    model.set_filters('zakup 1', [])
+
+    assert _descriptions(model) == ['Zakup 1']
+    assert queries == []
+
+
+def test_narrowing_resumes_after_the_previous_result_set(model, monkeypatch):
+    model.set_filters('zak', [])
+    assert _descriptions(model) == ['Zakup 7', 'Zakup 6', 'Zakup 5']
+    last = model.transaction_at(2)
+    queries = _count_page_queries(monkeypatch)
+
+    model.set_filters('zakup 2', [])
+
+    assert _descriptions(model) == ['Zakup 2']
+    assert [after for after, *_rest in queries] == [(last['date'], last['id'])]
+
+
+def test_widening_reloads(model, monkeypatch):
+    model.set_filters('zakup 1', [])
+    queries = _count_page_queries(monkeypatch)
+
+    model.set_filters('zakup', [])
+
+    assert _descriptions(model) == ['Zakup 7', 'Zakup 6', 'Zakup 5']
+    assert [after for after, *_rest in queries] == [None]